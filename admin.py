@@ -1,7 +1,24 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, Response, stream_with_context, jsonify
 from flask_login import login_required, current_user
 from app import db
-from models import User, Store, Product, Order, Payment
+from datetime import datetime
+from models import User, Store, Product, Order, OrderItem, Payment, OrderArchive, OrderItemArchive, PaymentArchive
+from models import OrderRollup, ProductSalesRollup, PaymentRollup
+from money import from_minor
+from rates import to_default_currency
+from exports import parse_export_filters, stream_order_export, stream_payment_export
+from principal import invalidate_principal
+from pagination import keyset_paginate, approximate_count
+from querycount import query_budget
+from routing import read_replica
+from templating import render_stats
+from fulfillment import transition_orders, bulk_criteria, flash_transition, TransitionError, REVENUE_STATUSES
+from gateway_archive import load_payload
+from retention import get_order_or_404, get_payment_or_404, archived_order_stats, month_of, month_label
+from retention import ARCHIVABLE_STATUSES, newest_archived
+from collections import Counter
+from sqlalchemy import union_all
+from sqlalchemy.orm import joinedload, selectinload
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -19,17 +36,25 @@ def admin_required(f):
 @admin_bp.route('/admin')
 @login_required
 @admin_required
+@read_replica
+@query_budget(9)
 def index():
     """Admin dashboard"""
     total_users = User.query.count()
     total_stores = Store.query.count()
     total_products = Product.query.count()
-    total_orders = Order.query.count()
-    total_revenue = db.session.query(db.func.sum(Order.total)).filter(Order.status == 'paid').scalar() or 0
+    # Hot orders plus the rollup of archived ones
+    archived_orders, revenue = archived_order_stats(db)
+    total_orders = Order.query.count() + archived_orders
+    revenue = Counter(revenue)
+    revenue.update(dict(db.session.query(Order.currency, db.func.sum(Order.total_minor))
+                        .filter(Order.status.in_(REVENUE_STATUSES)).group_by(Order.currency).all()))
+    total_revenue = from_minor(to_default_currency(revenue))
     
     # Recent activity
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    recent_orders = Order.query.options(joinedload(Order.store), joinedload(Order.customer)) \
+        .order_by(Order.created_at.desc()).limit(5).all()
     
     return render_template('admin/index.html',
                          total_users=total_users,
@@ -43,10 +68,13 @@ def index():
 @admin_bp.route('/admin/users')
 @login_required
 @admin_required
+@read_replica
+@query_budget(2)
 def users():
     """Manage users"""
-    page = request.args.get('page', 1, type=int)
-    users = User.query.paginate(page=page, per_page=20, error_out=False)
+    users = keyset_paginate(User.query, User,
+                            after=request.args.get('after'), before=request.args.get('before'),
+                            total=approximate_count(User))
     return render_template('admin/users.html', users=users)
 
 @admin_bp.route('/admin/users/<int:user_id>/toggle-status', methods=['POST'])
@@ -57,6 +85,7 @@ def toggle_user_status(user_id):
     user = User.query.get_or_404(user_id)
     user.is_active = not user.is_active
     db.session.commit()
+    invalidate_principal(user.id)
     
     status = 'activated' if user.is_active else 'deactivated'
     flash(f'User {user.username} has been {status}.', 'success')
@@ -70,16 +99,20 @@ def make_admin(user_id):
     user = User.query.get_or_404(user_id)
     user.is_admin = True
     db.session.commit()
+    invalidate_principal(user.id)
     flash(f'User {user.username} is now an admin.', 'success')
     return redirect(url_for('admin.users'))
 
 @admin_bp.route('/admin/stores')
 @login_required
 @admin_required
+@read_replica
+@query_budget(2)
 def stores():
     """Manage stores"""
-    page = request.args.get('page', 1, type=int)
-    stores = Store.query.paginate(page=page, per_page=20, error_out=False)
+    stores = keyset_paginate(Store.query.options(joinedload(Store.owner)), Store,
+                             after=request.args.get('after'), before=request.args.get('before'),
+                             total=approximate_count(Store))
     return render_template('admin/stores.html', stores=stores)
 
 @admin_bp.route('/admin/stores/<int:store_id>/toggle-status', methods=['POST'])
@@ -98,24 +131,61 @@ def toggle_store_status(store_id):
 @admin_bp.route('/admin/orders')
 @login_required
 @admin_required
+@read_replica
+@query_budget(7)
 def orders():
-    """Manage orders"""
-    page = request.args.get('page', 1, type=int)
+    """Manage orders, archived ones included"""
     status_filter = request.args.get('status', '')
     
-    query = Order.query
+    query = Order.query.options(joinedload(Order.store), joinedload(Order.customer),
+                                selectinload(Order.payments))
+    archive_query = OrderArchive.query.options(joinedload(OrderArchive.store), joinedload(OrderArchive.customer),
+                                               selectinload(OrderArchive.payments))
     if status_filter:
         query = query.filter(Order.status == status_filter)
+        archive_query = archive_query.filter(OrderArchive.status == status_filter)
+    # Only finished orders are archived
+    archive = None
+    if status_filter in ('', *ARCHIVABLE_STATUSES):
+        archive = (archive_query, OrderArchive, newest_archived(db, OrderArchive))
     
-    orders = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=20, error_out=False)
+    # The approximate count covers the whole table, so only show it unfiltered
+    orders = keyset_paginate(query, Order,
+                             after=request.args.get('after'), before=request.args.get('before'),
+                             total=None if status_filter else approximate_count(Order) + approximate_count(OrderArchive),
+                             archive=archive)
     return render_template('admin/orders.html', orders=orders, status_filter=status_filter)
 
+def csv_download(chunks, name):
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.csv"
+    return Response(stream_with_context(chunks), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@admin_bp.route('/admin/orders/export.csv')
+@login_required
+@admin_required
+@read_replica
+def export_orders():
+    """Stream all orders matching the filters as CSV"""
+    return csv_download(stream_order_export(parse_export_filters(request.args)), 'orders')
+
 @admin_bp.route('/admin/orders/<int:order_id>')
 @login_required
 @admin_required
+@query_budget(4)
 def order_detail(order_id):
-    """Order detail view"""
-    order = Order.query.get_or_404(order_id)
+    """Order detail view, for live and archived orders"""
+    order = get_order_or_404(order_id, options=[
+        joinedload(Order.store),
+        joinedload(Order.customer),
+        selectinload(Order.items).joinedload(OrderItem.product),
+        selectinload(Order.payments)
+    ], archive_options=[
+        joinedload(OrderArchive.store),
+        joinedload(OrderArchive.customer),
+        selectinload(OrderArchive.items).joinedload(OrderItemArchive.product),
+        selectinload(OrderArchive.payments)
+    ])
     return render_template('admin/order_detail.html', order=order)
 
 @admin_bp.route('/admin/orders/<int:order_id>/update-status', methods=['POST'])
@@ -124,50 +194,121 @@ def order_detail(order_id):
 def update_order_status(order_id):
     """Update order status"""
     order = Order.query.get_or_404(order_id)
-    new_status = request.form.get('status')
+    old_status, new_status = order.status, request.form.get('status')
     
-    if new_status in ['pending', 'paid', 'shipped', 'delivered', 'cancelled']:
-        order.status = new_status
-        db.session.commit()
-        flash(f'Order {order.order_number} status updated to {new_status}.', 'success')
+    try:
+        result = transition_orders(db, [Order.id == order_id], new_status, source='admin')
+    except TransitionError as e:
+        flash(str(e), 'error')
     else:
-        flash('Invalid status.', 'error')
+        if result.updated:
+            flash(f'Order {order.order_number} status updated to {new_status}.', 'success')
+        else:
+            flash(f'Order {order.order_number} cannot go from {old_status} to {new_status}.', 'error')
     
     return redirect(url_for('admin.order_detail', order_id=order_id))
 
+@admin_bp.route('/admin/orders/bulk-status', methods=['POST'])
+@login_required
+@admin_required
+def bulk_update_order_status():
+    """Move the selected (or all filtered) orders to a new status"""
+    criteria = bulk_criteria(request.form)
+    if criteria is None:
+        flash('No orders selected.', 'error')
+    else:
+        try:
+            flash_transition(transition_orders(db, criteria, request.form.get('status'), source='admin'))
+        except TransitionError as e:
+            flash(str(e), 'error')
+    
+    return redirect(url_for('admin.orders', status=request.form.get('status_filter') or None))
+
 @admin_bp.route('/admin/payments')
 @login_required
 @admin_required
+@read_replica
+@query_budget(5)
 def payments():
-    """View payment records"""
-    page = request.args.get('page', 1, type=int)
-    payments = Payment.query.order_by(Payment.created_at.desc()).paginate(page=page, per_page=20, error_out=False)
+    """View payment records, archived ones included"""
+    archive = (PaymentArchive.query.options(joinedload(PaymentArchive.order)), PaymentArchive,
+               newest_archived(db, PaymentArchive))
+    payments = keyset_paginate(Payment.query.options(joinedload(Payment.order)), Payment,
+                               after=request.args.get('after'), before=request.args.get('before'),
+                               total=approximate_count(Payment) + approximate_count(PaymentArchive),
+                               archive=archive)
     return render_template('admin/payments.html', payments=payments)
 
+@admin_bp.route('/admin/payments/<int:payment_id>')
+@login_required
+@admin_required
+def payment_detail(payment_id):
+    """Payment detail view, including the archived gateway response"""
+    payment = get_payment_or_404(payment_id, options=[joinedload(Payment.order)],
+                                 archive_options=[joinedload(PaymentArchive.order)])
+    return render_template('admin/payment_detail.html', payment=payment,
+                         gateway_response=load_payload(payment))
+
+@admin_bp.route('/admin/payments/export.csv')
+@login_required
+@admin_required
+@read_replica
+def export_payments():
+    """Stream all payments matching the filters as CSV"""
+    return csv_download(stream_payment_export(parse_export_filters(request.args)), 'payments')
+
 @admin_bp.route('/admin/reports')
 @login_required
 @admin_required
+@read_replica
 def reports():
     """Admin reports"""
-    # Revenue by month
-    revenue_by_month = db.session.query(
-        db.func.strftime('%Y-%m', Order.created_at).label('month'),
-        db.func.sum(Order.total).label('revenue')
-    ).filter(Order.status == 'paid').group_by('month').order_by('month').all()
+    # Revenue by month, in the default currency; archived months come from the rollup
+    monthly = {}
+    for month, currency, revenue in db.session.query(
+        month_of(Order.created_at),
+        Order.currency,
+        db.func.sum(Order.total_minor).label('revenue')
+    ).filter(Order.status.in_(REVENUE_STATUSES)).group_by('month', Order.currency).all() + db.session.query(
+        month_of(OrderRollup.day),
+        OrderRollup.currency,
+        db.func.sum(OrderRollup.total_minor).label('revenue')
+    ).filter(OrderRollup.status.in_(REVENUE_STATUSES)).group_by('month', OrderRollup.currency).all():
+        totals = monthly.setdefault(month_label(month), {})
+        totals[currency] = totals.get(currency, 0) + revenue
+    revenue_by_month = [(month, from_minor(to_default_currency(totals)))
+                        for month, totals in sorted(monthly.items())]
     
     # Top selling products
+    sold = union_all(
+        db.select(OrderItem.product_id, OrderItem.quantity),
+        db.select(ProductSalesRollup.product_id, ProductSalesRollup.quantity)
+    ).subquery()
     top_products = db.session.query(
         Product.name,
-        db.func.sum(OrderItem.quantity).label('total_sold')
-    ).join(OrderItem).group_by(Product.id).order_by(db.func.sum(OrderItem.quantity).desc()).limit(10).all()
+        db.func.sum(sold.c.quantity).label('total_sold')
+    ).join(sold, sold.c.product_id == Product.id).group_by(Product.id) \
+        .order_by(db.func.sum(sold.c.quantity).desc()).limit(10).all()
     
     # Payment method distribution
-    payment_methods = db.session.query(
+    payment_methods = Counter(dict(db.session.query(
         Payment.payment_method,
         db.func.count(Payment.id).label('count')
-    ).group_by(Payment.payment_method).all()
+    ).group_by(Payment.payment_method).all()))
+    payment_methods.update(dict(db.session.query(
+        PaymentRollup.payment_method,
+        db.func.sum(PaymentRollup.payments)
+    ).group_by(PaymentRollup.payment_method).all()))
+    payment_methods = sorted(payment_methods.items())
     
     return render_template('admin/reports.html',
                          revenue_by_month=revenue_by_month,
                          top_products=top_products,
-                         payment_methods=payment_methods) 
\ No newline at end of file
+                         payment_methods=payment_methods) 
+
+@admin_bp.route('/admin/metrics/templates')
+@login_required
+@admin_required
+def template_metrics():
+    """Template render timings for the worker serving this request"""
+    return jsonify(render_stats())
@@ -1,24 +1,26 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
 from flask_migrate import Migrate
 from flask_mail import Mail, Message
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import stripe
 import paypalrestsdk
 import requests
 from datetime import datetime, timedelta
 import secrets
+import tempfile
 from dotenv import load_dotenv
+from routing import REPLICA_BIND, init_routing, read_replica
+from models import db
 
 # Load environment variables
 load_dotenv()
 
 # Initialize extensions
-db = SQLAlchemy()
 migrate = Migrate()
 mail = Mail()
 login_manager = LoginManager()
@@ -33,6 +35,61 @@ def create_app():
         app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://', 1)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Optional read replica for storefront, listing and report views
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        if replica_url.startswith('postgres://'):
+            replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: replica_url}
+    app.config['REPLICA_PIN_SECONDS'] = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+    # Proxies in front of the app (1 on Render). X-Forwarded-For and
+    # X-Forwarded-Proto are only trusted, through ProxyFix, when this is set
+    app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+
+    # Stores are also served on <slug>.STORE_BASE_DOMAIN and on their custom domain
+    app.config['STORE_BASE_DOMAIN'] = os.environ.get('STORE_BASE_DOMAIN')
+
+    # Template configuration; auto reload only when debugging
+    app.config['TEMPLATES_AUTO_RELOAD'] = os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true')
+    app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'take-app-jinja'))
+    app.config['PRECOMPILE_TEMPLATES'] = not app.config['TEMPLATES_AUTO_RELOAD']
+    app.config['SLOW_RENDER_MS'] = float(os.environ.get('SLOW_RENDER_MS', 200))
+
+    # Response compression
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    app.config['COMPRESS_BR_LEVEL'] = int(os.environ.get('COMPRESS_BR_LEVEL', 5))
+
+    # Live order notifications (server-sent events), per worker process. Each
+    # open stream holds one of the worker's gthread threads for its lifetime,
+    # so by default a quarter of them may stream and the rest serve pages
+    threads = int(os.environ.get('GUNICORN_THREADS', 16))
+    app.config['SSE_MAX_CONNECTIONS'] = int(os.environ.get('SSE_MAX_CONNECTIONS', threads // 4))
+    if app.config['SSE_MAX_CONNECTIONS'] >= threads:
+        raise RuntimeError(f"SSE_MAX_CONNECTIONS ({app.config['SSE_MAX_CONNECTIONS']}) must be lower than "
+                           f"GUNICORN_THREADS ({threads}), or open streams starve every other request")
+    app.config['SSE_HEARTBEAT_SECONDS'] = int(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+    app.config['SSE_STREAM_SECONDS'] = int(os.environ.get('SSE_STREAM_SECONDS', 300))
+
+    # Per-store catalog snapshots served to the storefront service worker
+    app.config['CATALOG_DIR'] = os.environ.get('CATALOG_DIR', os.path.join(app.instance_path, 'catalog'))
+
+    # Exchange rate feed polled by `python rates.py refresh`; never called from requests
+    app.config['EXCHANGE_RATE_API_URL'] = os.environ.get('EXCHANGE_RATE_API_URL', 'https://open.er-api.com/v6/latest/USD')
+
+    # Products without their own threshold raise a low-stock alert at this level
+    app.config['LOW_STOCK_THRESHOLD'] = int(os.environ.get('LOW_STOCK_THRESHOLD', 5))
+
+    # Finished orders older than this move to the archive tables (`python retention.py archive`)
+    app.config['RETENTION_DAYS'] = int(os.environ.get('RETENTION_DAYS', 365))
+
+    # Local store numbers (0xx...) are sent to WhatsApp with this country code
+    app.config['WHATSAPP_COUNTRY_CODE'] = os.environ.get('WHATSAPP_COUNTRY_CODE', '252')
+    # WhatsApp orders the store has not confirmed by then are cancelled and
+    # restocked (`python fulfillment.py expire-whatsapp`)
+    app.config['WHATSAPP_ORDER_TTL_HOURS'] = int(os.environ.get('WHATSAPP_ORDER_TTL_HOURS', 48))
+
     # Mail configuration
     app.config['MAIL_SERVER'] = 'smtp.gmail.com'
     app.config['MAIL_PORT'] = 587
@@ -43,14 +100,37 @@ def create_app():
     # Payment configuration
     app.config['STRIPE_PUBLIC_KEY'] = os.environ.get('STRIPE_PUBLIC_KEY')
     app.config['STRIPE_SECRET_KEY'] = os.environ.get('STRIPE_SECRET_KEY')
+    app.config['STRIPE_WEBHOOK_SECRET'] = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
     app.config['PAYPAL_CLIENT_ID'] = os.environ.get('PAYPAL_CLIENT_ID')
     app.config['PAYPAL_CLIENT_SECRET'] = os.environ.get('PAYPAL_CLIENT_SECRET')
     app.config['EVC_PLUS_API_KEY'] = os.environ.get('EVC_PLUS_API_KEY')
     app.config['GOLIS_SAAD_API_KEY'] = os.environ.get('GOLIS_SAAD_API_KEY')
     app.config['EDAHAB_API_KEY'] = os.environ.get('EDAHAB_API_KEY')
+    # Raw gateway responses: 'table' (gateway_payload rows) or 'files'
+    app.config['GATEWAY_ARCHIVE'] = os.environ.get('GATEWAY_ARCHIVE', 'table')
+    app.config['GATEWAY_ARCHIVE_DIR'] = os.environ.get('GATEWAY_ARCHIVE_DIR', os.path.join(app.instance_path, 'gateway_archive'))
+    app.config['EVC_PLUS_API_URL'] = os.environ.get('EVC_PLUS_API_URL', 'https://api.evcplus.com')
+    app.config['GOLIS_SAAD_API_URL'] = os.environ.get('GOLIS_SAAD_API_URL', 'https://api.golissaad.com')
+    app.config['EDAHAB_API_URL'] = os.environ.get('EDAHAB_API_URL', 'https://api.edahab.com')
+    # Point the card gateways somewhere else, e.g. fake_gateways.py during load tests
+    app.config['STRIPE_API_BASE'] = os.environ.get('STRIPE_API_BASE')
+    app.config['PAYPAL_API_URL'] = os.environ.get('PAYPAL_API_URL')
+    # Seconds to wait on a gateway before giving up on the request
+    app.config['GATEWAY_TIMEOUT'] = float(os.environ.get('GATEWAY_TIMEOUT', 15))
+
+    if app.config['TRUSTED_PROXIES']:
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
 
     # Initialize extensions with app
     db.init_app(app)
+    init_routing(app, db)
+
+    from quotas import init_quotas
+    init_quotas(db)
+
+    from compression import init_compression
+    init_compression(app)
     migrate.init_app(app, db)
     mail.init_app(app)
     login_manager.init_app(app)
@@ -58,11 +138,17 @@ def create_app():
 
     # Initialize payment gateways
     stripe.api_key = app.config['STRIPE_SECRET_KEY']
-    paypalrestsdk.configure({
+    if app.config['STRIPE_API_BASE']:
+        stripe.api_base = app.config['STRIPE_API_BASE']
+    stripe.default_http_client = stripe.http_client.RequestsClient(timeout=app.config['GATEWAY_TIMEOUT'])
+    paypal_options = {
         "mode": "sandbox",  # Change to "live" for production
         "client_id": app.config['PAYPAL_CLIENT_ID'],
         "client_secret": app.config['PAYPAL_CLIENT_SECRET']
-    })
+    }
+    if app.config['PAYPAL_API_URL']:
+        paypal_options['endpoint'] = app.config['PAYPAL_API_URL']
+    paypalrestsdk.configure(paypal_options)
 
     # Import blueprints
     from auth import auth_bp
@@ -80,10 +166,23 @@ def create_app():
 
     # Import models
     from models import User, Store, Product, Order, OrderItem, Payment
+    from tenants import init_tenants
+    init_tenants(app, db)
+    from catalog import init_catalog
+    init_catalog(app, db)
+    from events import init_events
+    init_events(app, db)
+    from notifications import init_notifications
+    init_notifications(app, db)
+
+    from rates import init_rates
+    init_rates(app)
+
+    from principal import get_principal
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return get_principal(int(user_id))
 
     # Main routes
     @app.route('/')
@@ -99,10 +198,19 @@ def create_app():
         return render_template('contact.html')
 
     @app.route('/stores')
+    @read_replica
     def stores():
         stores = Store.query.filter_by(is_active=True).all()
         return render_template('stores.html', stores=stores)
 
+    # Templates are compiled once all blueprints (and their template folders) exist
+    from templating import init_templating
+    init_templating(app)
+
+    # Needs jinja_env, so it goes after the bytecode cache is configured
+    from assets import init_assets
+    init_assets(app)
+
     # Error handlers
     @app.errorhandler(404)
     def not_found_error(error):
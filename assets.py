@@ -0,0 +1,62 @@
+from flask import Blueprint, current_app, request, send_from_directory, url_for, abort
+import json
+import mimetypes
+import os
+
+assets_bp = Blueprint('assets', __name__)
+
+# Fingerprinted files never change, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Content-Encoding -> file suffix, best first
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+def dist_dir():
+    return os.path.join(current_app.static_folder, 'dist')
+
+
+def load_manifest(app):
+    """Read static/dist/manifest.json written by build_assets.py, if any"""
+    path = os.path.join(app.static_folder, 'dist', 'manifest.json')
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(name):
+    """URL of the fingerprinted build of bundle `name` (e.g. 'app.css')"""
+    fingerprinted = current_app.extensions['asset_manifest'].get(name)
+    if fingerprinted is None:
+        return None
+    return url_for('assets.dist', filename=fingerprinted)
+
+
+@assets_bp.route('/static/dist/<path:filename>')
+def dist(filename):
+    """Serve a built asset, preferring a precompressed variant the client accepts"""
+    if filename.endswith(('.gz', '.br')) or filename == 'manifest.json':
+        abort(404)
+
+    accepted = request.accept_encodings
+    for encoding, suffix in PRECOMPRESSED:
+        if accepted[encoding] and os.path.exists(os.path.join(dist_dir(), filename + suffix)):
+            response = send_from_directory(dist_dir(), filename + suffix,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(dist_dir(), filename)
+
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_assets(app):
+    app.extensions['asset_manifest'] = load_manifest(app)
+    app.register_blueprint(assets_bp)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.jinja_env.globals['assets_built'] = bool(app.extensions['asset_manifest'])
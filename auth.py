@@ -4,11 +4,30 @@ from werkzeug.security import generate_password_hash
 from flask_mail import Message
 from app import db, mail
 from models import User
+from principal import invalidate_principal
+from passwords import HashingBusy
+from ratelimit import RateLimiter, client_ip
 from forms import LoginForm, RegisterForm, ResetPasswordForm, ResetPasswordRequestForm
 import os
 
 auth_bp = Blueprint('auth', __name__)
 
+# Bursts of 10 attempts per IP, refilling one every 6 seconds. Failed
+# passwords for one account from one IP: 5, then one a minute. Keying that
+# on the IP as well means guessing at someone's account from elsewhere
+# cannot lock them out of it.
+login_ip_limiter = RateLimiter(rate=1 / 6, capacity=10)
+login_account_limiter = RateLimiter(rate=1 / 60, capacity=5)
+register_ip_limiter = RateLimiter(rate=1 / 60, capacity=5)
+
+def too_many_attempts(template, form):
+    flash('Too many attempts. Please wait a moment and try again.', 'error')
+    return render_template(template, form=form), 429
+
+def hashing_busy(template, form):
+    flash('We are busy right now. Please try again in a moment.', 'error')
+    return render_template(template, form=form), 503
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -16,14 +35,31 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        account_key = (client_ip(request), form.email.data.lower())
+        if not login_ip_limiter.allow(client_ip(request)) or not login_account_limiter.check(account_key):
+            return too_many_attempts('auth/login.html', form)
+
         user = User.query.filter_by(email=form.email.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except HashingBusy:
+            return hashing_busy('auth/login.html', form)
+
+        if valid:
+            if user.password_needs_rehash():
+                # Upgrade hashes made with older parameters while we have the password
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                except HashingBusy:
+                    pass
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             if not next_page or not next_page.startswith('/'):
                 next_page = url_for('dashboard.index')
             return redirect(next_page)
         else:
+            login_account_limiter.allow(account_key)
             flash('Invalid email or password', 'error')
     
     return render_template('auth/login.html', form=form)
@@ -35,6 +71,9 @@ def register():
     
     form = RegisterForm()
     if form.validate_on_submit():
+        if not register_ip_limiter.allow(client_ip(request)):
+            return too_many_attempts('auth/register.html', form)
+
         # Check if user already exists
         if User.query.filter_by(email=form.email.data).first():
             flash('Email already registered', 'error')
@@ -52,7 +91,10 @@ def register():
             last_name=form.last_name.data,
             phone=form.phone.data
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy:
+            return hashing_busy('auth/register.html', form)
         
         db.session.add(user)
         db.session.commit()
@@ -107,7 +149,10 @@ def reset_password(token):
     
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy:
+            return hashing_busy('auth/reset_password.html', form)
         db.session.commit()
         flash('Your password has been reset.', 'success')
         return redirect(url_for('auth.login'))
@@ -123,11 +168,13 @@ def profile():
 @login_required
 def edit_profile():
     if request.method == 'POST':
-        current_user.first_name = request.form.get('first_name')
-        current_user.last_name = request.form.get('last_name')
-        current_user.phone = request.form.get('phone')
+        user = current_user.get_user()
+        user.first_name = request.form.get('first_name')
+        user.last_name = request.form.get('last_name')
+        user.phone = request.form.get('phone')
         
         db.session.commit()
+        invalidate_principal(user.id)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('auth.profile'))
     
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Static asset build for Take App
+Bundles and minifies the CSS and JS used by base.html, fingerprints the
+bundles, writes gzip/brotli variants next to them and records everything
+in static/dist/manifest.json for assets.asset_url().
+
+    python build_assets.py            # fetch missing vendor files, then build
+    python build_assets.py --offline  # build from what is already on disk
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import urllib.request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+VENDOR_DIR = os.path.join(STATIC_DIR, 'vendor')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0'
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist'
+
+# Files that used to come from CDNs, fetched once at build time
+VENDOR_FILES = {
+    'bootstrap/css/bootstrap.min.css': f'{BOOTSTRAP}/css/bootstrap.min.css',
+    'bootstrap/js/bootstrap.bundle.min.js': f'{BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+}
+for font in ('fa-solid-900', 'fa-regular-400', 'fa-brands-400', 'fa-v4compatibility'):
+    for ext in ('woff2', 'ttf'):
+        VENDOR_FILES[f'fontawesome/webfonts/{font}.{ext}'] = f'{FONT_AWESOME}/webfonts/{font}.{ext}'
+
+# Bundle name -> source files (relative to static/), in load order
+BUNDLES = {
+    'app.css': ['vendor/bootstrap/css/bootstrap.min.css',
+                'vendor/fontawesome/css/all.min.css',
+                'css/style.css'],
+    'app.js': ['vendor/bootstrap/js/bootstrap.bundle.min.js',
+               'js/main.js'],
+}
+
+COMPRESS_MIN_BYTES = 512
+
+
+def fetch_vendor_files():
+    for path, url in VENDOR_FILES.items():
+        target = os.path.join(VENDOR_DIR, path)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        print(f'Fetching {url}')
+        with urllib.request.urlopen(url, timeout=30) as response, open(target, 'wb') as f:
+            shutil.copyfileobj(response, f)
+
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^)\'"]+)\1\s*\)')
+
+
+def rebase_css_urls(css, source_dir):
+    """Point relative url()s at their files from the dist directory"""
+    def rebase(match):
+        url = match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return match.group(0)
+        path, _, suffix = url.partition('?')
+        path, _, fragment = path.partition('#')
+        target = os.path.relpath(os.path.join(source_dir, path), DIST_DIR).replace(os.sep, '/')
+        if suffix:
+            target += '?' + suffix
+        if fragment:
+            target += '#' + fragment
+        return f'url({target})'
+    return CSS_URL.sub(rebase, css)
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    """Conservative minification: drop blank lines, comment-only lines and indentation.
+
+    Lines inside multi-line template literals are left untouched.
+    """
+    out = []
+    in_template = False
+    for line in js.splitlines():
+        if in_template:
+            out.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                out.append(stripped)
+        if line.count('`') % 2:
+            in_template = not in_template
+    return '\n'.join(out)
+
+
+def build_bundle(name, sources):
+    parts = []
+    for source in sources:
+        path = os.path.join(STATIC_DIR, source)
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        if name.endswith('.css'):
+            text = minify_css(rebase_css_urls(text, os.path.dirname(path)))
+        elif not source.endswith('.min.js'):
+            text = minify_js(text)
+        parts.append(text)
+    # A newline plus ';' keeps concatenated scripts from running into each other
+    return ('\n' if name.endswith('.css') else '\n;\n').join(parts).encode('utf-8')
+
+
+def write_variants(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    if len(data) < COMPRESS_MIN_BYTES:
+        return
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def build(offline=False):
+    if not offline:
+        fetch_vendor_files()
+
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        missing = [s for s in sources if not os.path.exists(os.path.join(STATIC_DIR, s))]
+        if missing:
+            raise SystemExit(f'Cannot build {name}, missing: {", ".join(missing)}')
+        data = build_bundle(name, sources)
+        stem, ext = os.path.splitext(name)
+        fingerprinted = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        write_variants(os.path.join(DIST_DIR, fingerprinted), data)
+        manifest[name] = fingerprinted
+        print(f'{name} -> {fingerprinted} ({len(data)} bytes)')
+
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    if brotli is None:
+        print('brotli is not installed; only gzip variants were written')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build fingerprinted static bundles')
+    parser.add_argument('--offline', action='store_true', help='do not download vendor files')
+    build(parser.parse_args().offline)
@@ -0,0 +1,128 @@
+from flask import current_app
+from threading import Lock
+import hashlib
+import json
+import os
+import time
+
+from money import DEFAULT_CURRENCY
+
+# Per-store catalog snapshots for the storefront service worker: a compact
+# JSON of the store and its active products. Snapshots are written to
+# CATALOG_DIR so every worker on the host shares them; a commit touching a
+# store or its products deletes the file and the next request rebuilds it.
+# CATALOG_MAX_AGE bounds how long a snapshot can outlive a missed change.
+CATALOG_MAX_AGE = 60 * 60
+
+# store_id -> (file mtime, etag, body)
+_loaded = {}
+_lock = Lock()
+
+
+def _path(store_id):
+    return os.path.join(current_app.config['CATALOG_DIR'], f'{store_id}.json')
+
+
+def build_snapshot(store):
+    """Serialise store's active products; returns the JSON body as bytes"""
+    from models import Product
+
+    products = Product.query.filter_by(store_id=store.id, is_active=True).order_by(Product.id).all()
+    snapshot = {
+        'store': {
+            'id': store.id,
+            'slug': store.slug,
+            'name': store.name,
+            'phone': store.phone,
+            'logo': store.logo,
+            'currency': DEFAULT_CURRENCY,
+        },
+        # Stock is left out on purpose: it changes with every order and is
+        # checked again when the cart is placed
+        'products': [{
+            'id': p.id,
+            'name': p.name,
+            'description': p.description,
+            'price_minor': p.price_minor,
+            'compare_price_minor': p.compare_price_minor,
+            'image_url': p.image_url,
+            'featured': bool(p.is_featured),
+        } for p in products],
+    }
+    body = json.dumps(snapshot, separators=(',', ':'), sort_keys=True)
+    version = hashlib.sha256(body.encode('utf-8')).hexdigest()[:16]
+    # Version goes last so the hash above covers everything else
+    return (body[:-1] + f',"version":"{version}"}}').encode('utf-8')
+
+
+def _write(path, body):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def get_snapshot(store):
+    """(etag, body) of store's current catalog snapshot, building it if needed"""
+    path = _path(store.id)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        mtime = None
+
+    if mtime is not None and time.time() - mtime < CATALOG_MAX_AGE:
+        with _lock:
+            loaded = _loaded.get(store.id)
+        if loaded and loaded[0] == mtime:
+            return loaded[1], loaded[2]
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except OSError:
+            body = None
+    else:
+        body = None
+
+    if body is None:
+        body = build_snapshot(store)
+        _write(path, body)
+        mtime = os.stat(path).st_mtime
+
+    etag = json.loads(body)['version']
+    with _lock:
+        _loaded[store.id] = (mtime, etag, body)
+    return etag, body
+
+
+def invalidate_catalog(store_id):
+    with _lock:
+        _loaded.pop(store_id, None)
+    try:
+        os.remove(_path(store_id))
+    except FileNotFoundError:
+        pass
+
+
+def init_catalog(app, db):
+    """Drop a store's snapshot whenever a commit changes the store or its products"""
+    from sqlalchemy import event
+    from models import Store, Product
+
+    @event.listens_for(db.session, 'after_flush')
+    def collect_changed_catalogs(session, flush_context):
+        changed = session.info.setdefault('changed_catalogs', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, Product) and obj.store_id is not None:
+                changed.add(obj.store_id)
+            elif isinstance(obj, Store) and obj.id is not None:
+                changed.add(obj.id)
+
+    @event.listens_for(db.session, 'after_commit')
+    def drop_changed_catalogs(session):
+        for store_id in session.info.pop('changed_catalogs', ()):
+            invalidate_catalog(store_id)
+
+    @event.listens_for(db.session, 'after_rollback')
+    def forget_changed_catalogs(session):
+        session.info.pop('changed_catalogs', None)
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from flask import g, request
+from threading import Lock
+import gzip
+import hashlib
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+# Compressed responses carry "<etag>-<encoding>"; clients send that back
+ENCODING_SUFFIX = re.compile(r'-(gzip|br)"')
+
+# Compressed bodies kept per worker, keyed by a hash of the uncompressed
+# body, so a page rendered with the same content is only compressed once
+VARIANT_CACHE_BYTES = 8 * 1024 * 1024
+
+_variants = OrderedDict()
+_variants_size = 0
+_variants_lock = Lock()
+
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding, app):
+    if encoding == 'br':
+        return brotli.compress(data, quality=app.config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(data, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def compressed_variant(data, encoding, app):
+    """Compressed body for data, reusing a cached variant when possible"""
+    global _variants_size
+    key = (hashlib.sha1(data).digest(), encoding)
+    with _variants_lock:
+        cached = _variants.get(key)
+        if cached is not None:
+            _variants.move_to_end(key)
+            return cached
+
+    compressed = _compress(data, encoding, app)
+    with _variants_lock:
+        if key not in _variants:
+            _variants[key] = compressed
+            _variants_size += len(compressed)
+            while _variants_size > VARIANT_CACHE_BYTES and _variants:
+                _, dropped = _variants.popitem(last=False)
+                _variants_size -= len(dropped)
+    return compressed
+
+
+def init_compression(app):
+    """Compress dynamic responses according to the client's Accept-Encoding"""
+
+    @app.before_request
+    def match_uncompressed_etags():
+        # Views (make_conditional, send_file) compare If-None-Match with the
+        # ETag of the uncompressed body, so drop the suffix added below
+        header = request.environ.get('HTTP_IF_NONE_MATCH')
+        match = ENCODING_SUFFIX.search(header) if header else None
+        if match:
+            request.environ['HTTP_IF_NONE_MATCH'] = ENCODING_SUFFIX.sub('"', header)
+            g.etag_encoding = match.group(1)
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code == 304:
+            # Hand back the tag the client holds for its compressed copy
+            etag, weak = response.get_etag()
+            encoding = g.pop('etag_encoding', None)
+            if etag and encoding:
+                response.set_etag(f'{etag}-{encoding}', weak=weak)
+            return response
+
+        if (response.status_code < 200 or response.status_code >= 300
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESS_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(compressed_variant(data, encoding, app))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            # Each encoding is a different representation
+            response.set_etag(f'{etag}-{encoding}', weak=weak)
+        return response
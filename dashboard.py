@@ -1,23 +1,39 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from app import db
 from models import Store, Product, Order
 from forms import StoreForm, ProductForm
+from pagination import keyset_paginate
+from querycount import query_budget
+from slugs import add_with_unique_slug
+from quotas import consume, QuotaExceeded
+from sqlalchemy.orm import joinedload
+from inventory import record_opening_stock
+from fulfillment import transition_orders, bulk_criteria, flash_transition, TransitionError
+from notifications import broker, ensure_listener, events_since, order_stream, TooManyListeners
+from retention import archived_order_stats
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/dashboard')
 @login_required
+@query_budget(5)
 def index():
     stores = Store.query.filter_by(owner_id=current_user.id).all()
-    total_orders = Order.query.join(Store).filter(Store.owner_id == current_user.id).count()
-    total_products = Product.query.join(Store).filter(Store.owner_id == current_user.id).count()
-    recent_orders = Order.query.join(Store).filter(Store.owner_id == current_user.id).order_by(Order.created_at.desc()).limit(5).all()
+    product_counts = dict(db.session.query(Product.store_id, db.func.count(Product.id))
+                          .join(Store).filter(Store.owner_id == current_user.id)
+                          .group_by(Product.store_id).all())
+    archived_orders, _ = archived_order_stats(db, db.select(Store.id).where(Store.owner_id == current_user.id))
+    total_orders = Order.query.join(Store).filter(Store.owner_id == current_user.id).count() + archived_orders
+    recent_orders = Order.query.join(Store).filter(Store.owner_id == current_user.id) \
+        .options(joinedload(Order.store)) \
+        .order_by(Order.created_at.desc()).limit(5).all()
     
     return render_template('dashboard/index.html', 
                          stores=stores, 
+                         product_counts=product_counts,
                          total_orders=total_orders,
-                         total_products=total_products,
+                         total_products=sum(product_counts.values()),
                          recent_orders=recent_orders)
 
 @dashboard_bp.route('/dashboard/stores')
@@ -31,18 +47,8 @@ def stores():
 def new_store():
     form = StoreForm()
     if form.validate_on_submit():
-        slug = form.name.data.lower().replace(' ', '-')
-        slug = ''.join(c for c in slug if c.isalnum() or c == '-')
-        
-        counter = 1
-        original_slug = slug
-        while Store.query.filter_by(slug=slug).first():
-            slug = f"{original_slug}-{counter}"
-            counter += 1
-        
         store = Store(
             name=form.name.data,
-            slug=slug,
             description=form.description.data,
             address=form.address.data,
             phone=form.phone.data,
@@ -52,7 +58,14 @@ def new_store():
             owner_id=current_user.id
         )
         
-        db.session.add(store)
+        try:
+            consume(current_user.id, current_user.subscription_tier, 'stores')
+        except QuotaExceeded as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('dashboard.stores'))
+        
+        add_with_unique_slug(store, form.name.data)
         db.session.commit()
         flash('Store created successfully!', 'success')
         return redirect(url_for('dashboard.stores'))
@@ -83,7 +96,15 @@ def new_product(store_id):
             store_id=store_id
         )
         
+        try:
+            consume(current_user.id, current_user.subscription_tier, 'products')
+        except QuotaExceeded as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('dashboard.products', store_id=store_id))
+        
         db.session.add(product)
+        record_opening_stock(db, product)
         db.session.commit()
         flash('Product created successfully!', 'success')
         return redirect(url_for('dashboard.products', store_id=store_id))
@@ -92,6 +113,65 @@ def new_product(store_id):
 
 @dashboard_bp.route('/dashboard/orders')
 @login_required
+@query_budget(1)
 def orders():
-    orders = Order.query.join(Store).filter(Store.owner_id == current_user.id).order_by(Order.created_at.desc()).all()
-    return render_template('dashboard/orders.html', orders=orders) 
\ No newline at end of file
+    query = Order.query.join(Store).filter(Store.owner_id == current_user.id) \
+        .options(joinedload(Order.store), joinedload(Order.customer))
+    orders = keyset_paginate(query, Order,
+                             after=request.args.get('after'), before=request.args.get('before'),
+                             per_page=50)
+    return render_template('dashboard/orders.html', orders=orders)
+
+@dashboard_bp.route('/dashboard/orders/bulk-status', methods=['POST'])
+@login_required
+def bulk_update_order_status():
+    """Move the selected (or all filtered) orders of the merchant's stores to a new status"""
+    criteria = bulk_criteria(request.form)
+    if criteria is None:
+        flash('No orders selected.', 'error')
+    else:
+        own_stores = db.select(Store.id).where(Store.owner_id == current_user.id)
+        try:
+            flash_transition(transition_orders(db, criteria + [Order.store_id.in_(own_stores)],
+                                               request.form.get('status'), source='merchant'))
+        except TransitionError as e:
+            flash(str(e), 'error')
+    
+    return redirect(url_for('dashboard.orders'))
+
+@dashboard_bp.route('/dashboard/orders/events')
+@login_required
+def order_events():
+    """Server-sent stream of new orders and payments for the merchant's stores"""
+    store_ids = [store_id for (store_id,) in
+                 db.session.query(Store.id).filter_by(owner_id=current_user.id).all()]
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+
+    ensure_listener(current_app, db)
+    try:
+        subscription = broker.subscribe(store_ids, current_app.config['SSE_MAX_CONNECTIONS'])
+    except TooManyListeners:
+        return Response('Too many open streams', status=503, headers={'Retry-After': '30'})
+
+    try:
+        # Subscribed first, so anything committed while the backlog loads is queued too
+        backlog = events_since(store_ids, last_event_id) if last_event_id and store_ids else []
+        # Give the connection back to the pool; the stream itself never queries
+        db.session.remove()
+
+        stream = order_stream(subscription, backlog,
+                              heartbeat=current_app.config['SSE_HEARTBEAT_SECONDS'],
+                              lifetime=current_app.config['SSE_STREAM_SECONDS'])
+        response = Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
+    except BaseException:
+        subscription.close()
+        raise
+    # The server closes the response whether or not the stream was ever read
+    response.call_on_close(subscription.close)
+    return response
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Order event log and in-process event bus for Take App
+Every order creation, order status change and payment is appended to the
+order_event table in the same transaction as the change itself. After the
+transaction commits, the new events are published on `bus` to in-process
+subscribers (cache invalidation, live notifications).
+
+Durable consumers (notifications.merchant_order_emails) read the log from
+their last stored offset instead of re-querying the orders table, so they
+catch up incrementally after downtime:
+    python events.py run            # follow the log with every registered consumer
+    python events.py run --once     # process what is there and exit
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from threading import Lock
+import argparse
+import json
+import logging
+import time
+
+logger = logging.getLogger('events')
+
+ORDER_CREATED = 'order.created'
+ORDER_STATUS_CHANGED = 'order.status_changed'
+PAYMENT_RECORDED = 'payment.recorded'
+PAYMENT_STATUS_CHANGED = 'payment.status_changed'
+
+# Immutable copy of an order_event row handed to subscribers and consumers
+Event = namedtuple('Event', 'id type order_id store_id old_status new_status data created_at')
+
+
+def snapshot(row):
+    return Event(row.id, row.event_type, row.order_id, row.store_id, row.old_status,
+                 row.new_status, json.loads(row.data) if row.data else {}, row.created_at)
+
+
+class EventBus:
+    """Synchronous publish/subscribe within one process"""
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = Lock()
+
+    def subscribe(self, handler, event_types=None):
+        with self._lock:
+            self._subscribers.append((handler, set(event_types) if event_types else None))
+        return handler
+
+    def unsubscribe(self, handler):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s[0] is not handler]
+
+    def publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event in events:
+            for handler, types in subscribers:
+                if types is None or event.type in types:
+                    try:
+                        handler(event)
+                    except Exception:
+                        # A broken subscriber must not break the request that committed
+                        logger.exception('Event subscriber %r failed on %s', handler, event.type)
+
+
+bus = EventBus()
+
+
+def record_event(order, event_type, old_status=None, new_status=None, **data):
+    """Append an event for order to the current transaction"""
+    from app import db
+    from models import OrderEvent
+
+    event = OrderEvent(
+        order=order,
+        store_id=order.store_id,
+        event_type=event_type,
+        old_status=old_status,
+        new_status=new_status,
+        data=json.dumps(data, default=str) if data else None
+    )
+    db.session.add(event)
+    return event
+
+
+def set_order_status(order, new_status, source):
+    """Change order.status and log the transition; no-op if unchanged"""
+    old_status = order.status
+    if old_status == new_status:
+        return None
+    order.status = new_status
+    return record_event(order, ORDER_STATUS_CHANGED, old_status, new_status, source=source)
+
+
+def record_payment(payment, order):
+    from money import minor_exponent
+    return record_event(order, PAYMENT_RECORDED, new_status=payment.status,
+                        method=payment.payment_method, amount_minor=payment.amount_minor,
+                        currency=payment.currency, exponent=minor_exponent(payment.currency),
+                        transaction_id=payment.transaction_id)
+
+
+def record_events_bulk(rows, publish=False):
+    """Insert many events with one statement (for set-based updates).
+
+    rows are dicts with order_id, store_id, event_type and optionally
+    old_status, new_status and data. Durable consumers pick them up from
+    the log; with publish=True the inserted rows come back through
+    RETURNING so they are published on the bus when the transaction commits.
+    """
+    from app import db
+    from models import OrderEvent
+
+    if not rows:
+        return
+    now = datetime.utcnow()
+    table = OrderEvent.__table__
+    values = [{
+        'order_id': row['order_id'],
+        'store_id': row['store_id'],
+        'event_type': row['event_type'],
+        'old_status': row.get('old_status'),
+        'new_status': row.get('new_status'),
+        'data': json.dumps(row['data'], default=str) if row.get('data') else None,
+        'created_at': now,
+    } for row in rows]
+
+    if not publish:
+        db.session.execute(table.insert(), values)
+        return
+    # Exactly the rows inserted here, whatever else shares their timestamp
+    inserted = db.session.execute(table.insert().returning(*table.c, sort_by_parameter_order=True), values)
+    db.session.info.setdefault('order_events', []).extend(snapshot(row) for row in inserted)
+
+
+def init_events(app, db):
+    """Publish each transaction's events on the bus once it commits"""
+    from sqlalchemy import event
+    from models import OrderEvent
+
+    @event.listens_for(db.session, 'after_flush')
+    def collect_events(session, flush_context):
+        new = [snapshot(obj) for obj in session.new if isinstance(obj, OrderEvent)]
+        if new:
+            session.info.setdefault('order_events', []).extend(new)
+
+    @event.listens_for(db.session, 'after_commit')
+    def publish_events(session):
+        events = session.info.pop('order_events', None)
+        if events:
+            bus.publish(events)
+
+    @event.listens_for(db.session, 'after_rollback')
+    def drop_events(session):
+        session.info.pop('order_events', None)
+
+
+# Durable consumers
+
+_consumers = {}
+
+
+class Consumer:
+    """A named reader of the event log that remembers how far it got.
+
+    A consumer with no stored offset starts from the beginning of the log,
+    or with from_start=False from its end (for side effects such as mail
+    that should not be replayed for history).
+    """
+
+    def __init__(self, name, handler, event_types=None, batch_size=500, from_start=True):
+        self.name = name
+        self.handler = handler
+        self.event_types = set(event_types) if event_types else None
+        self.batch_size = batch_size
+        self.from_start = from_start
+
+    def offset(self, db):
+        from models import EventConsumer, OrderEvent
+        offset = db.session.query(EventConsumer.last_event_id).filter_by(name=self.name).scalar()
+        if offset is None and not self.from_start:
+            offset = db.session.query(db.func.max(OrderEvent.id)).scalar() or 0
+            self.save_offset(db, offset)
+        return offset or 0
+
+    def save_offset(self, db, last_event_id):
+        from models import EventConsumer
+        consumer = db.session.get(EventConsumer, self.name)
+        if consumer is None:
+            db.session.add(EventConsumer(name=self.name, last_event_id=last_event_id))
+        else:
+            consumer.last_event_id = last_event_id
+        db.session.commit()
+
+    def catch_up(self, db):
+        """Feed every event past the stored offset to the handler, a batch at a time.
+
+        The offset is saved after each batch, so a crash replays at most one
+        batch; handlers should be idempotent. Returns the number processed.
+        """
+        from models import OrderEvent
+
+        processed = 0
+        offset = self.offset(db)
+        while True:
+            rows = OrderEvent.query.filter(OrderEvent.id > offset) \
+                .order_by(OrderEvent.id).limit(self.batch_size).all()
+            if not rows:
+                return processed
+            events = [snapshot(row) for row in rows]
+            if self.event_types is not None:
+                events = [e for e in events if e.type in self.event_types]
+            if events:
+                self.handler(events)
+                processed += len(events)
+            offset = rows[-1].id
+            self.save_offset(db, offset)
+
+
+def register_consumer(name, event_types=None, batch_size=500, from_start=True):
+    """Decorator registering a handler(events) as durable consumer `name`"""
+    def decorator(handler):
+        _consumers[name] = Consumer(name, handler, event_types, batch_size, from_start)
+        return handler
+    return decorator
+
+
+def get_consumer(name):
+    return _consumers[name]
+
+
+def run_consumers(app, db, interval=5, once=False, names=None):
+    while True:
+        with app.app_context():
+            for name, consumer in _consumers.items():
+                if names and name not in names:
+                    continue
+                try:
+                    count = consumer.catch_up(db)
+                    if count:
+                        logger.info('%s: processed %d events', name, count)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('%s: consumer failed', name)
+        if once:
+            return
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run durable order event consumers')
+    parser.add_argument('command', choices=['run'])
+    parser.add_argument('consumers', nargs='*', help='only run these consumers')
+    parser.add_argument('--once', action='store_true', help='catch up once and exit')
+    parser.add_argument('--interval', type=int, default=5, help='seconds between polls')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    from app import app, db
+    # The app imports the modules that register consumers; they register
+    # with the `events` module, not with this script's own copy of it
+    from events import run_consumers as run_registered
+    run_registered(app, db, interval=args.interval, once=args.once, names=args.consumers)
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+import csv
+import io
+
+from app import db
+from models import User, Store, Order, Payment, OrderArchive, PaymentArchive
+from money import from_minor
+from retention import ARCHIVABLE_STATUSES, newest_archived
+
+EXPORT_BATCH_SIZE = 1000
+
+ORDER_EXPORT_HEADER = ['order_number', 'created_at', 'store', 'customer_email',
+                       'status', 'currency', 'subtotal', 'total']
+PAYMENT_EXPORT_HEADER = ['payment_id', 'created_at', 'order_number', 'payment_method',
+                         'status', 'currency', 'amount', 'transaction_id']
+
+
+def parse_export_filters(args):
+    """Read date range, status and payment method filters from request args"""
+    def parse_date(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d') if value else None
+        except ValueError:
+            return None
+
+    date_to = parse_date(args.get('date_to'))
+    return {
+        'date_from': parse_date(args.get('date_from')),
+        # date_to is inclusive of the whole day
+        'date_to': date_to + timedelta(days=1) if date_to else None,
+        'status': args.get('status') or None,
+        'payment_method': args.get('payment_method') or None,
+    }
+
+
+# Spreadsheet apps run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _safe_cell(value):
+    """Quote text that Excel would otherwise evaluate (store names, emails, ...)"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _stream_csv(header, rows):
+    """Yield CSV text in chunks of EXPORT_BATCH_SIZE rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the file as UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_safe_cell(value) for value in row])
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def order_filter_criteria(filters, order=Order, payment=Payment):
+    """SQL criteria on Order for the parsed filters (shared with bulk status updates).
+
+    order and payment may be the archive models to filter archived orders.
+    """
+    criteria = []
+    if filters['date_from']:
+        criteria.append(order.created_at >= filters['date_from'])
+    if filters['date_to']:
+        criteria.append(order.created_at < filters['date_to'])
+    if filters['status']:
+        criteria.append(order.status == filters['status'])
+    if filters['payment_method']:
+        criteria.append(db.session.query(payment.id).filter(
+            payment.order_id == order.id,
+            payment.payment_method == filters['payment_method']
+        ).exists())
+    return criteria
+
+
+def _reaches_archive(archive, filters):
+    """Whether rows matching filters may have moved to the archive table"""
+    newest = newest_archived(db, archive)
+    return newest is not None and (filters['date_from'] is None or filters['date_from'] <= newest)
+
+
+def _oldest_first(selects):
+    """Rows of one or more selects with the same columns, by created_at then id.
+
+    Each select has created_at and id columns; the id is left off the rows.
+    """
+    rows = selects[0].union_all(*selects[1:]).subquery()
+    query = db.select(*[column for column in rows.c if column.name != 'id']) \
+        .order_by(rows.c.created_at, rows.c.id)
+    # yield_per streams from a server-side cursor where the driver supports it
+    return db.session.execute(query, execution_options={'yield_per': EXPORT_BATCH_SIZE})
+
+
+def _order_export_select(order, payment, filters):
+    return db.select(
+        order.order_number, order.created_at, Store.name, User.email,
+        order.status, order.currency, order.subtotal_minor, order.total_minor, order.id
+    ).join(Store, order.store_id == Store.id).outerjoin(User, order.customer_id == User.id) \
+        .where(*order_filter_criteria(filters, order, payment))
+
+
+def order_export_rows(filters):
+    selects = [_order_export_select(Order, Payment, filters)]
+    # Only finished orders are archived
+    if filters['status'] in (None, *ARCHIVABLE_STATUSES) and _reaches_archive(OrderArchive, filters):
+        selects.append(_order_export_select(OrderArchive, PaymentArchive, filters))
+
+    for number, created_at, store, email, status, currency, subtotal, total in _oldest_first(selects):
+        yield [number, created_at.isoformat(), store, email or '', status, currency,
+               from_minor(subtotal, currency), from_minor(total, currency)]
+
+
+def _payment_export_select(payment, order, filters):
+    query = db.select(
+        payment.id.label('payment_id'), payment.created_at, order.order_number, payment.payment_method,
+        payment.status, payment.currency, payment.amount_minor, payment.transaction_id, payment.id
+    ).join(order, payment.order_id == order.id)
+
+    if filters['date_from']:
+        query = query.where(payment.created_at >= filters['date_from'])
+    if filters['date_to']:
+        query = query.where(payment.created_at < filters['date_to'])
+    if filters['status']:
+        query = query.where(payment.status == filters['status'])
+    if filters['payment_method']:
+        query = query.where(payment.payment_method == filters['payment_method'])
+    return query
+
+
+def payment_export_rows(filters):
+    selects = [_payment_export_select(Payment, Order, filters)]
+    if _reaches_archive(PaymentArchive, filters):
+        selects.append(_payment_export_select(PaymentArchive, OrderArchive, filters))
+
+    for payment_id, created_at, number, method, status, currency, amount, transaction_id in _oldest_first(selects):
+        yield [payment_id, created_at.isoformat(), number, method, status, currency,
+               from_minor(amount, currency), transaction_id or '']
+
+
+def stream_order_export(filters):
+    return _stream_csv(ORDER_EXPORT_HEADER, order_export_rows(filters))
+
+
+def stream_payment_export(filters):
+    return _stream_csv(PAYMENT_EXPORT_HEADER, payment_export_rows(filters))
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Local payment gateway simulators for Take App
+Serves the endpoints payments.py and reconcile.py talk to, so payments can
+be exercised (and load-tested) without real gateway accounts:
+
+    /stripe/v1/payment_intents            Stripe (STRIPE_API_BASE=http://localhost:5001/stripe)
+    /paypal/v1/...                        PayPal REST (PAYPAL_API_URL=http://localhost:5001/paypal)
+    /<provider>/payment/initiate|status   EVC Plus, Golis Saad and Edahab
+                                          (EVC_PLUS_API_URL=http://localhost:5001/evc_plus, ...)
+
+Every gateway can be slowed down or made to fail, from the command line or
+while running, to rehearse gateway trouble:
+
+    python fake_gateways.py --port 5001 --latency-ms 300 --jitter-ms 200 --error-rate 0.01 \\
+        --profile edahab:latency_ms=2500,error_rate=0.2 \\
+        --webhook-url http://localhost:10000/payment/stripe/webhook --webhook-secret whsec_test
+    curl -X PUT localhost:5001/_config/evc_plus -H 'Content-Type: application/json' \\
+        -d '{"latency_ms": 5000}'
+
+Stripe payments are settled by posting a signed payment_intent webhook to
+--webhook-url once --settle-after seconds have passed.
+"""
+
+from flask import Flask, jsonify, request, abort, redirect
+from threading import Lock, Timer
+from urllib.parse import urlencode
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import time
+import requests
+
+MOBILE_PROVIDERS = ('evc_plus', 'golis_saad', 'edahab')
+PROVIDERS = ('stripe', 'paypal') + MOBILE_PROVIDERS
+
+
+class GatewayProfile:
+    """How one simulated gateway misbehaves"""
+
+    FIELDS = ('latency_ms', 'jitter_ms', 'error_rate')
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def update(self, values):
+        for field in self.FIELDS:
+            if field in values:
+                setattr(self, field, float(values[field]))
+
+    def delay(self):
+        """Seconds to stall a request: latency plus up to jitter_ms either way"""
+        jitter = random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+def parse_profile(text):
+    """'edahab:latency_ms=2500,error_rate=0.2' -> ('edahab', {...})"""
+    provider, _, settings = text.partition(':')
+    if provider not in PROVIDERS:
+        raise argparse.ArgumentTypeError(f'unknown gateway {provider!r}')
+    values = {}
+    for item in filter(None, settings.split(',')):
+        key, _, value = item.partition('=')
+        if key not in GatewayProfile.FIELDS:
+            raise argparse.ArgumentTypeError(f'unknown setting {key!r}')
+        values[key] = float(value)
+    return provider, values
+
+
+def stripe_signature(payload, secret, timestamp=None):
+    timestamp = int(timestamp or time.time())
+    signed = hmac.new(secret.encode('utf-8'), f'{timestamp}.{payload}'.encode('utf-8'),
+                      hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signed}'
+
+
+def create_fake_gateway_app(settle_after=5.0, fail_rate=0.0, profiles=None,
+                            webhook_url=None, webhook_secret=None):
+    """Build the simulator app.
+
+    Payments report 'pending' until settle_after seconds have passed, then
+    'completed' (or 'failed' for a fail_rate share of them). profiles maps
+    gateway name to GatewayProfile; error_rate there means HTTP 503s, not
+    declined payments.
+    """
+    app = Flask(__name__)
+    profiles = profiles or {}
+    for provider in PROVIDERS:
+        profiles.setdefault(provider, GatewayProfile())
+    transactions = {}
+    lock = Lock()
+
+    def outcome():
+        return 'failed' if secrets.randbelow(10000) < fail_rate * 10000 else 'completed'
+
+    @app.before_request
+    def misbehave():
+        provider = (request.path.strip('/').split('/') or [''])[0]
+        profile = profiles.get(provider)
+        # Browser redirects (PayPal approval) are not gateway API calls
+        if profile is None or request.path.startswith('/paypal/approve/'):
+            return None
+        delay = profile.delay()
+        if delay:
+            time.sleep(delay)
+        if profile.should_fail():
+            return jsonify({'error': 'simulated gateway error'}), 503
+        return None
+
+    @app.route('/_config')
+    def show_config():
+        return jsonify({provider: profile.to_dict() for provider, profile in profiles.items()})
+
+    @app.route('/_config/<provider>', methods=['PUT'])
+    def update_config(provider):
+        if provider not in profiles:
+            abort(404)
+        profiles[provider].update(request.get_json() or {})
+        return jsonify(profiles[provider].to_dict())
+
+    # Mobile money
+
+    def check_provider(provider):
+        if provider not in MOBILE_PROVIDERS:
+            abort(404)
+
+    @app.route('/<provider>/payment/initiate', methods=['POST'])
+    def initiate(provider):
+        check_provider(provider)
+        data = request.get_json() or {}
+        transaction_id = f"{provider.upper()}-{secrets.token_hex(8)}"
+        with lock:
+            transactions[transaction_id] = {
+                'provider': provider,
+                'reference': data.get('reference'),
+                'amount': data.get('amount'),
+                'created': time.monotonic(),
+                'outcome': outcome(),
+                'status': None,
+            }
+        return jsonify({'transaction_id': transaction_id, 'status': 'pending'})
+
+    @app.route('/<provider>/payment/status/<transaction_id>')
+    def status(provider, transaction_id):
+        check_provider(provider)
+        with lock:
+            tx = transactions.get(transaction_id)
+        if not tx or tx['provider'] != provider:
+            abort(404)
+        current = tx['status']
+        if current is None:
+            current = tx['outcome'] if time.monotonic() - tx['created'] >= settle_after else 'pending'
+        return jsonify({'transaction_id': transaction_id, 'status': current})
+
+    @app.route('/<provider>/payment/status/<transaction_id>', methods=['PUT'])
+    def set_status(provider, transaction_id):
+        """Force a transaction's status, e.g. to test failures"""
+        check_provider(provider)
+        with lock:
+            tx = transactions.get(transaction_id)
+            if not tx:
+                abort(404)
+            tx['status'] = (request.get_json() or {}).get('status')
+        return jsonify({'transaction_id': transaction_id, 'status': tx['status']})
+
+    # Stripe
+
+    def send_stripe_webhook(intent, succeeded):
+        event = json.dumps({
+            'id': f'evt_{secrets.token_hex(12)}',
+            'object': 'event',
+            'type': 'payment_intent.succeeded' if succeeded else 'payment_intent.payment_failed',
+            'data': {'object': dict(intent, status='succeeded' if succeeded else 'requires_payment_method')},
+        })
+        try:
+            requests.post(webhook_url, data=event, timeout=10, headers={
+                'Content-Type': 'application/json',
+                'Stripe-Signature': stripe_signature(event, webhook_secret or ''),
+            })
+        except requests.RequestException as e:
+            app.logger.warning('Stripe webhook to %s failed: %s', webhook_url, e)
+
+    @app.route('/stripe/v1/payment_intents', methods=['POST'])
+    def stripe_create_intent():
+        form = request.form
+        try:
+            amount = int(form['amount'])
+        except (KeyError, ValueError):
+            return jsonify({'error': {'type': 'invalid_request_error', 'message': 'Missing amount'}}), 400
+        intent_id = f'pi_{secrets.token_hex(12)}'
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': amount,
+            'currency': form.get('currency', 'usd'),
+            'client_secret': f'{intent_id}_secret_{secrets.token_hex(8)}',
+            'metadata': {key[9:-1]: value for key, value in form.items()
+                         if key.startswith('metadata[') and key.endswith(']')},
+            'status': 'requires_payment_method',
+            'created': int(time.time()),
+        }
+        with lock:
+            transactions[intent_id] = intent
+        if webhook_url:
+            Timer(settle_after, send_stripe_webhook, (intent, outcome() == 'completed')).start()
+        return jsonify(intent)
+
+    @app.route('/stripe/v1/payment_intents/<intent_id>')
+    def stripe_get_intent(intent_id):
+        with lock:
+            intent = transactions.get(intent_id)
+        if not intent:
+            return jsonify({'error': {'type': 'invalid_request_error', 'message': 'No such payment_intent'}}), 404
+        return jsonify(intent)
+
+    # PayPal (v1 REST API as used by paypalrestsdk)
+
+    @app.route('/paypal/v1/oauth2/token', methods=['POST'])
+    def paypal_token():
+        return jsonify({'access_token': f'A21.{secrets.token_hex(16)}', 'token_type': 'Bearer',
+                        'app_id': 'APP-SIMULATOR', 'expires_in': 32400})
+
+    @app.route('/paypal/v1/payments/payment', methods=['POST'])
+    def paypal_create_payment():
+        data = request.get_json() or {}
+        payment_id = f'PAYID-{secrets.token_hex(12).upper()}'
+        payment = dict(data, id=payment_id, state='created', create_time=time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                       links=[
+                           {'href': f'{request.host_url}paypal/v1/payments/payment/{payment_id}',
+                            'rel': 'self', 'method': 'GET'},
+                           {'href': f'{request.host_url}paypal/approve/{payment_id}',
+                            'rel': 'approval_url', 'method': 'REDIRECT'},
+                       ])
+        with lock:
+            transactions[payment_id] = payment
+        return jsonify(payment), 201
+
+    @app.route('/paypal/v1/payments/payment/<payment_id>')
+    def paypal_get_payment(payment_id):
+        with lock:
+            payment = transactions.get(payment_id)
+        if not payment:
+            return jsonify({'name': 'INVALID_RESOURCE_ID', 'message': 'Requested resource ID was not found.'}), 404
+        return jsonify(payment)
+
+    @app.route('/paypal/approve/<payment_id>')
+    def paypal_approve(payment_id):
+        """Stands in for the buyer approving on paypal.com"""
+        with lock:
+            payment = transactions.get(payment_id)
+        if not payment:
+            abort(404)
+        return_url = payment.get('redirect_urls', {}).get('return_url', '/')
+        query = urlencode({'paymentId': payment_id, 'token': f'EC-{secrets.token_hex(8).upper()}',
+                           'PayerID': 'SIMULATEDPAYER'})
+        return redirect(f"{return_url}{'&' if '?' in return_url else '?'}{query}")
+
+    @app.route('/paypal/v1/payments/payment/<payment_id>/execute', methods=['POST'])
+    def paypal_execute(payment_id):
+        with lock:
+            payment = transactions.get(payment_id)
+            if not payment:
+                return jsonify({'name': 'INVALID_RESOURCE_ID', 'message': 'Requested resource ID was not found.'}), 404
+            if outcome() == 'failed':
+                payment['state'] = 'failed'
+                return jsonify({'name': 'INSTRUMENT_DECLINED', 'message': 'The instrument was declined.'}), 400
+            payment['state'] = 'approved'
+            payment['payer'] = dict(payment.get('payer', {}), payer_info={
+                'payer_id': (request.get_json() or {}).get('payer_id')})
+        return jsonify(payment)
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run local payment gateway simulators')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--settle-after', type=float, default=5.0,
+                        help='seconds until a payment settles')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='share of payments that end up declined')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='added to every gateway call')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='random +/- on the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls answered with 503')
+    parser.add_argument('--profile', type=parse_profile, action='append', default=[],
+                        metavar='GATEWAY:key=value,...', help='per-gateway override, e.g. edahab:latency_ms=2000')
+    parser.add_argument('--webhook-url', help='where to post Stripe webhooks')
+    parser.add_argument('--webhook-secret', help='STRIPE_WEBHOOK_SECRET of the app')
+    args = parser.parse_args()
+
+    profiles = {provider: GatewayProfile(args.latency_ms, args.jitter_ms, args.error_rate)
+                for provider in PROVIDERS}
+    for provider, values in args.profile:
+        profiles[provider].update(values)
+
+    create_fake_gateway_app(args.settle_after, args.fail_rate, profiles,
+                            args.webhook_url, args.webhook_secret).run(port=args.port, threaded=True)
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, FloatField, IntegerField, SelectField, FileField
+from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField, DecimalField, IntegerField, SelectField, FileField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, NumberRange
 from wtforms.validators import ValidationError
 from models import User
@@ -49,8 +49,8 @@ class StoreForm(FlaskForm):
 class ProductForm(FlaskForm):
     name = StringField('Product Name', validators=[DataRequired(), Length(max=100)])
     description = TextAreaField('Description')
-    price = FloatField('Price', validators=[DataRequired(), NumberRange(min=0)])
-    compare_price = FloatField('Compare Price', validators=[Optional(), NumberRange(min=0)])
+    price = DecimalField('Price', places=2, validators=[DataRequired(), NumberRange(min=0)])
+    compare_price = DecimalField('Compare Price', places=2, validators=[Optional(), NumberRange(min=0)])
     stock_quantity = IntegerField('Stock Quantity', validators=[DataRequired(), NumberRange(min=0)])
     is_featured = BooleanField('Featured Product')
     image = FileField('Product Image')
@@ -69,6 +69,11 @@ class OrderForm(FlaskForm):
     ], validators=[DataRequired()])
     submit = SubmitField('Place Order')
 
+class WhatsAppOrderForm(FlaskForm):
+    shipping_address = TextAreaField('Shipping Address', validators=[Optional(), Length(max=500)])
+    notes = TextAreaField('Order Notes', validators=[Optional(), Length(max=1000)])
+    submit = SubmitField('Order on WhatsApp')
+
 class ContactForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired(), Length(max=100)])
     email = StringField('Email', validators=[DataRequired(), Email()])
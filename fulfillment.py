@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+from flask import flash
+import argparse
+
+# Order lifecycle. Anything not listed here is refused, so orders only move
+# forward: pending -> paid -> shipped -> delivered, or off to cancelled
+# before they ship. Cancelling puts the items back in stock.
+TRANSITIONS = {
+    'pending': ('paid', 'cancelled'),
+    'paid': ('shipped', 'cancelled'),
+    'shipped': ('delivered',),
+    'delivered': (),
+    'cancelled': (),
+}
+ORDER_STATUSES = tuple(TRANSITIONS)
+
+# Orders whose money has come in, counted as revenue in reports (archived
+# ones included: only delivered and cancelled orders are ever archived)
+REVENUE_STATUSES = ('paid', 'shipped', 'delivered')
+
+# Largest selection one bulk action may touch; narrow the filter beyond this
+MAX_BULK_ORDERS = 5000
+
+# Ids per IN (...) list, well under SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+class TransitionError(Exception):
+    """The requested status change cannot be applied"""
+
+
+class TransitionResult:
+    def __init__(self, status, updated, skipped):
+        self.status = status
+        self.updated = updated
+        self.skipped = skipped
+
+
+def sources_for(new_status):
+    """Statuses an order may be in to move to new_status"""
+    return [old for old, targets in TRANSITIONS.items() if new_status in targets]
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def transition_orders(db, criteria, new_status, source):
+    """Move every order matching criteria that may legally reach new_status.
+
+    criteria are SQL expressions on Order (a selection of ids, a filter,
+    the merchant's stores). Orders in any other status are skipped. The
+    status change, restock and order events commit as one transaction,
+    using set-based statements rather than one round trip per order.
+    """
+    from models import Order
+    from events import record_events_bulk, ORDER_STATUS_CHANGED
+    from inventory import restock_orders
+
+    if new_status not in TRANSITIONS:
+        raise TransitionError(f'Unknown status {new_status!r}.')
+    allowed = sources_for(new_status)
+    if not allowed:
+        raise TransitionError(f'Orders cannot be moved to {new_status}.')
+
+    # Lock the rows (on databases that can) so concurrent updates cannot
+    # slip an order out of an allowed status between this read and the UPDATE
+    matched = db.session.query(Order.id, Order.store_id, Order.status) \
+        .filter(*criteria).order_by(Order.id).limit(MAX_BULK_ORDERS + 1) \
+        .with_for_update().all()
+    if len(matched) > MAX_BULK_ORDERS:
+        db.session.rollback()
+        raise TransitionError(f'More than {MAX_BULK_ORDERS} orders selected; narrow the filter.')
+
+    changing = [row for row in matched if row[2] in allowed]
+    if not changing:
+        db.session.rollback()
+        return TransitionResult(new_status, 0, len(matched))
+
+    order_ids = [row[0] for row in changing]
+    order = Order.__table__
+    for chunk in _chunks(order_ids):
+        db.session.execute(order.update()
+                           .where(order.c.id.in_(chunk), order.c.status.in_(allowed))
+                           .values(status=new_status))
+    if new_status == 'cancelled':
+        restock_orders(db, order_ids)
+
+    record_events_bulk([{'order_id': order_id, 'store_id': store_id, 'event_type': ORDER_STATUS_CHANGED,
+                         'old_status': old_status, 'new_status': new_status, 'data': {'source': source}}
+                        for order_id, store_id, old_status in changing], publish=True)
+    db.session.commit()
+    return TransitionResult(new_status, len(changing), len(matched) - len(changing))
+
+
+def mark_order_paid(db, order, source):
+    """Move order to paid if it is still awaiting payment; True when it moved.
+
+    For gateway callbacks: the change joins the caller's transaction so it
+    commits with the payment row. A late or retried callback for an order
+    that was cancelled (and restocked) or has shipped leaves it untouched.
+    """
+    from models import Order
+    from events import record_event, ORDER_STATUS_CHANGED
+
+    allowed = sources_for('paid')
+    old_status = db.session.query(Order.status).filter(Order.id == order.id).with_for_update().scalar()
+    if old_status not in allowed:
+        return False
+    table = Order.__table__
+    result = db.session.execute(table.update()
+                                .where(table.c.id == order.id, table.c.status.in_(allowed))
+                                .values(status='paid'))
+    if result.rowcount != 1:
+        return False
+    db.session.expire(order, ['status'])
+    record_event(order, ORDER_STATUS_CHANGED, old_status, 'paid', source=source)
+    return True
+
+
+def expire_whatsapp_orders(db, hours):
+    """Cancel (and restock) WhatsApp orders still pending after hours; returns the count.
+
+    A WhatsApp order takes its stock when the shopper is sent to the chat,
+    so one the store never confirms would otherwise hold it forever.
+    """
+    from models import Order
+
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    expired = 0
+    while True:
+        order_ids = [order_id for (order_id,) in db.session.query(Order.id)
+                     .filter(Order.channel == 'whatsapp', Order.status == 'pending', Order.created_at < cutoff)
+                     .order_by(Order.id).limit(CHUNK_SIZE)]
+        if not order_ids:
+            return expired
+        expired += transition_orders(db, [Order.id.in_(order_ids)], 'cancelled', 'whatsapp_expired').updated
+
+
+def bulk_criteria(form):
+    """Criteria for a bulk action form: ticked order_ids, or the current filter"""
+    from models import Order
+    from exports import parse_export_filters, order_filter_criteria
+
+    if form.get('apply_to') == 'filter':
+        filters = parse_export_filters(form)
+        # 'status' is the target status here; the list filter travels as status_filter
+        filters['status'] = form.get('status_filter') or None
+        return order_filter_criteria(filters)
+    try:
+        order_ids = [int(order_id) for order_id in form.getlist('order_ids')]
+    except ValueError:
+        return None
+    return [Order.id.in_(order_ids)] if order_ids else None
+
+
+def flash_transition(result):
+    if result.updated:
+        flash(f'{result.updated} order(s) moved to {result.status}.', 'success')
+    if result.skipped:
+        flash(f'{result.skipped} order(s) skipped: they cannot move to {result.status} '
+              f'from their current status.', 'warning')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Order lifecycle maintenance')
+    parser.add_argument('command', choices=['expire-whatsapp'])
+    parser.add_argument('--hours', type=int, help='age in hours (default: WHATSAPP_ORDER_TTL_HOURS)')
+    args = parser.parse_args()
+
+    from app import app, db
+    with app.app_context():
+        hours = args.hours or app.config['WHATSAPP_ORDER_TTL_HOURS']
+        print(f'Cancelled {expire_whatsapp_orders(db, hours)} WhatsApp orders pending for over {hours} hours')
@@ -0,0 +1,73 @@
+from flask import current_app
+import json
+import os
+import zlib
+
+# Raw gateway payloads are kept out of the payment table. They are stored
+# zlib-compressed either in the gateway_payload side table ('table') or as
+# files under GATEWAY_ARCHIVE_DIR ('files'), and only read back for the
+# admin payment detail view.
+
+# Gateway field holding the transaction status, per payment method
+STATUS_FIELDS = {
+    'stripe': 'status',
+    'paypal': 'state',
+    'evc_plus': 'status',
+    'golis_saad': 'status',
+    'edahab': 'status',
+}
+
+
+def extract_fields(payment_method, payload):
+    """Fields worth keeping on Payment itself"""
+    status = payload.get(STATUS_FIELDS.get(payment_method, 'status'))
+    return {'gateway_status': str(status)[:30] if status is not None else None}
+
+
+def _encode(payload):
+    return zlib.compress(json.dumps(payload, default=str, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def _decode(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+def archive_payload(payment, payload):
+    """Attach payload to payment and copy the extracted fields onto it.
+
+    Call after adding payment to the session; the payload is written as
+    part of the same transaction (or, in 'files' mode, when it flushes).
+    """
+    from app import db
+    from models import GatewayPayload
+
+    for field, value in extract_fields(payment.payment_method, payload).items():
+        setattr(payment, field, value)
+
+    data = _encode(payload)
+    if current_app.config['GATEWAY_ARCHIVE'] == 'files':
+        db.session.flush()
+        relative = os.path.join(payment.created_at.strftime('%Y/%m'), f'{payment.id}.json.z')
+        path = os.path.join(current_app.config['GATEWAY_ARCHIVE_DIR'], relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        payment.archived_payload = GatewayPayload(path=relative)
+    else:
+        payment.archived_payload = GatewayPayload(body=data)
+
+
+def load_payload(payment):
+    """The raw gateway payload for payment, or None if none was archived"""
+    archived = payment.archived_payload
+    if archived is None:
+        return None
+    if archived.body is not None:
+        return _decode(archived.body)
+    path = os.path.join(current_app.config['GATEWAY_ARCHIVE_DIR'], archived.path)
+    try:
+        with open(path, 'rb') as f:
+            return _decode(f.read())
+    except OSError:
+        current_app.logger.warning('Archived payload for payment %s is missing: %s', payment.id, path)
+        return None
@@ -1,7 +1,11 @@
 # Gunicorn configuration file
+import os
+
 bind = "0.0.0.0:10000"
 workers = 2
-worker_class = "sync"
+# Threaded workers so open order notification streams don't block other requests
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -1,17 +1,25 @@
 #!/usr/bin/env python3
 """
 Database initialization script for Take App
-Run this script to create database tables
+Run this script to create database tables, or to bring an existing
+database up to date with the migrations in migrations/
 """
 
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
 from app import app, db
 from models import User, Store, Product, Order, OrderItem, Payment
 
 def init_database():
-    """Initialize the database with all tables"""
+    """Create all tables on a new database, migrate an existing one"""
     with app.app_context():
-        db.create_all()
-        print("Database tables created successfully!")
+        if not inspect(db.engine).get_table_names():
+            db.create_all()
+            stamp()
+            print("Database tables created successfully!")
+        else:
+            upgrade()
+            print("Database migrated successfully!")
 
 if __name__ == '__main__':
-    init_database() 
\ No newline at end of file
+    init_database()
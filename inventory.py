@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Inventory engine for Take App
+Every stock change (orders, cancellations, manual adjustments) goes through
+apply_stock_changes, which updates Product.stock_quantity and appends to the
+stock_movement ledger in the caller's transaction.
+
+Low stock is detected incrementally: after a decrement only the products
+just touched are checked, and a product raises one alert when it crosses its
+threshold (re-armed once it is restocked above it). Alerts are mailed to
+merchants as one digest per store:
+    python inventory.py digest     # send pending low-stock digests
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import bindparam
+import argparse
+import logging
+
+logger = logging.getLogger('inventory')
+
+# Used for products without their own low_stock_threshold
+DEFAULT_LOW_STOCK_THRESHOLD = 5
+
+# Ids per IN (...) list
+CHUNK_SIZE = 500
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _threshold(db, product_table):
+    from flask import current_app
+    default = current_app.config.get('LOW_STOCK_THRESHOLD', DEFAULT_LOW_STOCK_THRESHOLD)
+    return db.func.coalesce(product_table.c.low_stock_threshold, default)
+
+
+def apply_stock_changes(db, changes, reason):
+    """Apply stock deltas and record them in the ledger.
+
+    changes are dicts with product_id, change (negative takes stock out) and
+    optionally order_id. Runs in the caller's transaction: one executemany
+    UPDATE per batch of products and one executemany INSERT for the ledger.
+    """
+    from models import Product, StockMovement
+
+    if not changes:
+        return
+    totals = defaultdict(int)
+    for row in changes:
+        totals[row['product_id']] += row['change']
+
+    product = Product.__table__
+    deltas = [{'product_id': product_id, 'change': change} for product_id, change in totals.items() if change]
+    if deltas:
+        db.session.execute(
+            product.update()
+            .where(product.c.id == bindparam('product_id'))
+            .values(stock_quantity=product.c.stock_quantity + bindparam('change')),
+            deltas
+        )
+    now = datetime.utcnow()
+    db.session.execute(StockMovement.__table__.insert(), [{
+        'product_id': row['product_id'],
+        'order_id': row.get('order_id'),
+        'change': row['change'],
+        'reason': reason,
+        'created_at': now,
+    } for row in changes])
+
+    decreased = sorted(pid for pid, change in totals.items() if change < 0)
+    increased = sorted(pid for pid, change in totals.items() if change > 0)
+    if decreased:
+        detect_low_stock(db, decreased)
+    if increased:
+        rearm_low_stock(db, increased)
+
+
+def detect_low_stock(db, product_ids):
+    """Raise an alert for each of product_ids that just fell to its threshold"""
+    from models import Product, LowStockAlert
+
+    product = Product.__table__
+    threshold = _threshold(db, product)
+    candidates = []
+    for chunk in _chunks(product_ids):
+        candidates += db.session.execute(
+            db.select(product.c.id, product.c.store_id, product.c.stock_quantity)
+            .where(product.c.id.in_(chunk),
+                   product.c.low_stock_alerted == False,
+                   product.c.stock_quantity <= threshold)
+        ).all()
+
+    alerts = []
+    for product_id, store_id, stock_quantity in candidates:
+        # Guarded flip, so concurrent orders raise the alert only once
+        claimed = db.session.execute(
+            product.update()
+            .where(product.c.id == product_id, product.c.low_stock_alerted == False)
+            .values(low_stock_alerted=True)
+        ).rowcount
+        if claimed:
+            alerts.append({'product_id': product_id, 'store_id': store_id,
+                           'stock_quantity': stock_quantity, 'created_at': datetime.utcnow()})
+    if alerts:
+        db.session.execute(LowStockAlert.__table__.insert(), alerts)
+
+
+def rearm_low_stock(db, product_ids):
+    """Let products restocked above their threshold alert again next time"""
+    from models import Product
+
+    product = Product.__table__
+    threshold = _threshold(db, product)
+    for chunk in _chunks(product_ids):
+        db.session.execute(
+            product.update()
+            .where(product.c.id.in_(chunk),
+                   product.c.low_stock_alerted == True,
+                   product.c.stock_quantity > threshold)
+            .values(low_stock_alerted=False)
+        )
+
+
+def record_opening_stock(db, product):
+    """Ledger entry for the stock a new product starts with"""
+    from models import StockMovement
+
+    if product.stock_quantity:
+        db.session.flush()
+        db.session.add(StockMovement(product_id=product.id, change=product.stock_quantity, reason='opening'))
+
+
+def take_order_stock(db, order_id, items):
+    """Take the items of a newly placed order out of stock"""
+    apply_stock_changes(db, [{'product_id': item['product'].id, 'order_id': order_id,
+                              'change': -item['quantity']} for item in items], 'order')
+
+
+def restock_orders(db, order_ids):
+    """Put the items of cancelled orders back, ledgered per order and product"""
+    from models import OrderItem
+
+    changes = []
+    for chunk in _chunks(order_ids):
+        changes += [{'order_id': order_id, 'product_id': product_id, 'change': int(quantity)}
+                    for order_id, product_id, quantity in db.session.query(
+                        OrderItem.order_id, OrderItem.product_id, db.func.sum(OrderItem.quantity))
+                    .filter(OrderItem.order_id.in_(chunk))
+                    .group_by(OrderItem.order_id, OrderItem.product_id)]
+    apply_stock_changes(db, changes, 'cancel')
+
+
+def send_digests(app, db, mail):
+    """Mail each store owner one message listing their pending alerts"""
+    from flask_mail import Message
+    from models import LowStockAlert, Product, Store, User
+
+    pending = db.session.query(LowStockAlert.id, Store.id, Store.name, User.email, Product.name,
+                               LowStockAlert.stock_quantity) \
+        .join(Product, LowStockAlert.product_id == Product.id) \
+        .join(Store, LowStockAlert.store_id == Store.id) \
+        .join(User, Store.owner_id == User.id) \
+        .filter(LowStockAlert.notified_at.is_(None)) \
+        .order_by(Store.id, Product.name).all()
+
+    by_store = defaultdict(list)
+    for alert_id, store_id, store_name, email, product_name, stock_quantity in pending:
+        by_store[(store_id, store_name, email)].append((alert_id, product_name, stock_quantity))
+
+    alert = LowStockAlert.__table__
+    sent = 0
+    for (store_id, store_name, email), rows in by_store.items():
+        lines = '\n'.join(f'- {name}: {quantity} left' for _, name, quantity in rows)
+        msg = Message(f'Low stock at {store_name}',
+                      sender=app.config['MAIL_USERNAME'],
+                      recipients=[email])
+        msg.body = f'''These products are running low at {store_name}:
+
+{lines}
+
+Restock them from your dashboard to keep taking orders.
+'''
+        try:
+            mail.send(msg)
+        except Exception:
+            logger.exception('Could not send the low-stock digest for store %s', store_id)
+            continue
+        # Marked per store, so a failed send is retried on the next run
+        db.session.execute(alert.update()
+                           .where(alert.c.id.in_([row[0] for row in rows]))
+                           .values(notified_at=datetime.utcnow()))
+        db.session.commit()
+        sent += 1
+    return sent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inventory maintenance')
+    parser.add_argument('command', choices=['digest'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    from app import app, db, mail
+    with app.app_context():
+        print(f'Sent {send_digests(app, db, mail)} low-stock digests')
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Load scenarios for Take App
+Simulated shoppers run weighted scenarios against a running deployment:
+browsing a store, adding to the cart, checking out, and paying through
+each payments.py route. Start the gateway simulators first and point the
+app at them (see fake_gateways.py), then:
+
+    python loadtest.py --host http://localhost:10000 --store demo-store \\
+        --users 50 --spawn-rate 5 --duration 120
+    python loadtest.py ... --scenario browse=10 --scenario pay_edahab=2 --json report.json
+
+Prints throughput, failures and latency percentiles per scenario (the whole
+flow) and per step (each request).
+"""
+
+from collections import defaultdict
+from threading import Lock, Thread, Event
+import argparse
+import json
+import random
+import re
+import time
+import requests
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+ORDER_ID_PATTERN = re.compile(r'/order/(\d+)/confirmation')
+PHONE = '252634000000'
+
+
+class StepFailed(Exception):
+    pass
+
+
+def percentile(ordered, share):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Stats:
+    """Latencies and failures per name, shared by all users"""
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._failures = defaultdict(int)
+        self._lock = Lock()
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self._samples[name].append(seconds)
+            if not ok:
+                self._failures[name] += 1
+
+    def report(self, elapsed):
+        rows = []
+        with self._lock:
+            items = sorted(self._samples.items())
+            failures = dict(self._failures)
+        for name, samples in items:
+            ordered = sorted(samples)
+            rows.append({
+                'name': name,
+                'requests': len(ordered),
+                'failures': failures.get(name, 0),
+                'rps': len(ordered) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(ordered, 0.50) * 1000,
+                'p90_ms': percentile(ordered, 0.90) * 1000,
+                'p95_ms': percentile(ordered, 0.95) * 1000,
+                'p99_ms': percentile(ordered, 0.99) * 1000,
+                'max_ms': ordered[-1] * 1000,
+            })
+        return rows
+
+
+class Shopper:
+    """One simulated customer with its own cookie jar"""
+
+    def __init__(self, host, store, products, stats, timeout):
+        self.host = host.rstrip('/')
+        self.store = store
+        self.products = products
+        self.stats = stats
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.scenario = None
+
+    def request(self, step, method, path, expect=(200,), **kwargs):
+        url = path if path.startswith('http') else f'{self.host}{path}'
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = self.http.request(method, url, timeout=self.timeout, **kwargs)
+            ok = response.status_code in expect
+        except requests.RequestException as e:
+            raise StepFailed(f'{step}: {e}')
+        finally:
+            self.stats.record(f'{self.scenario}/{step}', time.perf_counter() - started, ok)
+        if not ok:
+            raise StepFailed(f'{step}: HTTP {response.status_code}')
+        return response
+
+    def store_path(self, suffix=''):
+        return f'/store/{self.store}{suffix}'
+
+    def product(self):
+        return random.choice(self.products)
+
+    # Building blocks shared by the scenarios
+
+    def browse(self):
+        self.request('store_page', 'GET', self.store_path())
+        self.request('product_detail', 'GET', self.store_path(f'/product/{self.product()}'))
+
+    def add_to_cart(self):
+        self.request('add_to_cart', 'POST', self.store_path(f'/add-to-cart/{self.product()}'),
+                     data={'quantity': random.randint(1, 3)})
+
+    def checkout(self, payment_method):
+        self.add_to_cart()
+        page = self.request('checkout_form', 'GET', self.store_path('/checkout'))
+        token = CSRF_PATTERN.search(page.text)
+        response = self.request('checkout', 'POST', self.store_path('/checkout'), expect=(302, 303),
+                                allow_redirects=False, data={
+                                    'csrf_token': token.group(1) if token else '',
+                                    'shipping_address': 'Road 1, Hargeisa',
+                                    'notes': 'load test',
+                                    'payment_method': payment_method,
+                                })
+        match = ORDER_ID_PATTERN.search(response.headers.get('Location', ''))
+        if not match:
+            raise StepFailed('checkout: no order in redirect')
+        return int(match.group(1))
+
+    def pay_mobile(self, order_id, route):
+        self.request(f'pay_{route}', 'POST', f'/payment/{route}/initiate',
+                     json={'order_id': order_id, 'phone': PHONE})
+
+
+# Scenarios: name -> (default weight, function(shopper))
+
+def scenario_browse(shopper):
+    shopper.request('catalog', 'GET', shopper.store_path('/catalog.json'))
+    shopper.browse()
+
+
+def scenario_add_to_cart(shopper):
+    shopper.browse()
+    shopper.add_to_cart()
+    shopper.request('cart', 'GET', shopper.store_path('/cart'))
+
+
+def scenario_checkout(shopper):
+    shopper.browse()
+    shopper.checkout('cod')
+
+
+def scenario_pay_stripe(shopper):
+    order_id = shopper.checkout('stripe')
+    shopper.request('create_intent', 'POST', '/payment/stripe/create-payment-intent',
+                    json={'order_id': order_id})
+
+
+def scenario_pay_paypal(shopper):
+    order_id = shopper.checkout('paypal')
+    approval = shopper.request('create_payment', 'POST', '/payment/paypal/create',
+                               json={'order_id': order_id}).json()['approval_url']
+    # The simulator approves at once and sends the buyer back to paypal_success
+    shopper.request('approve_and_execute', 'GET', approval)
+
+
+def scenario_pay_evc_plus(shopper):
+    shopper.pay_mobile(shopper.checkout('evc_plus'), 'evc-plus')
+
+
+def scenario_pay_golis_saad(shopper):
+    shopper.pay_mobile(shopper.checkout('golis_saad'), 'golis-saad')
+
+
+def scenario_pay_edahab(shopper):
+    shopper.pay_mobile(shopper.checkout('edahab'), 'edahab')
+
+
+SCENARIOS = {
+    'browse': (10, scenario_browse),
+    'add_to_cart': (4, scenario_add_to_cart),
+    'checkout': (1, scenario_checkout),
+    'pay_stripe': (1, scenario_pay_stripe),
+    'pay_paypal': (1, scenario_pay_paypal),
+    'pay_evc_plus': (1, scenario_pay_evc_plus),
+    'pay_golis_saad': (1, scenario_pay_golis_saad),
+    'pay_edahab': (1, scenario_pay_edahab),
+}
+
+
+def run_shopper(shopper, weights, stop, think_time):
+    names = list(weights)
+    chances = [weights[name] for name in names]
+    while not stop.is_set():
+        name = random.choices(names, chances)[0]
+        shopper.scenario = name
+        started = time.perf_counter()
+        ok = True
+        try:
+            SCENARIOS[name][1](shopper)
+        except (StepFailed, KeyError, ValueError):
+            ok = False
+        shopper.stats.record(name, time.perf_counter() - started, ok)
+        stop.wait(random.uniform(*think_time))
+
+
+def load_products(host, store, timeout):
+    """Product ids from the store's catalog snapshot"""
+    response = requests.get(f"{host.rstrip('/')}/store/{store}/catalog.json", timeout=timeout)
+    response.raise_for_status()
+    products = [p['id'] for p in response.json()['products']]
+    if not products:
+        raise SystemExit(f'Store {store!r} has no active products to order')
+    return products
+
+
+def run(host, store, weights, users, spawn_rate, duration, think_time, timeout):
+    products = load_products(host, store, timeout)
+    stats = Stats()
+    stop = Event()
+    threads = []
+    started = time.monotonic()
+    for number in range(users):
+        shopper = Shopper(host, store, products, stats, timeout)
+        thread = Thread(target=run_shopper, args=(shopper, weights, stop, think_time), daemon=True)
+        thread.start()
+        threads.append(thread)
+        # Ramp up spawn_rate users per second
+        if number < users - 1 and stop.wait(1.0 / spawn_rate):
+            break
+    stop.wait(max(0.0, duration - (time.monotonic() - started)))
+    stop.set()
+    for thread in threads:
+        thread.join(timeout)
+    return stats.report(time.monotonic() - started)
+
+
+def print_report(rows):
+    header = f"{'name':<36}{'reqs':>8}{'fails':>7}{'req/s':>8}{'p50':>8}{'p90':>8}{'p95':>8}{'p99':>8}{'max':>8}"
+    print(header)
+    print('-' * len(header))
+    # Scenario totals first, then their steps
+    for row in sorted(rows, key=lambda r: (r['name'].split('/')[0], '/' in r['name'], r['name'])):
+        name = row['name'] if '/' not in row['name'] else '  ' + row['name'].split('/', 1)[1]
+        print(f"{name:<36}{row['requests']:>8}{row['failures']:>7}{row['rps']:>8.1f}"
+              f"{row['p50_ms']:>8.0f}{row['p90_ms']:>8.0f}{row['p95_ms']:>8.0f}"
+              f"{row['p99_ms']:>8.0f}{row['max_ms']:>8.0f}")
+    print('latencies in ms')
+
+
+def parse_weight(text):
+    name, _, weight = text.partition('=')
+    if name not in SCENARIOS:
+        raise argparse.ArgumentTypeError(f"unknown scenario {name!r}; pick from {', '.join(SCENARIOS)}")
+    return name, float(weight or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run load scenarios against Take App')
+    parser.add_argument('--host', default='http://localhost:10000')
+    parser.add_argument('--store', required=True, help='slug of the store to shop in')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--spawn-rate', type=float, default=2.0, help='users started per second')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds to run')
+    parser.add_argument('--scenario', type=parse_weight, action='append', default=[],
+                        metavar='NAME=WEIGHT', help='run only these scenarios, with these weights')
+    parser.add_argument('--think-min', type=float, default=0.5)
+    parser.add_argument('--think-max', type=float, default=2.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    weights = dict(args.scenario) or {name: weight for name, (weight, _) in SCENARIOS.items()}
+    rows = run(args.host, args.store, weights, args.users, args.spawn_rate, args.duration,
+               (args.think_min, args.think_max), args.timeout)
+    print_report(rows)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'users': args.users, 'duration': args.duration, 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
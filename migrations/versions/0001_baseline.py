@@ -0,0 +1,27 @@
+"""baseline schema created by init_db.py
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-19 09:00:00.000000
+
+Databases created before migrations were added already have this schema;
+running `flask db upgrade` on them applies this no-op revision first.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
@@ -0,0 +1,73 @@
+"""store money as integer minor units
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# (table, float column, minor-unit column, nullable)
+MONEY_COLUMNS = [
+    ('product', 'price', 'price_minor', False),
+    ('product', 'compare_price', 'compare_price_minor', True),
+    ('order', 'subtotal', 'subtotal_minor', False),
+    ('order', 'total', 'total_minor', False),
+    ('order_item', 'price', 'price_minor', False),
+    ('order_item', 'total', 'total_minor', False),
+    ('payment', 'amount', 'amount_minor', False),
+]
+
+
+def _tables():
+    tables = {}
+    for table, old, new, nullable in MONEY_COLUMNS:
+        tables.setdefault(table, []).append((old, new, nullable))
+    return tables
+
+
+def upgrade():
+    for table, columns in _tables().items():
+        with op.batch_alter_table(table) as batch_op:
+            for old, new, nullable in columns:
+                batch_op.add_column(sa.Column(new, sa.BigInteger(), nullable=True))
+
+        t = sa.table(table, *[sa.column(c) for old, new, _ in columns for c in (old, new)])
+        op.execute(t.update().values({
+            new: sa.cast(sa.func.round(t.c[old] * 100), sa.BigInteger)
+            for old, new, _ in columns
+        }))
+
+        with op.batch_alter_table(table) as batch_op:
+            for old, new, nullable in columns:
+                batch_op.alter_column(new, existing_type=sa.BigInteger(), nullable=nullable)
+                batch_op.drop_column(old)
+
+    payment = sa.table('payment', sa.column('currency'))
+    op.execute(payment.update().values(currency=sa.func.upper(payment.c.currency)))
+
+
+def downgrade():
+    for table, columns in _tables().items():
+        with op.batch_alter_table(table) as batch_op:
+            for old, new, nullable in columns:
+                batch_op.add_column(sa.Column(old, sa.Float(), nullable=True))
+
+        t = sa.table(table, *[sa.column(c) for old, new, _ in columns for c in (old, new)])
+        op.execute(t.update().values({
+            old: sa.cast(t.c[new], sa.Float) / 100
+            for old, new, _ in columns
+        }))
+
+        with op.batch_alter_table(table) as batch_op:
+            for old, new, nullable in columns:
+                batch_op.alter_column(old, existing_type=sa.Float(), nullable=nullable)
+                batch_op.drop_column(new)
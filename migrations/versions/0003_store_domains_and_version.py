@@ -0,0 +1,30 @@
+"""store custom domains and row version
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('store') as batch_op:
+        batch_op.add_column(sa.Column('custom_domain', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.create_unique_constraint('uq_store_custom_domain', ['custom_domain'])
+
+
+def downgrade():
+    with op.batch_alter_table('store') as batch_op:
+        batch_op.drop_constraint('uq_store_custom_domain', type_='unique')
+        batch_op.drop_column('version')
+        batch_op.drop_column('custom_domain')
@@ -0,0 +1,52 @@
+"""usage counters for subscription quotas
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'usage_counter',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+        sa.Column('metric', sa.String(length=20), nullable=False),
+        sa.Column('period', sa.String(length=7), nullable=False, server_default=''),
+        sa.Column('value', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('user_id', 'metric', 'period')
+    )
+    # Start the counters from what already exists: running totals for
+    # stores and products, this month's orders for the monthly limit
+    op.execute("""
+        INSERT INTO usage_counter (user_id, metric, period, value)
+        SELECT owner_id, 'stores', '', COUNT(*) FROM store GROUP BY owner_id
+    """)
+    op.execute("""
+        INSERT INTO usage_counter (user_id, metric, period, value)
+        SELECT store.owner_id, 'products', '', COUNT(product.id)
+        FROM store JOIN product ON product.store_id = store.id
+        GROUP BY store.owner_id
+    """)
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    op.get_bind().execute(sa.text("""
+        INSERT INTO usage_counter (user_id, metric, period, value)
+        SELECT store.owner_id, 'orders', :period, COUNT("order".id)
+        FROM store JOIN "order" ON "order".store_id = store.id
+        WHERE "order".created_at >= :month_start
+        GROUP BY store.owner_id
+    """), {'period': month_start.strftime('%Y-%m'), 'month_start': month_start})
+
+
+def downgrade():
+    op.drop_table('usage_counter')
@@ -0,0 +1,48 @@
+"""order event log and consumer offsets
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'order_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), sa.ForeignKey('order.id'), nullable=False),
+        sa.Column('store_id', sa.Integer(), sa.ForeignKey('store.id'), nullable=False),
+        sa.Column('event_type', sa.String(length=40), nullable=False),
+        sa.Column('old_status', sa.String(length=20), nullable=True),
+        sa.Column('new_status', sa.String(length=20), nullable=True),
+        sa.Column('data', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_event_order_id', 'order_event', ['order_id'])
+    op.create_index('ix_order_event_store_id', 'order_event', ['store_id'])
+
+    op.create_table(
+        'event_consumer',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('last_event_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('event_consumer')
+    op.drop_index('ix_order_event_store_id', table_name='order_event')
+    op.drop_index('ix_order_event_order_id', table_name='order_event')
+    op.drop_table('order_event')
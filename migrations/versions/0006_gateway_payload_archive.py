@@ -0,0 +1,84 @@
+"""move raw gateway responses out of the payment table
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import json
+import zlib
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+STATUS_FIELDS = {'paypal': 'state'}
+
+
+def upgrade():
+    op.create_table(
+        'gateway_payload',
+        sa.Column('payment_id', sa.Integer(), sa.ForeignKey('payment.id'), nullable=False),
+        sa.Column('body', sa.LargeBinary(), nullable=True),
+        sa.Column('path', sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint('payment_id')
+    )
+    with op.batch_alter_table('payment') as batch_op:
+        batch_op.add_column(sa.Column('gateway_status', sa.String(length=30), nullable=True))
+        batch_op.create_index('ix_payment_transaction_id', ['transaction_id'])
+
+    # Compress existing responses into the side table in batches
+    conn = op.get_bind()
+    payment = sa.table('payment', sa.column('id'), sa.column('payment_method'),
+                       sa.column('gateway_response'), sa.column('gateway_status'))
+    payload = sa.table('gateway_payload', sa.column('payment_id'), sa.column('body'))
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(payment.c.id, payment.c.payment_method, payment.c.gateway_response)
+            .where(payment.c.id > last_id, payment.c.gateway_response.isnot(None))
+            .order_by(payment.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        archived = []
+        for payment_id, method, response in rows:
+            try:
+                status = json.loads(response).get(STATUS_FIELDS.get(method, 'status'))
+            except (ValueError, AttributeError):
+                status = None
+            if status is not None:
+                conn.execute(payment.update().where(payment.c.id == payment_id)
+                             .values(gateway_status=str(status)[:30]))
+            archived.append({'payment_id': payment_id, 'body': zlib.compress(response.encode('utf-8'), 6)})
+        conn.execute(payload.insert(), archived)
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table('payment') as batch_op:
+        batch_op.drop_column('gateway_response')
+
+
+def downgrade():
+    with op.batch_alter_table('payment') as batch_op:
+        batch_op.add_column(sa.Column('gateway_response', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    payment = sa.table('payment', sa.column('id'), sa.column('gateway_response'))
+    payload = sa.table('gateway_payload', sa.column('payment_id'), sa.column('body'))
+    # Payloads archived as files stay on disk; only table-stored bodies come back
+    for payment_id, body in conn.execute(
+            sa.select(payload.c.payment_id, payload.c.body).where(payload.c.body.isnot(None))):
+        conn.execute(payment.update().where(payment.c.id == payment_id)
+                     .values(gateway_response=zlib.decompress(body).decode('utf-8')))
+
+    with op.batch_alter_table('payment') as batch_op:
+        batch_op.drop_index('ix_payment_transaction_id')
+        batch_op.drop_column('gateway_status')
+    op.drop_table('gateway_payload')
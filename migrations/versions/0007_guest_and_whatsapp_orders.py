@@ -0,0 +1,28 @@
+"""guest orders and order channel
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.alter_column('customer_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.add_column(sa.Column('channel', sa.String(length=20), nullable=True, server_default='web'))
+
+
+def downgrade():
+    with op.batch_alter_table('order') as batch_op:
+        batch_op.drop_column('channel')
+        batch_op.alter_column('customer_id', existing_type=sa.Integer(), nullable=False)
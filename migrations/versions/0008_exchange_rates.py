@@ -0,0 +1,31 @@
+"""exchange rate table
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'exchange_rate',
+        sa.Column('currency', sa.String(length=3), nullable=False),
+        sa.Column('rate', sa.Numeric(20, 8), nullable=False),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('currency')
+    )
+
+
+def downgrade():
+    op.drop_table('exchange_rate')
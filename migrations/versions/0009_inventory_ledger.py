@@ -0,0 +1,65 @@
+"""stock ledger and low-stock alerts
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.add_column(sa.Column('low_stock_threshold', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('low_stock_alerted', sa.Boolean(), nullable=False,
+                                      server_default=sa.false()))
+
+    op.create_table(
+        'stock_movement',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('product.id'), nullable=False),
+        sa.Column('order_id', sa.Integer(), sa.ForeignKey('order.id'), nullable=True),
+        sa.Column('change', sa.Integer(), nullable=False),
+        sa.Column('reason', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_movement_product_id', 'stock_movement', ['product_id'])
+    op.create_index('ix_stock_movement_order_id', 'stock_movement', ['order_id'])
+    # Open the ledger with what is on the shelves today
+    op.execute("""
+        INSERT INTO stock_movement (product_id, change, reason, created_at)
+        SELECT id, stock_quantity, 'opening', CURRENT_TIMESTAMP FROM product
+        WHERE stock_quantity IS NOT NULL AND stock_quantity <> 0
+    """)
+
+    op.create_table(
+        'low_stock_alert',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('product.id'), nullable=False),
+        sa.Column('store_id', sa.Integer(), sa.ForeignKey('store.id'), nullable=False),
+        sa.Column('stock_quantity', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('notified_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_low_stock_alert_notified_at', 'low_stock_alert', ['notified_at'])
+
+
+def downgrade():
+    op.drop_index('ix_low_stock_alert_notified_at', table_name='low_stock_alert')
+    op.drop_table('low_stock_alert')
+    op.drop_index('ix_stock_movement_order_id', table_name='stock_movement')
+    op.drop_index('ix_stock_movement_product_id', table_name='stock_movement')
+    op.drop_table('stock_movement')
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.drop_column('low_stock_alerted')
+        batch_op.drop_column('low_stock_threshold')
@@ -0,0 +1,141 @@
+"""order archive tables and rollups
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+# Foreign keys onto the hot tables from rows that outlive an archived order.
+# Only PostgreSQL enforces (and names) them; SQLite leaves them unchecked.
+DETACHED = [
+    ('order_event_order_id_fkey', 'order_event', 'order', 'order_id'),
+    ('stock_movement_order_id_fkey', 'stock_movement', 'order', 'order_id'),
+    ('gateway_payload_payment_id_fkey', 'gateway_payload', 'payment', 'payment_id'),
+]
+
+
+def archive_table(name, *columns):
+    """Create an archive table, range-partitioned by created_at on PostgreSQL.
+
+    A partitioned table's primary key has to include the partition column;
+    retention.py adds one partition per year before moving rows in.
+    """
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_table(name, *columns, sa.PrimaryKeyConstraint('id', 'created_at'),
+                        postgresql_partition_by='RANGE (created_at)')
+    else:
+        op.create_table(name, *columns, sa.PrimaryKeyConstraint('id'))
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name, table, _, _ in DETACHED:
+            op.drop_constraint(name, table, type_='foreignkey')
+
+    archive_table(
+        'order_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('order_number', sa.String(length=20), nullable=False),
+        sa.Column('customer_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=True),
+        sa.Column('store_id', sa.Integer(), sa.ForeignKey('store.id'), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('channel', sa.String(length=20), nullable=True),
+        sa.Column('subtotal_minor', sa.BigInteger(), nullable=False),
+        sa.Column('total_minor', sa.BigInteger(), nullable=False),
+        sa.Column('currency', sa.String(length=3), nullable=True),
+        sa.Column('shipping_address', sa.Text(), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_order_archive_order_number', 'order_archive', ['order_number'])
+    op.create_index('ix_order_archive_store_id', 'order_archive', ['store_id'])
+
+    archive_table(
+        'order_item_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('product.id'), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('price_minor', sa.BigInteger(), nullable=False),
+        sa.Column('total_minor', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_order_item_archive_order_id', 'order_item_archive', ['order_id'])
+
+    archive_table(
+        'payment_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('payment_method', sa.String(length=50), nullable=False),
+        sa.Column('amount_minor', sa.BigInteger(), nullable=False),
+        sa.Column('currency', sa.String(length=3), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('transaction_id', sa.String(length=100), nullable=True),
+        sa.Column('gateway_status', sa.String(length=30), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_payment_archive_order_id', 'payment_archive', ['order_id'])
+    op.create_index('ix_payment_archive_transaction_id', 'payment_archive', ['transaction_id'])
+
+    op.create_table(
+        'order_rollup',
+        sa.Column('store_id', sa.Integer(), sa.ForeignKey('store.id'), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('currency', sa.String(length=3), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('total_minor', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('store_id', 'day', 'status', 'currency')
+    )
+    op.create_table(
+        'product_sales_rollup',
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('product.id'), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('product_id', 'day')
+    )
+    op.create_table(
+        'payment_rollup',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('payment_method', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('currency', sa.String(length=3), nullable=False),
+        sa.Column('payments', sa.Integer(), nullable=False),
+        sa.Column('amount_minor', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'payment_method', 'status', 'currency')
+    )
+
+
+def downgrade():
+    op.drop_table('payment_rollup')
+    op.drop_table('product_sales_rollup')
+    op.drop_table('order_rollup')
+    # Dropping a partitioned table drops its partitions with it
+    op.drop_index('ix_payment_archive_transaction_id', table_name='payment_archive')
+    op.drop_index('ix_payment_archive_order_id', table_name='payment_archive')
+    op.drop_table('payment_archive')
+    op.drop_index('ix_order_item_archive_order_id', table_name='order_item_archive')
+    op.drop_table('order_item_archive')
+    op.drop_index('ix_order_archive_store_id', table_name='order_archive')
+    op.drop_index('ix_order_archive_order_number', table_name='order_archive')
+    op.drop_table('order_archive')
+
+    # Archived orders are gone from the hot tables, so their events, ledger
+    # rows and payloads would violate the restored keys; only the live ones stay
+    if op.get_bind().dialect.name == 'postgresql':
+        for name, table, referred, column in DETACHED:
+            op.execute(f'DELETE FROM {table} WHERE {column} IS NOT NULL AND {column} NOT IN '
+                       f'(SELECT id FROM "{referred}")')
+            op.create_foreign_key(name, table, referred, [column], ['id'])
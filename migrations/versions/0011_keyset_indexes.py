@@ -0,0 +1,38 @@
+"""descending (created_at, id) indexes for keyset pagination
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+NEWEST_FIRST = [sa.text('created_at DESC'), sa.text('id DESC')]
+
+# (index, table, leading columns) for each newest-first listing
+INDEXES = [
+    ('ix_user_created_at_id', 'user', []),
+    ('ix_store_created_at_id', 'store', []),
+    ('ix_order_created_at_id', 'order', []),
+    ('ix_order_status_created_at_id', 'order', ['status']),
+    ('ix_order_store_id_created_at_id', 'order', ['store_id']),
+    ('ix_payment_created_at_id', 'payment', []),
+]
+
+
+def upgrade():
+    for name, table, leading in INDEXES:
+        op.create_index(name, table, [sa.text(column) for column in leading] + NEWEST_FIRST)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
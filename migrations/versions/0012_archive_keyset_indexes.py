@@ -0,0 +1,35 @@
+"""descending (created_at, id) indexes on the archive tables
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+NEWEST_FIRST = [sa.text('created_at DESC'), sa.text('id DESC')]
+
+# Admin listings and exports merge archived rows in by (created_at, id). On
+# PostgreSQL an index on the partitioned parent is created on every partition.
+INDEXES = [
+    ('ix_order_archive_created_at_id', 'order_archive'),
+    ('ix_payment_archive_created_at_id', 'payment_archive'),
+]
+
+
+def upgrade():
+    for name, table in INDEXES:
+        op.create_index(name, table, NEWEST_FIRST)
+
+
+def downgrade():
+    for name, table in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
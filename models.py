@@ -1,10 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, needs_rehash
 from datetime import datetime
-import uuid
+from orders import generate_order_number
+from money import Money, DEFAULT_CURRENCY, to_minor, from_minor
+from routing import RoutingSession
 
-db = SQLAlchemy()
+# The one SQLAlchemy instance; app.py initializes it and every module shares it
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def money_property(column, currency=lambda obj: DEFAULT_CURRENCY):
+    """Expose an integer minor-unit column as a Decimal amount attribute"""
+    def getter(self):
+        return from_minor(getattr(self, column), currency(self))
+
+    def setter(self, value):
+        setattr(self, column, to_minor(value, currency(self)))
+
+    return property(getter, setter)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -22,12 +35,18 @@ class User(UserMixin, db.Model):
     
     stores = db.relationship('Store', backref='owner', lazy=True)
     orders = db.relationship('Order', backref='customer', lazy=True)
+
+    # Newest-first keyset listing (pagination.keyset_paginate)
+    __table_args__ = (db.Index('ix_user_created_at_id', created_at.desc(), id.desc()),)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
 class Store(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -42,19 +61,27 @@ class Store(db.Model):
     website = db.Column(db.String(200))
     is_active = db.Column(db.Boolean, default=True)
     theme = db.Column(db.String(50), default='default')
+    custom_domain = db.Column(db.String(255), unique=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     products = db.relationship('Product', backref='store', lazy=True)
     orders = db.relationship('Order', backref='store', lazy=True)
 
+    # Bumped on every UPDATE; cached copies carry the version they were read at
+    __mapper_args__ = {'version_id_col': version}
+    __table_args__ = (db.Index('ix_store_created_at_id', created_at.desc(), id.desc()),)
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    price = db.Column(db.Float, nullable=False)
-    compare_price = db.Column(db.Float)
+    price_minor = db.Column(db.BigInteger, nullable=False)
+    compare_price_minor = db.Column(db.BigInteger)
     stock_quantity = db.Column(db.Integer, default=0)
+    low_stock_threshold = db.Column(db.Integer)  # None uses LOW_STOCK_THRESHOLD
+    low_stock_alerted = db.Column(db.Boolean, default=False, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     is_featured = db.Column(db.Boolean, default=False)
     store_id = db.Column(db.Integer, db.ForeignKey('store.id'), nullable=False)
@@ -63,42 +90,234 @@ class Product(db.Model):
 
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
 
+    price = money_property('price_minor')
+    compare_price = money_property('compare_price_minor')
+
+    @property
+    def price_money(self):
+        return Money(self.price_minor, DEFAULT_CURRENCY)
+
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(20), unique=True, nullable=False)
-    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Guests (e.g. WhatsApp orders) have no account
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     store_id = db.Column(db.Integer, db.ForeignKey('store.id'), nullable=False)
     status = db.Column(db.String(20), default='pending')
-    subtotal = db.Column(db.Float, nullable=False)
-    total = db.Column(db.Float, nullable=False)
-    currency = db.Column(db.String(3), default='USD')
+    channel = db.Column(db.String(20), default='web')  # web, whatsapp
+    subtotal_minor = db.Column(db.BigInteger, nullable=False)
+    total_minor = db.Column(db.BigInteger, nullable=False)
+    currency = db.Column(db.String(3), default=DEFAULT_CURRENCY)
     shipping_address = db.Column(db.Text)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     payments = db.relationship('Payment', backref='order', lazy=True)
+
+    # Keyset listings: all orders (admin), by status (admin filter), by store (merchants)
+    __table_args__ = (
+        db.Index('ix_order_created_at_id', created_at.desc(), id.desc()),
+        db.Index('ix_order_status_created_at_id', status, created_at.desc(), id.desc()),
+        db.Index('ix_order_store_id_created_at_id', store_id, created_at.desc(), id.desc()),
+    )
+
+    subtotal = money_property('subtotal_minor', lambda o: o.currency)
+    total = money_property('total_minor', lambda o: o.currency)
+    is_archived = False
     
     def __init__(self, **kwargs):
+        # Set currency first so subtotal/total are converted with its exponent
+        if 'currency' in kwargs:
+            self.currency = kwargs.pop('currency')
         super(Order, self).__init__(**kwargs)
         if not self.order_number:
-            self.order_number = f"ORD-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+            self.order_number = generate_order_number()
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    total = db.Column(db.Float, nullable=False)
+    price_minor = db.Column(db.BigInteger, nullable=False)
+    total_minor = db.Column(db.BigInteger, nullable=False)
+
+    price = money_property('price_minor', lambda i: i.order.currency if i.order else DEFAULT_CURRENCY)
+    total = money_property('total_minor', lambda i: i.order.currency if i.order else DEFAULT_CURRENCY)
 
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     payment_method = db.Column(db.String(50), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
-    currency = db.Column(db.String(3), default='USD')
+    amount_minor = db.Column(db.BigInteger, nullable=False)
+    currency = db.Column(db.String(3), default=DEFAULT_CURRENCY)
     status = db.Column(db.String(20), default='pending')
-    transaction_id = db.Column(db.String(100))
-    gateway_response = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    transaction_id = db.Column(db.String(100), index=True)
+    gateway_status = db.Column(db.String(30))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Raw gateway response, only loaded when accessed (admin payment detail)
+    archived_payload = db.relationship('GatewayPayload', uselist=False, lazy='select',
+                                       primaryjoin='Payment.id == foreign(GatewayPayload.payment_id)',
+                                       cascade='all, delete-orphan')
+
+    __table_args__ = (db.Index('ix_payment_created_at_id', created_at.desc(), id.desc()),)
+
+    amount = money_property('amount_minor', lambda p: p.currency)
+    is_archived = False
+
+    def __init__(self, **kwargs):
+        if 'currency' in kwargs:
+            self.currency = kwargs.pop('currency')
+        super(Payment, self).__init__(**kwargs)
+
+class GatewayPayload(db.Model):
+    # No foreign key: the payload stays put when its payment is archived
+    payment_id = db.Column(db.Integer, primary_key=True)
+    body = db.Column(db.LargeBinary)  # zlib-compressed JSON, when kept in the table
+    path = db.Column(db.String(255))  # relative to GATEWAY_ARCHIVE_DIR, when kept as a file
+
+class UsageCounter(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    metric = db.Column(db.String(20), primary_key=True)
+    period = db.Column(db.String(7), primary_key=True, default='')
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class OrderEvent(db.Model):
+    """Append-only history of orders and payments; id doubles as the log offset"""
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key: the log keeps events of orders moved to order_archive
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('store.id'), nullable=False, index=True)
+    event_type = db.Column(db.String(40), nullable=False)
+    old_status = db.Column(db.String(20))
+    new_status = db.Column(db.String(20))
+    data = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    order = db.relationship('Order', primaryjoin='foreign(OrderEvent.order_id) == Order.id',
+                            backref=db.backref('events', lazy=True, order_by='OrderEvent.id'))
+
+class EventConsumer(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ExchangeRate(db.Model):
+    """Units of currency per one DEFAULT_CURRENCY, maintained by rates.py"""
+    currency = db.Column(db.String(3), primary_key=True)
+    rate = db.Column(db.Numeric(20, 8), nullable=False)
+    source = db.Column(db.String(20), nullable=False, default='manual')  # feed, manual
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class StockMovement(db.Model):
+    """Ledger of every change to Product.stock_quantity"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    order_id = db.Column(db.Integer, index=True)  # no foreign key, see OrderEvent.order_id
+    change = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)  # opening, order, cancel, adjust
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class LowStockAlert(db.Model):
+    """A product falling to its threshold, waiting for the merchant's digest"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    store_id = db.Column(db.Integer, db.ForeignKey('store.id'), nullable=False)
+    stock_quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    notified_at = db.Column(db.DateTime, index=True)
+
+# Finished orders older than RETENTION_DAYS, moved here by retention.py. Same
+# columns (and ids) as the hot tables, read-only. On PostgreSQL the tables are
+# partitioned by created_at, so they carry no foreign keys between each other.
+
+class OrderArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_number = db.Column(db.String(20), nullable=False, index=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    store_id = db.Column(db.Integer, db.ForeignKey('store.id'), nullable=False, index=True)
+    status = db.Column(db.String(20))
+    channel = db.Column(db.String(20))
+    subtotal_minor = db.Column(db.BigInteger, nullable=False)
+    total_minor = db.Column(db.BigInteger, nullable=False)
+    currency = db.Column(db.String(3))
+    shipping_address = db.Column(db.Text)
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    store = db.relationship('Store')
+    customer = db.relationship('User')
+    items = db.relationship('OrderItemArchive', backref='order', lazy=True,
+                            primaryjoin='OrderArchive.id == foreign(OrderItemArchive.order_id)')
+    payments = db.relationship('PaymentArchive', backref='order', lazy=True,
+                               primaryjoin='OrderArchive.id == foreign(PaymentArchive.order_id)')
+    events = db.relationship('OrderEvent', lazy=True, viewonly=True, order_by='OrderEvent.id',
+                             primaryjoin='OrderArchive.id == foreign(OrderEvent.order_id)')
+
+    # Keyset listing merged into the admin orders page
+    __table_args__ = (db.Index('ix_order_archive_created_at_id', created_at.desc(), id.desc()),)
+
+    subtotal = money_property('subtotal_minor', lambda o: o.currency)
+    total = money_property('total_minor', lambda o: o.currency)
+    is_archived = True
+
+class OrderItemArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price_minor = db.Column(db.BigInteger, nullable=False)
+    total_minor = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # the order's, for partitioning
+
+    product = db.relationship('Product')
+
+    price = money_property('price_minor', lambda i: i.order.currency if i.order else DEFAULT_CURRENCY)
+    total = money_property('total_minor', lambda i: i.order.currency if i.order else DEFAULT_CURRENCY)
+
+class PaymentArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    payment_method = db.Column(db.String(50), nullable=False)
+    amount_minor = db.Column(db.BigInteger, nullable=False)
+    currency = db.Column(db.String(3))
+    status = db.Column(db.String(20))
+    transaction_id = db.Column(db.String(100), index=True)
+    gateway_status = db.Column(db.String(30))
+    created_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    archived_payload = db.relationship('GatewayPayload', uselist=False, lazy='select', viewonly=True,
+                                       primaryjoin='PaymentArchive.id == foreign(GatewayPayload.payment_id)')
+
+    __table_args__ = (db.Index('ix_payment_archive_created_at_id', created_at.desc(), id.desc()),)
+
+    amount = money_property('amount_minor', lambda p: p.currency)
+    is_archived = True
+
+# Daily totals of archived rows, maintained by retention.py as rows move, so
+# statistics add them to what is still in the hot tables instead of scanning
+# the archive.
+
+class OrderRollup(db.Model):
+    store_id = db.Column(db.Integer, db.ForeignKey('store.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    total_minor = db.Column(db.BigInteger, nullable=False, default=0)
+
+class ProductSalesRollup(db.Model):
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class PaymentRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    payments = db.Column(db.Integer, nullable=False, default=0)
+    amount_minor = db.Column(db.BigInteger, nullable=False, default=0)
@@ -0,0 +1,98 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Amounts are stored as integers in the currency's minor unit (cents for
+# USD), so sums are exact and the database can SUM them directly.
+DEFAULT_CURRENCY = 'USD'
+MINOR_UNITS = {
+    'USD': 2,
+    'SLS': 0,
+}
+
+# Currencies shoppers can pick. 'SLS' is the Somaliland shilling (SLSH),
+# which has no ISO code; it is priced in whole shillings.
+SUPPORTED_CURRENCIES = ('USD', 'SLS')
+
+
+def minor_exponent(currency):
+    return MINOR_UNITS.get((currency or DEFAULT_CURRENCY).upper(), 2)
+
+
+def to_minor(amount, currency=DEFAULT_CURRENCY):
+    """Convert a major-unit amount (Decimal, str, int or float) to an int"""
+    if amount is None:
+        return None
+    if isinstance(amount, float):
+        # Go through str so 19.99 stays 19.99 rather than 19.989999...
+        amount = str(amount)
+    exponent = minor_exponent(currency)
+    return int((Decimal(amount) * (10 ** exponent)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor, currency=DEFAULT_CURRENCY):
+    """Convert integer minor units back to a Decimal amount"""
+    if minor is None:
+        return None
+    return Decimal(int(minor)).scaleb(-minor_exponent(currency))
+
+
+class Money:
+    """An exact amount of one currency, held in minor units"""
+    __slots__ = ('minor', 'currency')
+
+    def __init__(self, minor=0, currency=DEFAULT_CURRENCY):
+        self.minor = int(minor)
+        self.currency = currency.upper()
+
+    @classmethod
+    def from_amount(cls, amount, currency=DEFAULT_CURRENCY):
+        return cls(to_minor(amount, currency), currency)
+
+    @property
+    def amount(self):
+        return from_minor(self.minor, self.currency)
+
+    def _check(self, other):
+        if other.currency != self.currency:
+            raise ValueError(f'Cannot combine {self.currency} and {other.currency}')
+
+    def __add__(self, other):
+        if other == 0:
+            return self
+        self._check(other)
+        return Money(self.minor + other.minor, self.currency)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        self._check(other)
+        return Money(self.minor - other.minor, self.currency)
+
+    def __mul__(self, quantity):
+        if not isinstance(quantity, int):
+            raise TypeError('Money can only be multiplied by an integer quantity')
+        return Money(self.minor * quantity, self.currency)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.minor == other.minor and self.currency == other.currency
+        if other == 0:
+            return self.minor == 0
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.minor, self.currency))
+
+    def __lt__(self, other):
+        self._check(other)
+        return self.minor < other.minor
+
+    def __bool__(self):
+        return self.minor != 0
+
+    def __repr__(self):
+        return f'Money({self.minor}, {self.currency!r})'
+
+    def __str__(self):
+        return f'{self.amount} {self.currency}'
@@ -0,0 +1,272 @@
+from threading import Lock, Thread
+import json
+import logging
+import queue
+import select
+import time
+
+from events import bus, snapshot, register_consumer, Event, ORDER_CREATED, ORDER_STATUS_CHANGED, \
+    PAYMENT_RECORDED, PAYMENT_STATUS_CHANGED
+
+logger = logging.getLogger('notifications')
+
+# Events merchants see live on their dashboard
+NOTIFY_EVENT_TYPES = (ORDER_CREATED, ORDER_STATUS_CHANGED, PAYMENT_RECORDED, PAYMENT_STATUS_CHANGED)
+
+# Postgres channel used to fan events out to every worker process
+PG_CHANNEL = 'order_events'
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Live order notifications for merchant dashboards. Each open dashboard
+# holds one server-sent events stream; the broker below hands it the
+# committed events of the merchant's stores. Streams end after a while and
+# the browser reconnects with Last-Event-ID, so nothing logged in between
+# is lost and no worker thread is held forever.
+
+
+class TooManyListeners(Exception):
+    """This worker already holds its maximum number of open streams"""
+
+
+class Subscription:
+    def __init__(self, broker, store_ids):
+        self.broker = broker
+        self.store_ids = frozenset(store_ids)
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def get(self, timeout):
+        """Next event for this subscriber, or None after timeout seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """Leave the broker; safe to call more than once"""
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+
+class Broker:
+    """Fans committed order events out to the open streams of this worker"""
+
+    def __init__(self):
+        self._by_store = {}
+        self._count = 0
+        self._lock = Lock()
+
+    def subscribe(self, store_ids, max_listeners):
+        with self._lock:
+            if self._count >= max_listeners:
+                raise TooManyListeners()
+            subscription = Subscription(self, store_ids)
+            for store_id in subscription.store_ids:
+                self._by_store.setdefault(store_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for store_id in subscription.store_ids:
+                listeners = self._by_store.get(store_id)
+                if listeners and subscription in listeners:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._by_store[store_id]
+            self._count -= 1
+
+    def publish(self, event):
+        with self._lock:
+            listeners = list(self._by_store.get(event.store_id, ()))
+        for subscription in listeners:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # A stalled client loses live events; it catches up from the
+                # log when it reconnects with Last-Event-ID
+                pass
+
+
+broker = Broker()
+
+
+def event_to_json(event):
+    return json.dumps({
+        'id': event.id,
+        'type': event.type,
+        'order_id': event.order_id,
+        'store_id': event.store_id,
+        'old_status': event.old_status,
+        'new_status': event.new_status,
+        'data': event.data,
+        'created_at': event.created_at.isoformat() if event.created_at else None,
+    }, default=str)
+
+
+def event_from_json(text):
+    from datetime import datetime
+    raw = json.loads(text)
+    created_at = datetime.fromisoformat(raw['created_at']) if raw.get('created_at') else None
+    return Event(raw['id'], raw['type'], raw['order_id'], raw['store_id'], raw['old_status'],
+                 raw['new_status'], raw.get('data') or {}, created_at)
+
+
+def events_since(store_ids, last_event_id, limit=100):
+    """Events for store_ids logged after last_event_id (used on reconnect)"""
+    from models import OrderEvent
+    rows = OrderEvent.query.filter(
+        OrderEvent.id > last_event_id,
+        OrderEvent.store_id.in_(store_ids),
+        OrderEvent.event_type.in_(NOTIFY_EVENT_TYPES)
+    ).order_by(OrderEvent.id).limit(limit).all()
+    return [snapshot(row) for row in rows]
+
+
+class PostgresListener(Thread):
+    """LISTENs on PG_CHANNEL and hands notifications to the local broker"""
+
+    def __init__(self, engine):
+        super().__init__(name='order-event-listener', daemon=True)
+        self.engine = engine
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except Exception:
+                logger.exception('Order event listener lost its connection, reconnecting')
+
+    def listen(self):
+        connection = self.engine.raw_connection()
+        try:
+            dbapi = connection.driver_connection if hasattr(connection, 'driver_connection') \
+                else connection.connection
+            dbapi.set_session(autocommit=True)
+            cursor = dbapi.cursor()
+            cursor.execute(f'LISTEN {PG_CHANNEL}')
+            while True:
+                if select.select([dbapi], [], [], 60) == ([], [], []):
+                    continue
+                dbapi.poll()
+                while dbapi.notifies:
+                    note = dbapi.notifies.pop(0)
+                    try:
+                        broker.publish(event_from_json(note.payload))
+                    except (ValueError, KeyError):
+                        logger.warning('Ignoring malformed order event notification')
+        finally:
+            connection.close()
+
+
+_listener = None
+_listener_lock = Lock()
+
+
+def is_postgres(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql')
+
+
+def ensure_listener(app, db):
+    """Start this worker's LISTEN thread on first use (after gunicorn has forked)"""
+    global _listener
+    if not is_postgres(app):
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = PostgresListener(db.engine)
+            _listener.start()
+
+
+def sse(event):
+    return f'id: {event.id}\nevent: {event.type}\ndata: {event_to_json(event)}\n\n'
+
+
+def order_stream(subscription, backlog, heartbeat, lifetime):
+    """Yield SSE frames: the backlog first, then live events until lifetime runs out.
+
+    The caller closes the subscription (with response.call_on_close): a
+    generator's finally never runs if the client goes away before the first
+    frame is pulled.
+    """
+    last_id = 0
+    # Tell the browser how long to wait before reconnecting
+    yield 'retry: 3000\n\n'
+    for event in backlog:
+        last_id = event.id
+        yield sse(event)
+    deadline = time.monotonic() + lifetime
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        event = subscription.get(min(heartbeat, remaining))
+        if event is None:
+            # Comment line keeps proxies from closing an idle connection
+            yield ': keep-alive\n\n'
+        elif event.id > last_id:
+            last_id = event.id
+            yield sse(event)
+
+
+def init_notifications(app, db):
+    """Feed committed order events to the live streams.
+
+    On Postgres every committing transaction also NOTIFYs the events, so
+    streams held by any worker (or events from other processes) are
+    delivered; elsewhere only this worker's own commits reach its streams.
+    """
+    from sqlalchemy import event, text
+
+    if is_postgres(app):
+        @event.listens_for(db.session, 'before_commit')
+        def notify_events(session):
+            # Flush now so this transaction's events have been collected
+            session.flush()
+            for item in session.info.get('order_events', ()):
+                if item.type in NOTIFY_EVENT_TYPES:
+                    session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                                    {'channel': PG_CHANNEL, 'payload': event_to_json(item)})
+    else:
+        bus.subscribe(broker.publish, NOTIFY_EVENT_TYPES)
+
+
+# New order emails, for merchants who are not watching their dashboard.
+# A durable consumer of the event log (`python events.py run`): it mails
+# once per store per batch, and starts from the end of the log on its first
+# run rather than mailing the whole history. A crash between sending and
+# saving the offset can send one batch twice.
+
+@register_consumer('merchant_order_emails', event_types=[ORDER_CREATED], from_start=False)
+def merchant_order_emails(events):
+    from collections import defaultdict
+    from flask import current_app
+    from flask_mail import Message
+    from app import db, mail
+    from models import Store, User
+    from money import DEFAULT_CURRENCY
+    from rates import format_money
+
+    by_store = defaultdict(list)
+    for event in events:
+        by_store[event.store_id].append(event)
+    owners = db.session.query(Store.id, Store.name, User.email) \
+        .join(User, Store.owner_id == User.id).filter(Store.id.in_(by_store))
+    for store_id, store_name, email in owners:
+        lines = '\n'.join(
+            f"- {e.data.get('order_number') or f'#{e.order_id}'}: "
+            f"{format_money(e.data.get('total_minor'), e.data.get('currency') or DEFAULT_CURRENCY)}"
+            for e in by_store[store_id])
+        count = len(by_store[store_id])
+        msg = Message(f'{count} new order(s) at {store_name}',
+                      sender=current_app.config['MAIL_USERNAME'],
+                      recipients=[email])
+        msg.body = f'''New orders at {store_name}:
+
+{lines}
+
+Open your dashboard to confirm and ship them.
+'''
+        mail.send(msg)
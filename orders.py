@@ -0,0 +1,99 @@
+from sqlalchemy.exc import IntegrityError
+from threading import Lock
+import secrets
+import time
+
+# Order numbers are "ORD-" plus 16 Crockford base32 characters encoding a
+# 50 bit millisecond timestamp and a 30 bit sequence. New numbers sort after
+# old ones, so inserts land at the right-hand edge of the unique index
+# instead of at random pages, and they still fit the 20 character column.
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_SEQ_BITS = 30
+_SEQ_MASK = (1 << _SEQ_BITS) - 1
+
+_lock = Lock()
+_last_ms = 0
+_last_seq = 0
+
+ORDER_INSERT_ATTEMPTS = 3
+
+
+def _encode(value, length=16):
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def generate_order_number():
+    """Return a new time-ordered order number"""
+    global _last_ms, _last_seq
+    with _lock:
+        ms = int(time.time() * 1000)
+        if ms <= _last_ms:
+            # Same millisecond (or clock went back): keep ordering by bumping
+            # the sequence, rolling into the next millisecond if it overflows
+            ms = _last_ms
+            seq = _last_seq + 1
+            if seq > _SEQ_MASK:
+                ms += 1
+                seq = secrets.randbits(_SEQ_BITS - 1)
+        else:
+            # Random start in the lower half leaves room to count upwards and
+            # keeps other workers from picking the same value
+            seq = secrets.randbits(_SEQ_BITS - 1)
+        _last_ms, _last_seq = ms, seq
+    return f"ORD-{_encode((ms << _SEQ_BITS) | seq)}"
+
+
+def _is_order_number_collision(error):
+    return 'order_number' in str(error.orig)
+
+
+def place_order(order, items):
+    """Insert order with its items and take the items out of stock.
+
+    items is a list of dicts with product, quantity, total_minor and (when the
+    order is not in the catalog currency) the converted price_minor. The order row
+    is flushed first (retrying with a fresh number on the rare order_number
+    collision), then all items go in as a single executemany INSERT and the
+    stock comes out through the inventory ledger. Commits on success.
+    """
+    from app import db
+    from models import OrderItem
+    from events import record_event, ORDER_CREATED
+    from inventory import take_order_stock
+    from money import minor_exponent
+
+    for attempt in range(ORDER_INSERT_ATTEMPTS):
+        try:
+            with db.session.begin_nested():
+                db.session.add(order)
+                db.session.flush()
+            break
+        except IntegrityError as e:
+            if not _is_order_number_collision(e) or attempt == ORDER_INSERT_ATTEMPTS - 1:
+                db.session.rollback()
+                raise
+            order.order_number = generate_order_number()
+
+    if items:
+        db.session.execute(OrderItem.__table__.insert(), [
+            {
+                'order_id': order.id,
+                'product_id': item['product'].id,
+                'quantity': item['quantity'],
+                'price_minor': item.get('price_minor', item['product'].price_minor),
+                'total_minor': item['total_minor'],
+            }
+            for item in items
+        ])
+        take_order_stock(db, order.id, items)
+
+    # exponent lets consumers (the dashboard's live toasts) format total_minor
+    record_event(order, ORDER_CREATED, new_status=order.status, order_number=order.order_number,
+                 total_minor=order.total_minor, currency=order.currency,
+                 exponent=minor_exponent(order.currency), items=len(items))
+    db.session.commit()
+    return order
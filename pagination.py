@@ -0,0 +1,130 @@
+from threading import Lock
+from sqlalchemy import and_, or_, text
+import base64
+import time
+from datetime import datetime
+
+from app import db
+
+# Cached COUNT(*) results used when the database has no cheap estimate
+APPROX_COUNT_TTL = 300
+
+_count_cache = {}
+_count_lock = Lock()
+
+
+def encode_cursor(created_at, id):
+    raw = f'{created_at.isoformat()}|{id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) for a cursor, or None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of a (created_at, id) descending keyset listing"""
+
+    def __init__(self, items, next_cursor, prev_cursor, per_page, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _page_rows(query, model, after_key, before_key, limit):
+    created_at, id = model.created_at, model.id
+    if before_key:
+        c, i = before_key
+        query = query.filter(or_(created_at > c, and_(created_at == c, id > i)))
+        return query.order_by(created_at.asc(), id.asc()).limit(limit).all()
+    if after_key:
+        c, i = after_key
+        query = query.filter(or_(created_at < c, and_(created_at == c, id < i)))
+    return query.order_by(created_at.desc(), id.desc()).limit(limit).all()
+
+
+def keyset_paginate(query, model, after=None, before=None, per_page=20, total=None, archive=None):
+    """Page through query newest first without OFFSET or COUNT(*).
+
+    `after` continues past the last row of the previous page, `before` goes
+    back from the first row of the current one. Both are cursors produced
+    by this function. One extra row is fetched to know whether there is
+    another page in that direction.
+
+    archive is an optional (query, model, newest) over an archive table
+    sharing ids with model, whose rows are no newer than newest. Its rows
+    are merged in, and it is only read by pages reaching back that far.
+    """
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before) if not after_key else None
+
+    rows = _page_rows(query, model, after_key, before_key, per_page + 1)
+    if archive and archive[2] is not None:
+        archive_query, archive_model, newest = archive
+        if before_key:
+            reaches = before_key[0] <= newest
+        else:
+            reaches = len(rows) <= per_page or rows[-1].created_at <= newest
+        if reaches:
+            rows = sorted(rows + _page_rows(archive_query, archive_model, after_key, before_key, per_page + 1),
+                          key=lambda row: (row.created_at, row.id), reverse=not before_key)[:per_page + 1]
+
+    if before_key:
+        more_before = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        more_after = True
+    else:
+        more_after = len(rows) > per_page
+        items = rows[:per_page]
+        more_before = after_key is not None
+
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if items and more_after else None
+    prev_cursor = encode_cursor(items[0].created_at, items[0].id) if items and more_before else None
+    return KeysetPage(items, next_cursor, prev_cursor, per_page, total)
+
+
+def approximate_count(model):
+    """Row count for model's table from planner statistics or a cached COUNT(*)"""
+    table = model.__table__.name
+    now = time.monotonic()
+    with _count_lock:
+        entry = _count_cache.get(table)
+    if entry and entry[0] > now:
+        return entry[1]
+
+    count = None
+    if db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE relname = :table'),
+            {'table': table}
+        ).scalar()
+        # reltuples is -1 (or 0) until the table has been analyzed
+        if estimate and estimate > 0:
+            count = estimate
+    if count is None:
+        count = db.session.query(db.func.count(model.id)).scalar()
+
+    with _count_lock:
+        _count_cache[table] = (now + APPROX_COUNT_TTL, count)
+    return count
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+from werkzeug.security import generate_password_hash, check_password_hash
+import os
+
+# Werkzeug's hashes are deliberately slow. Hashing runs on a small shared
+# pool (hashlib releases the GIL while it works) and the number of requests
+# allowed to wait for it is capped, so a burst of logins is turned away
+# quickly instead of tying up every worker thread.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 8))
+HASH_WAIT_SECONDS = float(os.environ.get('PASSWORD_HASH_WAIT', 2))
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='pwhash')
+_slots = BoundedSemaphore(HASH_QUEUE)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated"""
+
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=HASH_WAIT_SECONDS):
+        raise HashingBusy()
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    """Hash password with the current method on the hashing pool"""
+    return _run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    """Check password against password_hash on the hashing pool"""
+    return _run(check_password_hash, password_hash, password)
+
+
+_method_prefix = None
+
+
+def _current_method():
+    """PASSWORD_HASH_METHOD as werkzeug spells it in a hash.
+
+    werkzeug fills in defaults ('scrypt' -> 'scrypt:32768:8:1', 'pbkdf2' ->
+    'pbkdf2:sha256:600000'), so the setting itself cannot be compared with
+    stored hashes. Hashing once and reading the prefix back follows whatever
+    the installed werkzeug does.
+    """
+    global _method_prefix
+    if _method_prefix is None:
+        _method_prefix = generate_password_hash('', PASSWORD_HASH_METHOD).split('$', 1)[0]
+    return _method_prefix
+
+
+def needs_rehash(password_hash):
+    """True if password_hash was made with different hash parameters"""
+    return password_hash.split('$', 1)[0] != _current_method()
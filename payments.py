@@ -1,40 +1,64 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, session
 from flask_login import login_required, current_user
 from app import db
 from models import Order, Payment
+from events import record_payment
+from fulfillment import mark_order_paid
+from gateway_archive import archive_payload
 import stripe
 import paypalrestsdk
 import requests
-import json
 
 payments_bp = Blueprint('payments', __name__)
 
+# Card gateways cannot charge Somaliland shillings; mobile money takes both
+CARD_CURRENCIES = {'USD'}
+
+def unsupported_currency(order, gateway):
+    return jsonify({'error': f'{gateway} cannot charge {order.currency}. Please pay with mobile money.'}), 400
+
+def already_recorded(method, transaction_id):
+    """Gateways retry callbacks; a payment is only recorded once"""
+    return db.session.query(Payment.id).filter_by(payment_method=method, transaction_id=transaction_id).first() is not None
+
+def settle_order(order, payment, payload):
+    """Record a completed gateway payment and mark its order paid.
+
+    An order that can no longer take payment (cancelled and restocked,
+    or already shipped) keeps its status; the payment is stored as
+    refund_due so the money can be sent back.
+    """
+    if not mark_order_paid(db, order, source=payment.payment_method):
+        current_app.logger.warning('%s payment %s for order %s arrived while it was %s; flagged for refund',
+                                   payment.payment_method, payment.transaction_id, order.order_number, order.status)
+        payment.status = 'refund_due'
+    db.session.add(payment)
+    archive_payload(payment, payload)
+    record_payment(payment, order)
+    db.session.commit()
+    return payment.status == 'completed'
+
 # Stripe config iyo PayPal config waa in lagu sameeyaa create_app() ee app.py, ha isticmaalin current_app banaanka function.
 # Haddii aad u baahan tahay config, isticmaal gudaha function sida:
 # from flask import current_app
 # def some_func():
 #     key = current_app.config['PAYPAL_CLIENT_ID']
 
-paypalrestsdk.configure({
-    "mode": "sandbox",  # Change to "live" for production
-    "client_id": current_app.config['PAYPAL_CLIENT_ID'],
-    "client_secret": current_app.config['PAYPAL_CLIENT_SECRET']
-})
-
 @payments_bp.route('/payment/stripe/create-payment-intent', methods=['POST'])
 def create_stripe_payment_intent():
     """Create Stripe payment intent"""
     try:
         data = request.get_json()
         order_id = data.get('order_id')
-        amount = data.get('amount')
         
         order = Order.query.get_or_404(order_id)
+        if order.currency not in CARD_CURRENCIES:
+            return unsupported_currency(order, 'Stripe')
         
-        # Create payment intent
+        # Create payment intent; Stripe takes the amount in minor units
         intent = stripe.PaymentIntent.create(
-            amount=int(amount * 100),  # Convert to cents
-            currency='usd',
+            amount=order.total_minor,
+            currency=order.currency.lower(),
             metadata={'order_id': order_id}
         )
         
@@ -65,21 +89,16 @@ def stripe_webhook():
         
         # Update order and payment status
         order = Order.query.get(order_id)
-        if order:
-            order.status = 'paid'
-            
+        if order and not already_recorded('stripe', payment_intent['id']):
             payment = Payment(
                 order_id=order_id,
                 payment_method='stripe',
-                amount=payment_intent['amount'] / 100,
-                currency='usd',
+                amount_minor=payment_intent['amount'],
+                currency=payment_intent['currency'].upper(),
                 status='completed',
-                transaction_id=payment_intent['id'],
-                gateway_response=json.dumps(payment_intent)
+                transaction_id=payment_intent['id']
             )
-            
-            db.session.add(payment)
-            db.session.commit()
+            settle_order(order, payment, payment_intent)
     
     return jsonify({'status': 'success'})
 
@@ -89,9 +108,11 @@ def create_paypal_payment():
     try:
         data = request.get_json()
         order_id = data.get('order_id')
-        amount = data.get('amount')
         
         order = Order.query.get_or_404(order_id)
+        if order.currency not in CARD_CURRENCIES:
+            return unsupported_currency(order, 'PayPal')
+        amount = order.total
         
         payment = paypalrestsdk.Payment({
             "intent": "sale",
@@ -108,13 +129,13 @@ def create_paypal_payment():
                         "name": f"Order {order.order_number}",
                         "sku": order.order_number,
                         "price": str(amount),
-                        "currency": "USD",
+                        "currency": order.currency,
                         "quantity": 1
                     }]
                 },
                 "amount": {
                     "total": str(amount),
-                    "currency": "USD"
+                    "currency": order.currency
                 },
                 "description": f"Payment for order {order.order_number}"
             }]
@@ -150,23 +171,22 @@ def paypal_success():
     if payment.execute({"payer_id": request.args.get('PayerID')}):
         # Payment successful
         order = Order.query.get(order_id)
-        if order:
-            order.status = 'paid'
-            
+        if order and already_recorded('paypal', payment_id):
+            flash('Payment completed successfully!', 'success')
+        elif order:
             payment_record = Payment(
                 order_id=order_id,
                 payment_method='paypal',
-                amount=float(payment.transactions[0].amount.total),
-                currency='usd',
+                currency=payment.transactions[0].amount.currency,
+                amount=payment.transactions[0].amount.total,
                 status='completed',
-                transaction_id=payment_id,
-                gateway_response=json.dumps(payment.to_dict())
+                transaction_id=payment_id
             )
             
-            db.session.add(payment_record)
-            db.session.commit()
-            
-            flash('Payment completed successfully!', 'success')
+            if settle_order(order, payment_record, payment.to_dict()):
+                flash('Payment completed successfully!', 'success')
+            else:
+                flash('This order can no longer be paid; your payment will be refunded.', 'warning')
         else:
             flash('Order not found', 'error')
     else:
@@ -192,15 +212,16 @@ def initiate_evc_plus_payment():
     try:
         data = request.get_json()
         order_id = data.get('order_id')
-        amount = data.get('amount')
         phone = data.get('phone')
         
         order = Order.query.get_or_404(order_id)
+        amount = order.total
         
         # EVC Plus API call (example - replace with actual API)
-        api_url = "https://api.evcplus.com/payment/initiate"
+        api_url = f"{current_app.config['EVC_PLUS_API_URL']}/payment/initiate"
         payload = {
-            "amount": amount,
+            "amount": str(amount),
+            "currency": order.currency,
             "phone": phone,
             "reference": order.order_number,
             "description": f"Payment for order {order.order_number}"
@@ -211,7 +232,8 @@ def initiate_evc_plus_payment():
             "Content-Type": "application/json"
         }
         
-        response = requests.post(api_url, json=payload, headers=headers)
+        response = requests.post(api_url, json=payload, headers=headers,
+                                 timeout=current_app.config['GATEWAY_TIMEOUT'])
         
         if response.status_code == 200:
             result = response.json()
@@ -220,14 +242,15 @@ def initiate_evc_plus_payment():
             payment = Payment(
                 order_id=order_id,
                 payment_method='evc_plus',
-                amount=amount,
-                currency='usd',
+                amount_minor=order.total_minor,
+                currency=order.currency,
                 status='pending',
-                transaction_id=result.get('transaction_id'),
-                gateway_response=json.dumps(result)
+                transaction_id=result.get('transaction_id')
             )
             
             db.session.add(payment)
+            archive_payload(payment, result)
+            record_payment(payment, order)
             db.session.commit()
             
             return jsonify({
@@ -247,15 +270,16 @@ def initiate_golis_saad_payment():
     try:
         data = request.get_json()
         order_id = data.get('order_id')
-        amount = data.get('amount')
         phone = data.get('phone')
         
         order = Order.query.get_or_404(order_id)
+        amount = order.total
         
         # Golis Saad API call (example - replace with actual API)
-        api_url = "https://api.golissaad.com/payment/initiate"
+        api_url = f"{current_app.config['GOLIS_SAAD_API_URL']}/payment/initiate"
         payload = {
-            "amount": amount,
+            "amount": str(amount),
+            "currency": order.currency,
             "phone": phone,
             "reference": order.order_number,
             "description": f"Payment for order {order.order_number}"
@@ -266,7 +290,8 @@ def initiate_golis_saad_payment():
             "Content-Type": "application/json"
         }
         
-        response = requests.post(api_url, json=payload, headers=headers)
+        response = requests.post(api_url, json=payload, headers=headers,
+                                 timeout=current_app.config['GATEWAY_TIMEOUT'])
         
         if response.status_code == 200:
             result = response.json()
@@ -274,14 +299,15 @@ def initiate_golis_saad_payment():
             payment = Payment(
                 order_id=order_id,
                 payment_method='golis_saad',
-                amount=amount,
-                currency='usd',
+                amount_minor=order.total_minor,
+                currency=order.currency,
                 status='pending',
-                transaction_id=result.get('transaction_id'),
-                gateway_response=json.dumps(result)
+                transaction_id=result.get('transaction_id')
             )
             
             db.session.add(payment)
+            archive_payload(payment, result)
+            record_payment(payment, order)
             db.session.commit()
             
             return jsonify({
@@ -301,15 +327,16 @@ def initiate_edahab_payment():
     try:
         data = request.get_json()
         order_id = data.get('order_id')
-        amount = data.get('amount')
         phone = data.get('phone')
         
         order = Order.query.get_or_404(order_id)
+        amount = order.total
         
         # Edahab API call (example - replace with actual API)
-        api_url = "https://api.edahab.com/payment/initiate"
+        api_url = f"{current_app.config['EDAHAB_API_URL']}/payment/initiate"
         payload = {
-            "amount": amount,
+            "amount": str(amount),
+            "currency": order.currency,
             "phone": phone,
             "reference": order.order_number,
             "description": f"Payment for order {order.order_number}"
@@ -320,7 +347,8 @@ def initiate_edahab_payment():
             "Content-Type": "application/json"
         }
         
-        response = requests.post(api_url, json=payload, headers=headers)
+        response = requests.post(api_url, json=payload, headers=headers,
+                                 timeout=current_app.config['GATEWAY_TIMEOUT'])
         
         if response.status_code == 200:
             result = response.json()
@@ -328,14 +356,15 @@ def initiate_edahab_payment():
             payment = Payment(
                 order_id=order_id,
                 payment_method='edahab',
-                amount=amount,
-                currency='usd',
+                amount_minor=order.total_minor,
+                currency=order.currency,
                 status='pending',
-                transaction_id=result.get('transaction_id'),
-                gateway_response=json.dumps(result)
+                transaction_id=result.get('transaction_id')
             )
             
             db.session.add(payment)
+            archive_payload(payment, result)
+            record_payment(payment, order)
             db.session.commit()
             
             return jsonify({
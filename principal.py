@@ -0,0 +1,95 @@
+from flask_login import UserMixin
+from threading import Lock
+import time
+
+# How long a cached principal may be served before the user row is re-read.
+# Invalidation only reaches the worker that handled the change, so the TTL
+# bounds how stale the other workers can be.
+PRINCIPAL_TTL = 300
+PRINCIPAL_CACHE_SIZE = 10000
+
+_cache = {}
+_lock = Lock()
+
+
+class UserPrincipal(UserMixin):
+    """Compact stand-in for the logged-in User on every request.
+
+    Carries only what the request hot path needs. Any other attribute
+    (email, first_name, relationships, ...) falls through to the full
+    User row, which is loaded once per principal on first access.
+
+    No __slots__: UserMixin has none, so instances get a __dict__ anyway.
+    The saving is in skipping the ORM instance and its identity-map entry,
+    not in the size of the principal.
+    """
+
+    def __init__(self, id, username, is_admin, is_active, subscription_tier):
+        self.id = id
+        self.username = username
+        self.is_admin = bool(is_admin)
+        self._active = bool(is_active)
+        self.subscription_tier = subscription_tier
+        self._user = None
+
+    @property
+    def is_active(self):
+        return self._active
+
+    def get_user(self):
+        """Load the full User row backing this principal"""
+        if self._user is None:
+            from models import User, db
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        # Only called for attributes not on the principal itself
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def _load_fields(user_id):
+    from app import db
+    from models import User
+    row = db.session.query(
+        User.id, User.username, User.is_admin, User.is_active, User.subscription_tier
+    ).filter(User.id == user_id).first()
+    return tuple(row) if row is not None else None
+
+
+def get_principal(user_id):
+    """Return the principal for user_id, from cache when possible"""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+    if entry and entry[0] > now:
+        fields = entry[1]
+    else:
+        fields = _load_fields(user_id)
+        if fields is None:
+            return None
+        with _lock:
+            if len(_cache) >= PRINCIPAL_CACHE_SIZE:
+                # Evict the oldest entry; dicts keep insertion order
+                _cache.pop(next(iter(_cache)), None)
+            _cache[user_id] = (now + PRINCIPAL_TTL, fields)
+    # Only plain values are cached; each request gets its own principal so a
+    # lazily loaded User never outlives the session it was loaded in.
+    return UserPrincipal(*fields)
+
+
+def invalidate_principal(user_id):
+    """Drop the cached principal after the user row has changed"""
+    with _lock:
+        _cache.pop(user_id, None)
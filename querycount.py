@@ -0,0 +1,86 @@
+from functools import wraps
+from threading import local
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view or block issued more SQL statements than it was allowed"""
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.statements.append(statement)
+
+
+class QueryCounter:
+    """Record the SQL statements run on this thread inside a with block"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        if not hasattr(_local, 'counters'):
+            _local.counters = []
+        _local.counters.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _local.counters.remove(self)
+        return False
+
+
+class assert_max_queries(QueryCounter):
+    """Fail if the block runs more than max_queries statements.
+
+    For local regression checks, e.g. rendering a page with the test client:
+
+        with assert_max_queries(4):
+            client.get('/dashboard')
+    """
+
+    def __init__(self, max_queries):
+        super().__init__()
+        self.max_queries = max_queries
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        if exc_type is None and self.count > self.max_queries:
+            raise QueryBudgetExceeded(_describe(self.count, self.max_queries, self.statements))
+        return False
+
+
+def _describe(count, max_queries, statements):
+    lines = [f'{count} queries run, budget is {max_queries}:']
+    lines += [f'  {i}. {s}' for i, s in enumerate(statements, 1)]
+    return '\n'.join(lines)
+
+
+def query_budget(max_queries):
+    """Declare how many queries a view may run to render its page.
+
+    Going over the budget raises QueryBudgetExceeded when the app is in
+    debug or testing mode (or QUERY_BUDGET_STRICT is set), so N+1 regressions
+    fail local runs; in production it only logs a warning.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with QueryCounter() as counter:
+                rv = f(*args, **kwargs)
+            if counter.count > max_queries:
+                message = f'{f.__name__}: ' + _describe(counter.count, max_queries, counter.statements)
+                if current_app.debug or current_app.testing or current_app.config.get('QUERY_BUDGET_STRICT'):
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return rv
+        return decorated_function
+    return decorator
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Subscription tier quotas for Take App
+Usage is kept in maintained counters (usage_counter rows) that are bumped
+in the same transaction as the insert they guard, so enforcing a limit is
+a single conditional UPDATE instead of a COUNT(*) per request. Deleting a
+store or product gives its count back in the deleting transaction.
+
+Scheduled maintenance:
+    python quotas.py expire    # downgrade lapsed subscriptions to free
+    python quotas.py rebuild   # recompute every counter from the tables
+"""
+
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+import argparse
+
+# None means unlimited
+TIER_LIMITS = {
+    'free': {'stores': 1, 'products': 25, 'orders': 100},
+    'basic': {'stores': 3, 'products': 500, 'orders': 2000},
+    'premium': {'stores': None, 'products': None, 'orders': None},
+}
+
+# Metrics counted per calendar month; the others are running totals
+MONTHLY_METRICS = {'orders'}
+
+METRIC_LABELS = {'stores': 'stores', 'products': 'products', 'orders': 'orders this month'}
+
+
+class QuotaExceeded(Exception):
+    """The owner's subscription tier does not allow any more of metric"""
+
+    def __init__(self, metric, limit, tier):
+        self.metric = metric
+        self.limit = limit
+        self.tier = tier
+        super().__init__(f'The {tier} plan allows {limit} {METRIC_LABELS[metric]}. '
+                         f'Upgrade your plan to add more.')
+
+
+def tier_limit(tier, metric):
+    return TIER_LIMITS.get(tier or 'free', TIER_LIMITS['free'])[metric]
+
+
+def current_period(metric, now=None):
+    if metric in MONTHLY_METRICS:
+        return (now or datetime.utcnow()).strftime('%Y-%m')
+    return ''
+
+
+def consume(user_id, tier, metric, amount=1):
+    """Count amount more of metric for user_id, or raise QuotaExceeded.
+
+    Runs in the caller's transaction; commit it together with the rows
+    being created. Bulk paths pass the whole batch size as amount.
+    """
+    from app import db
+    from models import UsageCounter
+
+    limit = tier_limit(tier, metric)
+    period = current_period(metric)
+    counter = UsageCounter.__table__
+    match = [counter.c.user_id == user_id, counter.c.metric == metric, counter.c.period == period]
+    guard = [counter.c.value + amount <= limit] if limit is not None else []
+
+    for attempt in range(2):
+        result = db.session.execute(
+            counter.update().where(*match, *guard).values(value=counter.c.value + amount)
+        )
+        if result.rowcount:
+            return
+
+        # Either the counter row does not exist yet or the update hit the limit
+        exists = db.session.query(UsageCounter.value).filter_by(
+            user_id=user_id, metric=metric, period=period).first()
+        if exists is not None or (limit is not None and amount > limit):
+            raise QuotaExceeded(metric, limit, tier or 'free')
+        try:
+            with db.session.begin_nested():
+                db.session.execute(counter.insert().values(
+                    user_id=user_id, metric=metric, period=period, value=amount))
+            return
+        except IntegrityError:
+            # Someone else created the row first; go round and update it
+            continue
+    raise QuotaExceeded(metric, limit, tier or 'free')
+
+
+def release(connection, user_id, metric, amount=1):
+    """Give back amount of a running metric (a store or product was deleted)"""
+    from models import UsageCounter
+    counter = UsageCounter.__table__
+    connection.execute(
+        counter.update()
+        .where(counter.c.user_id == user_id, counter.c.metric == metric,
+               counter.c.period == current_period(metric), counter.c.value >= amount)
+        .values(value=counter.c.value - amount)
+    )
+
+
+def init_quotas(db):
+    """Release the running counters when stores and products are deleted"""
+    from sqlalchemy import event
+    from models import Store, Product
+
+    @event.listens_for(Store, 'after_delete')
+    def release_store(mapper, connection, store):
+        release(connection, store.owner_id, 'stores')
+
+    @event.listens_for(Product, 'after_delete')
+    def release_product(mapper, connection, product):
+        # Flushed before its store (if that goes too), so the owner is still there
+        owner_id = connection.execute(
+            db.select(Store.owner_id).where(Store.id == product.store_id)).scalar()
+        if owner_id is not None:
+            release(connection, owner_id, 'products')
+
+
+def expire_subscriptions(db, now=None):
+    """Downgrade every lapsed paid subscription to free in one UPDATE"""
+    from models import User
+    user = User.__table__
+    result = db.session.execute(
+        user.update()
+        .where(user.c.subscription_tier != 'free',
+               user.c.subscription_expires.isnot(None),
+               user.c.subscription_expires < (now or datetime.utcnow()))
+        .values(subscription_tier='free')
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def rebuild_counters(db):
+    """Recompute the running and current-month counters from the source tables"""
+    from models import UsageCounter, Store, Product, Order
+
+    period = current_period('orders')
+    month_start = datetime.strptime(period, '%Y-%m')
+    counts = {
+        'stores': db.session.query(Store.owner_id, db.func.count(Store.id))
+            .group_by(Store.owner_id),
+        'products': db.session.query(Store.owner_id, db.func.count(Product.id))
+            .join(Product, Product.store_id == Store.id).group_by(Store.owner_id),
+        'orders': db.session.query(Store.owner_id, db.func.count(Order.id))
+            .join(Order, Order.store_id == Store.id)
+            .filter(Order.created_at >= month_start).group_by(Store.owner_id),
+    }
+
+    counter = UsageCounter.__table__
+    for metric, query in counts.items():
+        metric_period = current_period(metric)
+        db.session.execute(counter.delete().where(counter.c.metric == metric,
+                                                  counter.c.period == metric_period))
+        rows = [{'user_id': owner_id, 'metric': metric, 'period': metric_period, 'value': value}
+                for owner_id, value in query]
+        if rows:
+            db.session.execute(counter.insert(), rows)
+    db.session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Subscription quota maintenance')
+    parser.add_argument('command', choices=['expire', 'rebuild'])
+    args = parser.parse_args()
+
+    from app import app, db
+    with app.app_context():
+        if args.command == 'expire':
+            print(f'Expired {expire_subscriptions(db)} subscriptions')
+        else:
+            rebuild_counters(db)
+            print('Usage counters rebuilt')
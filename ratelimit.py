@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+
+class TokenBucket:
+    """Token count and last refill time for one key"""
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+
+class RateLimiter:
+    """Per-key token bucket limiter kept in process memory.
+
+    Each gunicorn worker keeps its own buckets, so the effective limit is
+    roughly `capacity` times the number of workers. Buckets are kept in
+    least recently used order, so a full table sheds the idlest keys first
+    rather than forgetting every limit at once.
+    """
+
+    def __init__(self, rate, capacity, max_keys=50000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def _refilled(self, bucket, now):
+        return min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+
+    def allow(self, key, cost=1):
+        """Take `cost` tokens from key's bucket; False if it is empty"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = TokenBucket(self.capacity, now)
+            else:
+                bucket.tokens = self._refilled(bucket, now)
+                bucket.updated = now
+                self._buckets.move_to_end(key)
+            if bucket.tokens < cost:
+                return False
+            bucket.tokens -= cost
+            return True
+
+    def check(self, key, cost=1):
+        """True if key's bucket holds `cost` tokens; takes none"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            return bucket is None or self._refilled(bucket, now) >= cost
+
+    def _prune(self, now):
+        # Buckets that would be full again carry no state worth keeping
+        full_after = self.capacity / self.rate
+        stale = [k for k, b in self._buckets.items() if now - b.updated >= full_after]
+        for key in stale:
+            del self._buckets[key]
+        # Then the least recently used, leaving headroom so the next
+        # inserts do not scan the table again
+        keep = self.max_keys - max(1, self.max_keys // 10)
+        while len(self._buckets) > keep:
+            self._buckets.popitem(last=False)
+
+
+def client_ip(request):
+    """Address of the client, as far as it can be trusted.
+
+    X-Forwarded-For is only believed behind the proxies counted in
+    TRUSTED_PROXIES, where create_app's ProxyFix has already put the
+    proxy-reported address in remote_addr. Without one, the header is
+    whatever the client chose to send.
+    """
+    return request.remote_addr
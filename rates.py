@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Exchange rates for Take App
+Catalog prices are kept in DEFAULT_CURRENCY. Other currencies are shown and
+charged using the rates in the local exchange_rate table: request handlers
+only read that table (through a per-worker cache), and this job is the only
+thing that talks to the rate service.
+
+    python rates.py refresh           # update rates from EXCHANGE_RATE_API_URL
+    python rates.py set SLS 8600      # set a rate by hand (e.g. the market rate)
+    python rates.py show
+
+The Somaliland shilling has no ISO code and is missing from most rate
+feeds, so its rate is usually set by hand; refresh leaves it alone.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from threading import Lock
+import argparse
+import json
+import logging
+import time
+import requests
+
+from money import DEFAULT_CURRENCY, SUPPORTED_CURRENCIES, minor_exponent
+
+logger = logging.getLogger('rates')
+
+RATES_TTL = 300
+PRICE_LIST_CACHE_SIZE = 2000
+REQUEST_TIMEOUT = 10
+
+_rates = None  # (loaded_at, version, {currency: Decimal per 1 DEFAULT_CURRENCY})
+_rates_lock = Lock()
+
+_price_lists = OrderedDict()
+_price_lists_lock = Lock()
+
+
+class RateUnavailable(Exception):
+    """No stored rate for the currency"""
+
+
+def load_rates(force=False):
+    """Rates per unit of DEFAULT_CURRENCY, read from the table at most every RATES_TTL seconds"""
+    global _rates
+    from models import ExchangeRate
+
+    with _rates_lock:
+        cached = _rates
+    if cached and not force and time.monotonic() - cached[0] < RATES_TTL:
+        return cached[1], cached[2]
+
+    table = {DEFAULT_CURRENCY: Decimal(1)}
+    for currency, rate in ExchangeRate.query.with_entities(ExchangeRate.currency, ExchangeRate.rate):
+        if rate and rate > 0:
+            table[currency] = Decimal(rate)
+    version = hash(tuple(sorted(table.items())))
+    with _rates_lock:
+        _rates = (time.monotonic(), version, table)
+    return version, table
+
+
+def has_rate(currency):
+    return currency in load_rates()[1]
+
+
+class Converter:
+    """Converts minor-unit amounts between two currencies with integer arithmetic"""
+
+    def __init__(self, from_currency, to_currency, rates):
+        if from_currency not in rates or to_currency not in rates:
+            raise RateUnavailable(to_currency if from_currency in rates else from_currency)
+        self.currency = to_currency
+        factor = rates[to_currency] / rates[from_currency] \
+            * Decimal(10) ** (minor_exponent(to_currency) - minor_exponent(from_currency))
+        self.numerator, self.denominator = factor.as_integer_ratio()
+
+    def convert(self, minor):
+        if minor is None:
+            return None
+        # Round half away from zero, like to_minor
+        scaled = abs(minor) * self.numerator * 2 + self.denominator
+        converted = scaled // (2 * self.denominator)
+        return converted if minor >= 0 else -converted
+
+    def convert_all(self, amounts):
+        """Convert a whole column of amounts in one pass"""
+        return [self.convert(minor) for minor in amounts]
+
+
+def converter(from_currency, to_currency):
+    return Converter(from_currency, to_currency, load_rates()[1])
+
+
+def to_default_currency(totals):
+    """Sum {currency: minor} totals into DEFAULT_CURRENCY minor units"""
+    rates = load_rates()[1]
+    total = 0
+    for currency, minor in totals.items():
+        try:
+            total += Converter(currency or DEFAULT_CURRENCY, DEFAULT_CURRENCY, rates).convert(minor or 0)
+        except RateUnavailable:
+            logger.warning('No exchange rate for %s, leaving it out of the total', currency)
+    return total
+
+
+def price_list(store, currency):
+    """{product_id: (price_minor, compare_price_minor)} for store's catalog in currency.
+
+    Built from the store's catalog snapshot in one pass and cached until
+    the catalog or the rates change.
+    """
+    from catalog import get_snapshot
+
+    etag, body = get_snapshot(store)
+    version, rates = load_rates()
+    key = (store.id, etag, currency, version)
+    with _price_lists_lock:
+        prices = _price_lists.get(key)
+        if prices is not None:
+            _price_lists.move_to_end(key)
+            return prices
+
+    products = json.loads(body)['products']
+    convert = Converter(DEFAULT_CURRENCY, currency, rates)
+    prices = dict(zip(
+        [p['id'] for p in products],
+        zip(convert.convert_all([p['price_minor'] for p in products]),
+            convert.convert_all([p['compare_price_minor'] for p in products]))
+    ))
+    with _price_lists_lock:
+        _price_lists[key] = prices
+        while len(_price_lists) > PRICE_LIST_CACHE_SIZE:
+            _price_lists.popitem(last=False)
+    return prices
+
+
+def set_rate(db, currency, rate, source):
+    from models import ExchangeRate
+    table = ExchangeRate.__table__
+    values = {'rate': rate, 'source': source, 'updated_at': datetime.utcnow()}
+    result = db.session.execute(table.update().where(table.c.currency == currency).values(**values))
+    if not result.rowcount:
+        db.session.execute(table.insert().values(currency=currency, **values))
+
+
+def refresh_rates(app, db):
+    """Fetch current rates for the supported currencies; returns the ones updated"""
+    url = app.config['EXCHANGE_RATE_API_URL']
+    if not url:
+        logger.info('EXCHANGE_RATE_API_URL is not set, nothing to refresh')
+        return {}
+    response = requests.get(url, params={'base': DEFAULT_CURRENCY}, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    feed = response.json().get('rates', {})
+
+    updated = {}
+    for currency in SUPPORTED_CURRENCIES:
+        if currency == DEFAULT_CURRENCY or currency not in feed:
+            continue
+        try:
+            rate = Decimal(str(feed[currency]))
+        except InvalidOperation:
+            continue
+        if rate > 0:
+            set_rate(db, currency, rate, 'feed')
+            updated[currency] = rate
+    db.session.commit()
+    return updated
+
+
+def format_money(minor, currency=DEFAULT_CURRENCY):
+    """Template helper: '1,234.50 USD', '8,600 SLS'"""
+    from money import from_minor
+    if minor is None:
+        return ''
+    return f'{from_minor(minor, currency):,} {currency}'
+
+
+def init_rates(app):
+    @app.context_processor
+    def currency_helpers():
+        return {'format_money': format_money, 'currencies': SUPPORTED_CURRENCIES}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exchange rate maintenance')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('refresh')
+    set_parser = sub.add_parser('set')
+    set_parser.add_argument('currency', choices=[c for c in SUPPORTED_CURRENCIES if c != DEFAULT_CURRENCY])
+    set_parser.add_argument('rate', type=Decimal, help=f'units per 1 {DEFAULT_CURRENCY}')
+    sub.add_parser('show')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    from app import app, db
+    with app.app_context():
+        if args.command == 'refresh':
+            for currency, rate in refresh_rates(app, db).items():
+                print(f'{currency}: {rate}')
+        elif args.command == 'set':
+            set_rate(db, args.currency, args.rate, 'manual')
+            db.session.commit()
+            print(f'{args.currency}: {args.rate}')
+        else:
+            from models import ExchangeRate
+            for row in ExchangeRate.query.order_by(ExchangeRate.currency):
+                print(f'{row.currency}: {row.rate} ({row.source}, {row.updated_at:%Y-%m-%d %H:%M})')
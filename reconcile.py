@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Mobile-money reconciliation worker for Take App
+Polls EVC Plus, Golis Saad and Edahab for the status of pending payments
+and moves the matching Payment and Order rows forward.
+
+Run it next to the web process:
+    python reconcile.py            # poll forever
+    python reconcile.py --once     # one pass over every provider
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event
+import argparse
+import logging
+import time
+import requests
+
+logger = logging.getLogger('reconcile')
+
+# payment_method -> config keys for the gateway base URL and API key
+PROVIDERS = {
+    'evc_plus': ('EVC_PLUS_API_URL', 'EVC_PLUS_API_KEY'),
+    'golis_saad': ('GOLIS_SAAD_API_URL', 'GOLIS_SAAD_API_KEY'),
+    'edahab': ('EDAHAB_API_URL', 'EDAHAB_API_KEY'),
+}
+
+# Gateway status values mapped onto Payment.status
+COMPLETED_STATUSES = {'completed', 'success', 'successful', 'paid', 'approved'}
+FAILED_STATUSES = {'failed', 'cancelled', 'canceled', 'declined', 'expired', 'rejected'}
+
+BATCH_SIZE = 100
+CONCURRENCY = 4
+REQUEST_TIMEOUT = 10
+BACKOFF_BASE = 30
+BACKOFF_MAX = 15 * 60
+
+
+class ProviderState:
+    """Back-off bookkeeping for one gateway"""
+
+    def __init__(self):
+        self.failures = 0
+        self.next_poll = 0.0
+
+    def succeeded(self):
+        self.failures = 0
+        self.next_poll = 0.0
+
+    def failed(self, now):
+        self.failures += 1
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+        self.next_poll = now + delay
+        return delay
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or answered with an error"""
+
+
+def fetch_status(api_url, api_key, transaction_id):
+    """Ask the gateway for one transaction's status; returns the raw status string"""
+    try:
+        response = requests.get(
+            f"{api_url}/payment/status/{transaction_id}",
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=REQUEST_TIMEOUT
+        )
+    except requests.RequestException as e:
+        raise GatewayError(str(e))
+    if response.status_code == 404:
+        return None
+    if response.status_code == 429 or response.status_code >= 500:
+        raise GatewayError(f'HTTP {response.status_code}')
+    if response.status_code != 200:
+        return None
+    return str(response.json().get('status', '')).lower()
+
+
+def classify(gateway_status):
+    if gateway_status in COMPLETED_STATUSES:
+        return 'completed'
+    if gateway_status in FAILED_STATUSES:
+        return 'failed'
+    return None
+
+
+def poll_provider(method, api_url, api_key, payments, pool):
+    """Poll a batch of (payment_id, order_id, transaction_id) rows.
+
+    Returns ({payment_id: new_status}, error_count). Errors count toward
+    the provider's back-off; unknown or still-pending answers are skipped.
+    """
+    futures = {
+        pool.submit(fetch_status, api_url, api_key, transaction_id): payment_id
+        for payment_id, order_id, transaction_id in payments
+    }
+    updates = {}
+    errors = 0
+    for future, payment_id in futures.items():
+        try:
+            status = classify(future.result())
+        except GatewayError as e:
+            errors += 1
+            logger.warning('%s: status check for payment %s failed: %s', method, payment_id, e)
+            continue
+        if status:
+            updates[payment_id] = status
+    return updates, errors
+
+
+def apply_updates(db, payments, updates):
+    """Write gateway results back with one UPDATE per status, logging order events"""
+    from models import Payment, Order
+    from events import record_events_bulk, ORDER_STATUS_CHANGED, PAYMENT_STATUS_CHANGED
+
+    order_ids = {payment_id: order_id for payment_id, order_id, _ in payments}
+    completed = [pid for pid, status in updates.items() if status == 'completed']
+    failed = [pid for pid, status in updates.items() if status == 'failed']
+
+    payment_table = Payment.__table__
+    order_table = Order.__table__
+    events = []
+    for payment_ids, status in ((completed, 'completed'), (failed, 'failed')):
+        if not payment_ids:
+            continue
+        # Find the rows still pending so each change gets exactly one event
+        changing = db.session.query(Payment.id, Payment.order_id, Order.store_id) \
+            .join(Order, Payment.order_id == Order.id) \
+            .filter(Payment.id.in_(payment_ids), Payment.status == 'pending').all()
+        if not changing:
+            continue
+        db.session.execute(payment_table.update()
+                           .where(payment_table.c.id.in_([row[0] for row in changing]))
+                           .values(status=status))
+        events += [{'order_id': order_id, 'store_id': store_id, 'event_type': PAYMENT_STATUS_CHANGED,
+                    'old_status': 'pending', 'new_status': status, 'data': {'payment_id': payment_id}}
+                   for payment_id, order_id, store_id in changing]
+
+    if completed:
+        # A failed payment leaves its order pending so the customer can pay another way
+        paid_orders = db.session.query(Order.id, Order.store_id).filter(
+            Order.id.in_({order_ids[pid] for pid in completed}), Order.status == 'pending').all()
+        if paid_orders:
+            db.session.execute(order_table.update()
+                               .where(order_table.c.id.in_([row[0] for row in paid_orders]))
+                               .values(status='paid'))
+            events += [{'order_id': order_id, 'store_id': store_id, 'event_type': ORDER_STATUS_CHANGED,
+                        'old_status': 'pending', 'new_status': 'paid', 'data': {'source': 'reconcile'}}
+                       for order_id, store_id in paid_orders]
+
+    record_events_bulk(events, publish=True)
+    db.session.commit()
+    return len(completed), len(failed)
+
+
+def pending_batch(db, method, after_id, limit=BATCH_SIZE):
+    from models import Payment
+    return db.session.query(Payment.id, Payment.order_id, Payment.transaction_id).filter(
+        Payment.payment_method == method,
+        Payment.status == 'pending',
+        Payment.transaction_id.isnot(None),
+        Payment.id > after_id
+    ).order_by(Payment.id).limit(limit).all()
+
+
+def reconcile_provider(app, db, method, state, pool):
+    """Walk every pending payment of one provider in batches"""
+    url_key, api_key_key = PROVIDERS[method]
+    api_url, api_key = app.config[url_key], app.config[api_key_key]
+
+    after_id = 0
+    while True:
+        payments = pending_batch(db, method, after_id)
+        # Release the read transaction while we wait on the gateway
+        db.session.rollback()
+        if not payments:
+            state.succeeded()
+            return
+
+        updates, errors = poll_provider(method, api_url, api_key, payments, pool)
+        if updates:
+            completed, failed = apply_updates(db, payments, updates)
+            logger.info('%s: %d completed, %d failed', method, completed, failed)
+
+        if errors:
+            delay = state.failed(time.monotonic())
+            logger.warning('%s: %d errors, backing off for %ds', method, errors, delay)
+            return
+        after_id = payments[-1][0]
+
+
+class ProviderWorker(Thread):
+    """Reconciles one provider on its own schedule.
+
+    Each provider has its own thread, app context (so its own database
+    session) and request pool, so a gateway that times out only delays
+    its own payments.
+    """
+
+    def __init__(self, app, db, method, interval, once, stop):
+        super().__init__(name=f'reconcile-{method}', daemon=True)
+        self.app = app
+        self.db = db
+        self.method = method
+        self.interval = interval
+        self.once = once
+        self.stop = stop
+        self.state = ProviderState()
+        self.pool = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix=method)
+
+    def run(self):
+        try:
+            while not self.stop.is_set():
+                if self.state.next_poll <= time.monotonic():
+                    self.run_pass()
+                if self.once:
+                    return
+                self.stop.wait(self.interval)
+        finally:
+            self.pool.shutdown(wait=False)
+
+    def run_pass(self):
+        with self.app.app_context():
+            try:
+                reconcile_provider(self.app, self.db, self.method, self.state, self.pool)
+            except Exception:
+                self.db.session.rollback()
+                logger.exception('%s: reconciliation pass failed', self.method)
+                self.state.failed(time.monotonic())
+
+
+def run(app, db, interval=30, once=False):
+    stop = Event()
+    workers = [ProviderWorker(app, db, method, interval, once, stop) for method in PROVIDERS]
+    for worker in workers:
+        worker.start()
+    try:
+        # Timed joins keep the main thread responsive to Ctrl+C
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(1)
+    finally:
+        stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile pending mobile-money payments')
+    parser.add_argument('--once', action='store_true', help='run a single pass and exit')
+    parser.add_argument('--interval', type=int, default=30, help='seconds between passes')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    from app import app, db
+    run(app, db, interval=args.interval, once=args.once)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Order retention for Take App
+Finished orders (delivered or cancelled) older than RETENTION_DAYS move out
+of the order, order_item and payment tables into order_archive,
+order_item_archive and payment_archive, keeping their ids. Orders still in
+flight stay where they are however old they get, so they can be moved along.
+
+Before rows move, their counts and totals are added to the daily rollups
+(order_rollup, product_sales_rollup, payment_rollup), in the same
+transaction, so admin and dashboard statistics read the small hot tables
+plus the rollups and never scan the archive. Order and payment detail pages
+fall back to the archive through get_order_or_404 / get_payment_or_404; the
+admin listings and CSV exports merge archived rows in once they reach back
+to newest_archived.
+
+On PostgreSQL the archive tables are range-partitioned by created_at with
+one partition per year, created here as needed:
+    python retention.py archive                    # move everything past the horizon
+    python retention.py archive --days 180 --batch-size 200
+    python retention.py partitions                 # create this and next year's partitions
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import abort
+from sqlalchemy import bindparam, extract, literal, text
+import argparse
+import logging
+
+logger = logging.getLogger('retention')
+
+# Only orders that can no longer change are archived
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled')
+
+DEFAULT_RETENTION_DAYS = 365
+
+# Orders moved per transaction; also keeps IN (...) lists under SQLite's limit
+BATCH_SIZE = 500
+
+ARCHIVE_TABLES = ('order_archive', 'order_item_archive', 'payment_archive')
+
+
+def horizon(days, now=None):
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+
+def is_partitioned(db, table):
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return bool(db.session.execute(
+        text('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)'),
+        {'table': table}
+    ).scalar())
+
+
+def ensure_partitions(db, years):
+    """Create the yearly partitions of the archive tables for years.
+
+    A no-op unless the archive tables are partitioned (databases migrated on
+    PostgreSQL; create_all makes plain tables).
+    """
+    for table in ARCHIVE_TABLES:
+        if not is_partitioned(db, table):
+            continue
+        for year in sorted(set(years)):
+            db.session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {table}_y{year} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            ))
+
+
+def _accumulate(db, model, keys, measures, totals):
+    """Add totals ({key tuple: measure tuple}) onto the rollup rows of model.
+
+    Existing rows for the days involved are read once, then updated and
+    inserted with one executemany each. Only the retention job writes the
+    rollups, so there is no race between the read and the writes.
+    """
+    if not totals:
+        return
+    table = model.__table__
+    days = sorted({key[keys.index('day')] for key in totals})
+    existing = {tuple(row) for row in db.session.execute(
+        db.select(*[table.c[k] for k in keys]).where(table.c.day.in_(days)))}
+
+    def params(key, values):
+        row = {f'k_{k}': v for k, v in zip(keys, key)}
+        row.update({f'm_{m}': v for m, v in zip(measures, values)})
+        return row
+
+    updates = [params(key, values) for key, values in totals.items() if key in existing]
+    inserts = [dict(zip(keys + measures, key + values)) for key, values in totals.items()
+               if key not in existing]
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(*[table.c[k] == bindparam(f'k_{k}') for k in keys])
+            .values({m: table.c[m] + bindparam(f'm_{m}') for m in measures}),
+            updates
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+
+def roll_up(db, order_ids):
+    """Add the orders, their items and payments to the daily rollups"""
+    from models import Order, OrderItem, Payment, OrderRollup, ProductSalesRollup, PaymentRollup
+    from money import DEFAULT_CURRENCY
+
+    orders = defaultdict(lambda: [0, 0])
+    for store_id, created_at, status, currency, total_minor in db.session.query(
+            Order.store_id, Order.created_at, Order.status, Order.currency, Order.total_minor
+    ).filter(Order.id.in_(order_ids)):
+        totals = orders[(store_id, created_at.date(), status or 'pending', currency or DEFAULT_CURRENCY)]
+        totals[0] += 1
+        totals[1] += total_minor
+
+    sales = defaultdict(lambda: [0])
+    for product_id, created_at, quantity in db.session.query(
+            OrderItem.product_id, Order.created_at, OrderItem.quantity
+    ).join(Order, OrderItem.order_id == Order.id).filter(Order.id.in_(order_ids)):
+        sales[(product_id, created_at.date())][0] += quantity
+
+    payments = defaultdict(lambda: [0, 0])
+    for created_at, method, status, currency, amount_minor in db.session.query(
+            Payment.created_at, Payment.payment_method, Payment.status, Payment.currency, Payment.amount_minor
+    ).filter(Payment.order_id.in_(order_ids)):
+        totals = payments[(created_at.date(), method, status or 'pending', currency or DEFAULT_CURRENCY)]
+        totals[0] += 1
+        totals[1] += amount_minor
+
+    _accumulate(db, OrderRollup, ('store_id', 'day', 'status', 'currency'), ('orders', 'total_minor'),
+                {key: tuple(values) for key, values in orders.items()})
+    _accumulate(db, ProductSalesRollup, ('product_id', 'day'), ('quantity',),
+                {key: tuple(values) for key, values in sales.items()})
+    _accumulate(db, PaymentRollup, ('day', 'payment_method', 'status', 'currency'), ('payments', 'amount_minor'),
+                {key: tuple(values) for key, values in payments.items()})
+
+
+def _copy(db, source, archive, where, extra=(), join=None):
+    """INSERT INTO archive SELECT source's columns (plus extra) WHERE where"""
+    columns = list(source.c) + list(extra)
+    query = db.select(*columns)
+    if join is not None:
+        query = query.select_from(join)
+    db.session.execute(archive.insert().from_select([c.name for c in columns], query.where(where)))
+
+
+def archive_batch(db, order_ids):
+    """Roll up and move order_ids with their items and payments, as one transaction"""
+    from models import Order, OrderItem, Payment, OrderArchive, OrderItemArchive, PaymentArchive
+
+    order, item, payment = Order.__table__, OrderItem.__table__, Payment.__table__
+    years = {created_at.year for (created_at,) in db.session.query(Order.created_at)
+             .filter(Order.id.in_(order_ids))}
+    years |= {created_at.year for (created_at,) in db.session.query(Payment.created_at)
+              .filter(Payment.order_id.in_(order_ids))}
+    ensure_partitions(db, years)
+    roll_up(db, order_ids)
+
+    archived_at = literal(datetime.utcnow()).label('archived_at')
+    _copy(db, order, OrderArchive.__table__, order.c.id.in_(order_ids), extra=[archived_at])
+    _copy(db, item, OrderItemArchive.__table__, item.c.order_id.in_(order_ids),
+          extra=[order.c.created_at], join=item.join(order, item.c.order_id == order.c.id))
+    _copy(db, payment, PaymentArchive.__table__, payment.c.order_id.in_(order_ids), extra=[archived_at])
+
+    db.session.execute(item.delete().where(item.c.order_id.in_(order_ids)))
+    db.session.execute(payment.delete().where(payment.c.order_id.in_(order_ids)))
+    db.session.execute(order.delete().where(order.c.id.in_(order_ids)))
+    db.session.commit()
+
+
+def archive_orders(db, days, batch_size=BATCH_SIZE):
+    """Archive every finished order created more than days ago; returns the count"""
+    from models import Order
+
+    cutoff = horizon(days)
+    moved = 0
+    while True:
+        order_ids = [order_id for (order_id,) in db.session.query(Order.id)
+                     .filter(Order.created_at < cutoff, Order.status.in_(ARCHIVABLE_STATUSES))
+                     .order_by(Order.id).limit(batch_size)]
+        if not order_ids:
+            break
+        archive_batch(db, order_ids)
+        moved += len(order_ids)
+        logger.info('Archived %s orders (%s so far)', len(order_ids), moved)
+    if moved:
+        compact(db)
+    return moved
+
+
+def compact(db):
+    """Let PostgreSQL reuse the space of moved rows and refresh planner counts.
+
+    Keeps the hot tables' pages dense, and approximate_count (which reads
+    pg_class.reltuples) in line with what is left.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for table in ('order_item', 'payment', 'order'):
+            conn.execute(text(f'VACUUM (ANALYZE) "{table}"'))
+
+
+# Lookups and statistics for the views
+
+def get_order_or_404(order_id, options=(), archive_options=(), **filters):
+    """The order from the hot table, or from the archive once it has moved"""
+    from models import Order, OrderArchive
+
+    order = Order.query.options(*options).filter_by(id=order_id, **filters).first()
+    if order is None:
+        order = OrderArchive.query.options(*archive_options).filter_by(id=order_id, **filters).first()
+    if order is None:
+        abort(404)
+    return order
+
+
+def get_payment_or_404(payment_id, options=(), archive_options=()):
+    from models import Payment, PaymentArchive
+
+    payment = Payment.query.options(*options).filter_by(id=payment_id).first()
+    if payment is None:
+        payment = PaymentArchive.query.options(*archive_options).filter_by(id=payment_id).first()
+    if payment is None:
+        abort(404)
+    return payment
+
+
+def newest_archived(db, model):
+    """created_at of the newest row of an archive table, None while it is empty.
+
+    Listings and exports that do not reach back this far can skip the archive.
+    """
+    return db.session.query(db.func.max(model.created_at)).scalar()
+
+
+def archived_order_stats(db, store_ids=None):
+    """(order count, {currency: revenue}) over archived orders, from the rollup.
+
+    Revenue is the total of orders in REVENUE_STATUSES. store_ids narrows it
+    to some stores (a list or a select of ids).
+    """
+    from models import OrderRollup
+    from fulfillment import REVENUE_STATUSES
+
+    query = db.session.query(OrderRollup.status, OrderRollup.currency,
+                             db.func.sum(OrderRollup.orders), db.func.sum(OrderRollup.total_minor)) \
+        .group_by(OrderRollup.status, OrderRollup.currency)
+    if store_ids is not None:
+        query = query.filter(OrderRollup.store_id.in_(store_ids))
+    count, revenue = 0, {}
+    for status, currency, orders, total_minor in query:
+        count += orders
+        if status in REVENUE_STATUSES:
+            revenue[currency] = revenue.get(currency, 0) + total_minor
+    return count, revenue
+
+
+def month_of(column):
+    """Year and month of a date/datetime column as one sortable integer (202610).
+
+    Built from EXTRACT, which SQLAlchemy compiles for every dialect, unlike
+    SQLite's strftime or PostgreSQL's date_trunc.
+    """
+    return (extract('year', column) * 100 + extract('month', column)).label('month')
+
+
+def month_label(month):
+    """'2026-10' for a month_of value"""
+    month = int(month)
+    return f'{month // 100}-{month % 100:02d}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Order retention')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    archive = subparsers.add_parser('archive', help='move finished orders past the horizon to the archive')
+    archive.add_argument('--days', type=int, help='horizon in days (default: RETENTION_DAYS)')
+    archive.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    subparsers.add_parser('partitions', help="create this and next year's archive partitions")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    from app import app, db
+    with app.app_context():
+        if args.command == 'archive':
+            days = args.days or app.config['RETENTION_DAYS']
+            print(f'Archived {archive_orders(db, days, args.batch_size)} orders older than {days} days')
+        else:
+            year = datetime.utcnow().year
+            ensure_partitions(db, [year, year + 1])
+            db.session.commit()
+            print('Archive partitions are in place')
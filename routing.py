@@ -0,0 +1,58 @@
+from functools import wraps
+from flask import g, has_request_context, session, current_app
+from flask_sqlalchemy.session import Session
+import time
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """Session that sends reads from replica-enabled views to the replica.
+
+    Everything else, and any statement issued once the request has written
+    something, goes to the primary engine.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and use_replica():
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica():
+    if not has_request_context() or not g.get('read_replica'):
+        return False
+    return not g.get('wrote_primary')
+
+
+def read_replica(f):
+    """Serve this view's reads from the replica bind when one is configured.
+
+    Visitors who wrote something in the last REPLICA_PIN_SECONDS stay on the
+    primary so they see their own changes despite replication lag.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        pinned_until = session.get('_primary_until')
+        if not pinned_until or pinned_until < time.time():
+            g.read_replica = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def init_routing(app, db):
+    """Track writes so the rest of the request and the next few reads use the primary"""
+    from sqlalchemy import event
+
+    @event.listens_for(db.session, 'after_flush')
+    def pin_to_primary(db_session, flush_context):
+        if has_request_context():
+            g.wrote_primary = True
+
+    @app.after_request
+    def remember_write(response):
+        if g.get('wrote_primary'):
+            session['_primary_until'] = time.time() + current_app.config['REPLICA_PIN_SECONDS']
+        return response
@@ -0,0 +1,69 @@
+from sqlalchemy.exc import IntegrityError
+import re
+import unicodedata
+
+SLUG_MAX_LENGTH = 100
+SLUG_INSERT_ATTEMPTS = 5
+
+# Arabic letters to Latin, following common Somali/Arabic romanisation
+ARABIC_TO_LATIN = {
+    'ا': 'a', 'أ': 'a', 'إ': 'i', 'آ': 'aa', 'ء': '', 'ؤ': 'w', 'ئ': 'y',
+    'ب': 'b', 'ت': 't', 'ث': 'th', 'ج': 'j', 'ح': 'h', 'خ': 'kh', 'د': 'd',
+    'ذ': 'dh', 'ر': 'r', 'ز': 'z', 'س': 's', 'ش': 'sh', 'ص': 's', 'ض': 'd',
+    'ط': 't', 'ظ': 'z', 'ع': 'c', 'غ': 'gh', 'ف': 'f', 'ق': 'q', 'ك': 'k',
+    'ل': 'l', 'م': 'm', 'ن': 'n', 'ه': 'h', 'ة': 'a', 'و': 'w', 'ي': 'y',
+    'ى': 'a', 'پ': 'p', 'چ': 'ch', 'گ': 'g', 'ڤ': 'v',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+}
+
+
+def transliterate(text):
+    """Best-effort ASCII rendering of a store name"""
+    text = ''.join(ARABIC_TO_LATIN.get(c, c) for c in text)
+    # Strip accents from Latin letters (e.g. é -> e)
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c)).encode('ascii', 'ignore').decode()
+
+
+def slugify(name):
+    slug = re.sub(r'[^a-z0-9]+', '-', transliterate(name).lower()).strip('-')
+    # Leave room for a "-NNN" suffix
+    return slug[:SLUG_MAX_LENGTH - 8].rstrip('-') or 'store'
+
+
+def next_free_slug(base):
+    """Return base or base-N using a single query over the taken prefix"""
+    from app import db
+    from models import Store
+
+    taken = {row[0] for row in db.session.query(Store.slug).filter(
+        db.or_(Store.slug == base, Store.slug.like(f'{base}-%'))
+    )}
+    if base not in taken:
+        return base
+
+    suffixes = [int(s[len(base) + 1:]) for s in taken if s[len(base) + 1:].isdigit()]
+    return f'{base}-{max(suffixes, default=0) + 1}'
+
+
+def add_with_unique_slug(store, name):
+    """Give store a free slug derived from name and flush it.
+
+    Two merchants creating "shop" at the same moment can both see the same
+    suffix as free; the loser gets a unique violation and simply retries
+    with the next one.
+    """
+    from app import db
+
+    base = slugify(name)
+    for attempt in range(SLUG_INSERT_ATTEMPTS):
+        store.slug = next_free_slug(base)
+        try:
+            with db.session.begin_nested():
+                db.session.add(store)
+                db.session.flush()
+            return store
+        except IntegrityError as e:
+            if 'slug' not in str(e.orig) or attempt == SLUG_INSERT_ATTEMPTS - 1:
+                raise
@@ -211,6 +211,148 @@ function showError(message) {
     }, 5000);
 }
 
+// Live order notifications on the merchant dashboard
+// exponent is the currency's minor unit digits (0 for SLS), sent with the
+// event; events logged before it was added are in two-digit currencies
+function formatMinor(minor, currency, exponent = 2) {
+    return `${(minor / 10 ** exponent).toFixed(exponent)} ${currency || ''}`.trim();
+}
+
+function describeOrderEvent(type, event) {
+    const data = event.data || {};
+    switch (type) {
+        case 'order.created':
+            return `New order ${data.order_number || '#' + event.order_id}: ${formatMinor(data.total_minor, data.currency, data.exponent)}`;
+        case 'order.status_changed':
+            return `Order #${event.order_id} is now ${event.new_status}`;
+        case 'payment.recorded':
+            return `Payment for order #${event.order_id} via ${data.method}: ${event.new_status}`;
+        case 'payment.status_changed':
+            return `Payment for order #${event.order_id} ${event.new_status}`;
+    }
+    return null;
+}
+
+function listenForOrders(element) {
+    if (!window.EventSource) {
+        return;
+    }
+    // The browser reconnects on its own and resends Last-Event-ID
+    const source = new EventSource(element.dataset.streamUrl);
+    ['order.created', 'order.status_changed', 'payment.recorded', 'payment.status_changed'].forEach(type => {
+        source.addEventListener(type, e => {
+            const message = describeOrderEvent(type, JSON.parse(e.data));
+            if (message) {
+                showSuccess(message);
+            }
+        });
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    const element = document.getElementById('order-notifications');
+    if (element) {
+        listenForOrders(element);
+    }
+});
+
+// Offline storefront: service worker plus a queue for carts built offline
+const OFFLINE_CART_KEY = 'offlineCart:';
+
+function offlineQueue(storeSw) {
+    try {
+        return JSON.parse(localStorage.getItem(OFFLINE_CART_KEY + storeSw)) || [];
+    } catch (e) {
+        return [];
+    }
+}
+
+function saveOfflineQueue(storeSw, queue) {
+    if (queue.length) {
+        localStorage.setItem(OFFLINE_CART_KEY + storeSw, JSON.stringify(queue));
+    } else {
+        localStorage.removeItem(OFFLINE_CART_KEY + storeSw);
+    }
+}
+
+function findCatalogProduct(catalogUrl, productId) {
+    // Answered from the service worker cache when offline
+    return fetch(catalogUrl)
+        .then(response => response.json())
+        .then(catalog => catalog.products.find(p => p.id === productId))
+        .catch(() => null);
+}
+
+function queueOfflineAdd(form, storeSw, catalogUrl) {
+    const match = form.action.match(/\/add-to-cart\/(\d+)/);
+    if (!match) {
+        return false;
+    }
+    const productId = parseInt(match[1], 10);
+    const quantity = parseInt(new FormData(form).get('quantity') || '1', 10);
+    const queue = offlineQueue(storeSw);
+    queue.push({action: form.action, quantity: quantity});
+    saveOfflineQueue(storeSw, queue);
+
+    findCatalogProduct(catalogUrl, productId).then(product => {
+        const name = product ? product.name : 'Item';
+        showSuccess(`${name} saved to your cart. It will be added when you are back online.`);
+    });
+    return true;
+}
+
+function syncOfflineCart(storeSw) {
+    const queue = offlineQueue(storeSw);
+    if (!queue.length || !navigator.onLine) {
+        return Promise.resolve(0);
+    }
+    // Replay in order; whatever fails stays queued for the next attempt
+    return queue.reduce((done, entry, index) => done.then(synced => {
+        if (synced < index) {
+            return synced;
+        }
+        const body = new FormData();
+        body.append('quantity', entry.quantity);
+        return fetch(entry.action, {method: 'POST', body: body, credentials: 'same-origin'})
+            .then(response => response.ok ? synced + 1 : synced)
+            .catch(() => synced);
+    }), Promise.resolve(0)).then(synced => {
+        saveOfflineQueue(storeSw, queue.slice(synced));
+        return synced;
+    });
+}
+
+function initOfflineStore() {
+    const storeSw = document.body.dataset.storeSw;
+    const catalogUrl = document.body.dataset.catalogUrl;
+    if (!storeSw || !('serviceWorker' in navigator)) {
+        return;
+    }
+    navigator.serviceWorker.register(storeSw, {scope: document.body.dataset.storeScope})
+        .catch(error => console.warn('Offline browsing is unavailable:', error));
+
+    document.querySelectorAll('form[action*="/add-to-cart/"]').forEach(form => {
+        form.addEventListener('submit', e => {
+            if (!navigator.onLine && queueOfflineAdd(form, storeSw, catalogUrl)) {
+                e.preventDefault();
+            }
+        });
+    });
+
+    const sync = () => syncOfflineCart(storeSw).then(synced => {
+        if (synced) {
+            showSuccess(`${synced} item(s) from offline browsing were added to your cart.`);
+            if (/\/cart$/.test(window.location.pathname)) {
+                window.location.reload();
+            }
+        }
+    });
+    window.addEventListener('online', sync);
+    sync();
+}
+
+document.addEventListener('DOMContentLoaded', initOfflineStore);
+
 // Form validation
 function validateForm(formId) {
     const form = document.getElementById(formId);
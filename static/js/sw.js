@@ -0,0 +1,107 @@
+// Storefront service worker, served from /store/<slug>/sw.js and registered
+// with scope /store/<slug> (allowed by its Service-Worker-Allowed header) so
+// it covers the store page as well as everything below it. It keeps the
+// store page, its product pages, its catalog snapshot and the static assets
+// they use, so returning visitors can browse and build a cart on a flaky
+// connection. Cart, checkout and order pages (addresses, customer details,
+// CSRF tokens) always go to the network and are never stored on the device.
+
+// The store page, e.g. /store/shop; a scope is a plain prefix, so it also
+// covers /store/shopping, which this worker leaves alone
+const STORE_PAGE = new URL(self.registration.scope).pathname.replace(/\/$/, '');
+const CATALOG_URL = STORE_PAGE + '/catalog.json';
+const STORE_CACHE = 'take-store-v1:' + STORE_PAGE;
+const STATIC_CACHE = 'take-static-v1';
+
+// Third-party assets used by base.html when the self-hosted bundles are not built
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'cdnjs.cloudflare.com'];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(STORE_CACHE)
+            .then(cache => cache.addAll([STORE_PAGE, CATALOG_URL]))
+            // Fail the install, so the browser retries on the next visit
+            // instead of activating a worker with nothing to serve offline
+            .catch(error => {
+                console.error('Could not cache the store for offline use:', error);
+                throw error;
+            })
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys().then(keys => Promise.all(keys
+            .filter(key => key.startsWith('take-store-') && key.endsWith(':' + STORE_PAGE) &&
+                           key !== STORE_CACHE)
+            .map(key => caches.delete(key))
+        )).then(() => self.clients.claim())
+    );
+});
+
+function cacheResponse(cacheName, request, response) {
+    if (response && response.ok && response.type !== 'opaque') {
+        const copy = response.clone();
+        caches.open(cacheName).then(cache => cache.put(request, copy));
+    }
+    return response;
+}
+
+// Fingerprinted bundles never change
+function cacheFirst(request) {
+    return caches.match(request).then(cached =>
+        cached || fetch(request).then(response => cacheResponse(STATIC_CACHE, request, response))
+    );
+}
+
+function staleWhileRevalidate(request) {
+    return caches.match(request).then(cached => {
+        const network = fetch(request)
+            .then(response => cacheResponse(STATIC_CACHE, request, response))
+            .catch(() => cached);
+        return cached || network;
+    });
+}
+
+// The store page and its product pages; nothing personal is kept
+function isBrowsablePage(pathname) {
+    return pathname === STORE_PAGE ||
+        (pathname.startsWith(STORE_PAGE + '/') && /^\/product\/\d+$/.test(pathname.slice(STORE_PAGE.length)));
+}
+
+// Browsable pages and the catalog: fresh when online, last known copy when not
+function networkFirst(request, fallbackUrl) {
+    return fetch(request)
+        .then(response => cacheResponse(STORE_CACHE, request, response))
+        .catch(() => caches.match(request).then(cached =>
+            cached || (fallbackUrl ? caches.match(fallbackUrl) : undefined)
+        ).then(cached => cached || new Response('You are offline.', {
+            status: 503,
+            headers: {'Content-Type': 'text/plain'}
+        })));
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+
+    if (url.origin !== self.location.origin) {
+        if (CDN_HOSTS.includes(url.hostname)) {
+            event.respondWith(staleWhileRevalidate(request));
+        }
+        return;
+    }
+    if (url.pathname.startsWith('/static/dist/')) {
+        event.respondWith(cacheFirst(request));
+    } else if (url.pathname.startsWith('/static/')) {
+        event.respondWith(staleWhileRevalidate(request));
+    } else if (url.pathname === CATALOG_URL) {
+        event.respondWith(networkFirst(request));
+    } else if (request.mode === 'navigate' && isBrowsablePage(url.pathname)) {
+        event.respondWith(networkFirst(request, STORE_PAGE));
+    }
+});
@@ -1,28 +1,126 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app, Response, send_from_directory
 from flask_login import current_user, login_required
 from app import db
 from models import Store, Product, Order, OrderItem, User
-from forms import OrderForm
-import uuid
+from forms import OrderForm, WhatsAppOrderForm
+from orders import place_order
+from money import Money, DEFAULT_CURRENCY, SUPPORTED_CURRENCIES
+from rates import converter, has_rate, price_list
+from routing import read_replica
+from tenants import get_store_or_404
+from quotas import consume, QuotaExceeded
+from whatsapp import product_link, order_link
+from catalog import get_snapshot
+from retention import get_order_or_404
+from ratelimit import RateLimiter, client_ip
 
 store_bp = Blueprint('store', __name__)
 
+# Anonymous WhatsApp orders take stock until the store confirms or they
+# expire, so each IP gets a burst of 5, refilling one every 2 minutes
+whatsapp_order_limiter = RateLimiter(rate=1 / 120, capacity=5)
+
+def _shopper_currency():
+    """Currency the shopper picked, if we hold a rate for it"""
+    currency = session.get('currency', DEFAULT_CURRENCY)
+    if currency != DEFAULT_CURRENCY and not has_rate(currency):
+        return DEFAULT_CURRENCY
+    return currency
+
+def _cart_lines(store, currency=DEFAULT_CURRENCY):
+    """Cart items for store with their products, loaded in one query and priced in currency"""
+    cart_items = session.get('cart', {}).get(str(store.id), {})
+    products = {}
+    if cart_items:
+        products = {p.id: p for p in Product.query.filter(
+            Product.id.in_([int(pid) for pid in cart_items]),
+            Product.store_id == store.id,
+            Product.is_active == True
+        )}
+    
+    entries = [(products[int(pid)], quantity) for pid, quantity in cart_items.items()
+               if int(pid) in products]
+    # Convert from the live product prices, not the cached price list
+    prices = converter(DEFAULT_CURRENCY, currency).convert_all([p.price_minor for p, _ in entries])
+    
+    lines = []
+    total = Money(0, currency)
+    for (product, quantity), price_minor in zip(entries, prices):
+        item_total = Money(price_minor, currency) * quantity
+        lines.append({
+            'product': product,
+            'quantity': quantity,
+            'price_minor': price_minor,
+            'total': item_total.amount,
+            'total_minor': item_total.minor
+        })
+        total += item_total
+    return lines, total
+
+def _clear_cart(store):
+    if 'cart' in session and str(store.id) in session['cart']:
+        del session['cart'][str(store.id)]
+        session.modified = True
+
+def _reserve_order_quota(store):
+    """Count an order against the store owner's monthly plan allowance"""
+    owner_tier = db.session.query(User.subscription_tier).filter_by(id=store.owner_id).scalar()
+    try:
+        consume(store.owner_id, owner_tier, 'orders')
+    except QuotaExceeded:
+        db.session.rollback()
+        return False
+    return True
+
+def _store_url(store):
+    return url_for('store.store_page', slug=store.slug, _external=True)
+
 @store_bp.route('/store/<slug>')
+@read_replica
 def store_page(slug):
     """Public store page"""
-    store = Store.query.filter_by(slug=slug, is_active=True).first_or_404()
+    store = get_store_or_404(slug)
     products = Product.query.filter_by(store_id=store.id, is_active=True).all()
     featured_products = Product.query.filter_by(store_id=store.id, is_active=True, is_featured=True).all()
+    currency = _shopper_currency()
     
     return render_template('store/store.html', 
                          store=store, 
                          products=products,
-                         featured_products=featured_products)
+                         featured_products=featured_products,
+                         currency=currency,
+                         prices=price_list(store, currency))
+
+@store_bp.route('/store/<slug>/catalog.json')
+def catalog(slug):
+    """Versioned catalog snapshot for offline browsing"""
+    # Read from the primary: the snapshot is cached until the next change
+    store = get_store_or_404(slug)
+    etag, body = get_snapshot(store)
+    
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Clients revalidate every time; an unchanged catalog is a bodiless 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@store_bp.route('/store/<slug>/sw.js')
+def service_worker(slug):
+    """Service worker scoped to one store's pages"""
+    get_store_or_404(slug)
+    response = send_from_directory(current_app.static_folder, 'js/sw.js',
+                                   mimetype='application/javascript', max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    # The script's own directory (/store/<slug>/) would leave out the store
+    # page itself, so allow registering it for /store/<slug>
+    response.headers['Service-Worker-Allowed'] = url_for('store.store_page', slug=slug)
+    return response
 
 @store_bp.route('/store/<slug>/product/<int:product_id>')
+@read_replica
 def product_detail(slug, product_id):
     """Product detail page"""
-    store = Store.query.filter_by(slug=slug, is_active=True).first_or_404()
+    store = get_store_or_404(slug)
     product = Product.query.filter_by(id=product_id, store_id=store.id, is_active=True).first_or_404()
     
     # Get related products
@@ -32,37 +130,29 @@ def product_detail(slug, product_id):
         Product.is_active == True
     ).limit(4).all()
     
+    currency = _shopper_currency()
+    
     return render_template('store/product_detail.html', 
                          store=store, 
                          product=product,
-                         related_products=related_products)
+                         related_products=related_products,
+                         currency=currency,
+                         prices=price_list(store, currency))
 
 @store_bp.route('/store/<slug>/cart')
+@read_replica
 def cart(slug):
     """Shopping cart page"""
-    store = Store.query.filter_by(slug=slug, is_active=True).first_or_404()
-    cart_items = session.get('cart', {}).get(str(store.id), {})
-    
-    products = []
-    total = 0
+    store = get_store_or_404(slug)
+    products, total = _cart_lines(store, _shopper_currency())
     
-    for product_id, quantity in cart_items.items():
-        product = Product.query.get(product_id)
-        if product and product.store_id == store.id and product.is_active:
-            item_total = product.price * quantity
-            products.append({
-                'product': product,
-                'quantity': quantity,
-                'total': item_total
-            })
-            total += item_total
-    
-    return render_template('store/cart.html', store=store, products=products, total=total)
+    return render_template('store/cart.html', store=store, products=products, total=total.amount,
+                         currency=total.currency)
 
 @store_bp.route('/store/<slug>/add-to-cart/<int:product_id>', methods=['POST'])
 def add_to_cart(slug, product_id):
     """Add product to cart"""
-    store = Store.query.filter_by(slug=slug, is_active=True).first_or_404()
+    store = get_store_or_404(slug)
     product = Product.query.filter_by(id=product_id, store_id=store.id, is_active=True).first_or_404()
     
     quantity = int(request.form.get('quantity', 1))
@@ -85,7 +175,7 @@ def add_to_cart(slug, product_id):
 @store_bp.route('/store/<slug>/remove-from-cart/<int:product_id>', methods=['POST'])
 def remove_from_cart(slug, product_id):
     """Remove product from cart"""
-    store = Store.query.filter_by(slug=slug, is_active=True).first_or_404()
+    store = get_store_or_404(slug)
     
     if 'cart' in session and str(store.id) in session['cart']:
         if str(product_id) in session['cart'][str(store.id)]:
@@ -95,30 +185,31 @@ def remove_from_cart(slug, product_id):
     
     return redirect(url_for('store.cart', slug=slug))
 
+@store_bp.route('/store/<slug>/currency', methods=['POST'])
+def set_currency(slug):
+    """Choose the currency prices are shown and charged in"""
+    get_store_or_404(slug)
+    currency = request.form.get('currency', DEFAULT_CURRENCY).upper()
+    if currency in SUPPORTED_CURRENCIES and has_rate(currency):
+        session['currency'] = currency
+    else:
+        flash('That currency is not available right now.', 'error')
+    
+    back = request.referrer
+    if not back or not back.startswith(request.host_url):
+        back = url_for('store.store_page', slug=slug)
+    return redirect(back)
+
 @store_bp.route('/store/<slug>/checkout', methods=['GET', 'POST'])
 def checkout(slug):
     """Checkout page"""
-    store = Store.query.filter_by(slug=slug, is_active=True).first_or_404()
-    cart_items = session.get('cart', {}).get(str(store.id), {})
+    store = get_store_or_404(slug)
+    products, total = _cart_lines(store, _shopper_currency())
     
-    if not cart_items:
+    if not products:
         flash('Your cart is empty!', 'error')
         return redirect(url_for('store.store_page', slug=slug))
     
-    products = []
-    total = 0
-    
-    for product_id, quantity in cart_items.items():
-        product = Product.query.get(product_id)
-        if product and product.store_id == store.id and product.is_active:
-            item_total = product.price * quantity
-            products.append({
-                'product': product,
-                'quantity': quantity,
-                'total': item_total
-            })
-            total += item_total
-    
     form = OrderForm()
     
     if form.validate_on_submit():
@@ -126,35 +217,19 @@ def checkout(slug):
         order = Order(
             customer_id=current_user.id if current_user.is_authenticated else None,
             store_id=store.id,
-            subtotal=total,
-            total=total,
+            currency=total.currency,
+            subtotal_minor=total.minor,
+            total_minor=total.minor,
             shipping_address=form.shipping_address.data,
             notes=form.notes.data
         )
         
-        db.session.add(order)
-        db.session.flush()  # Get the order ID
+        if not _reserve_order_quota(store):
+            flash('This store cannot take more orders right now. Please contact the store.', 'error')
+            return redirect(url_for('store.cart', slug=slug))
         
-        # Create order items
-        for item in products:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item['product'].id,
-                quantity=item['quantity'],
-                price=item['product'].price,
-                total=item['total']
-            )
-            db.session.add(order_item)
-            
-            # Update stock
-            item['product'].stock_quantity -= item['quantity']
-        
-        db.session.commit()
-        
-        # Clear cart
-        if 'cart' in session and str(store.id) in session['cart']:
-            del session['cart'][str(store.id)]
-            session.modified = True
+        place_order(order, products)
+        _clear_cart(store)
         
         flash('Order placed successfully!', 'success')
         return redirect(url_for('store.order_confirmation', slug=slug, order_id=order.id))
@@ -162,27 +237,68 @@ def checkout(slug):
     return render_template('store/checkout.html', 
                          store=store, 
                          products=products, 
-                         total=total,
+                         total=total.amount,
+                         currency=total.currency,
                          form=form)
 
 @store_bp.route('/store/<slug>/order/<int:order_id>/confirmation')
 def order_confirmation(slug, order_id):
     """Order confirmation page"""
-    store = Store.query.filter_by(slug=slug, is_active=True).first_or_404()
-    order = Order.query.filter_by(id=order_id, store_id=store.id).first_or_404()
+    store = get_store_or_404(slug)
+    order = get_order_or_404(order_id, store_id=store.id)
     
     return render_template('store/order_confirmation.html', store=store, order=order)
 
 @store_bp.route('/store/<slug>/whatsapp-order/<int:product_id>')
+@read_replica
 def whatsapp_order(slug, product_id):
     """Generate WhatsApp order link"""
-    store = Store.query.filter_by(slug=slug, is_active=True).first_or_404()
+    store = get_store_or_404(slug)
     product = Product.query.filter_by(id=product_id, store_id=store.id, is_active=True).first_or_404()
     
-    # Generate WhatsApp message
-    message = f"Hi! I'd like to order:\n\n{product.name}\nPrice: ${product.price}\n\nStore: {store.name}\nStore URL: {request.host_url}store/{slug}"
+    currency = _shopper_currency()
+    price_minor = converter(DEFAULT_CURRENCY, currency).convert(product.price_minor)
+    
+    return redirect(product_link(store, product, price_minor, currency, _store_url(store),
+                                 current_app.config['WHATSAPP_COUNTRY_CODE']))
+
+@store_bp.route('/store/<slug>/whatsapp-order', methods=['POST'])
+def whatsapp_checkout(slug):
+    """Place the cart as a pending order and hand it to the store on WhatsApp"""
+    store = get_store_or_404(slug)
+    form = WhatsAppOrderForm()
+    if not form.validate_on_submit():
+        flash('Your order could not be sent. Please try again.', 'error')
+        return redirect(url_for('store.cart', slug=slug))
+    
+    if not whatsapp_order_limiter.allow(client_ip(request)):
+        flash('Too many orders. Please wait a moment and try again.', 'error')
+        return redirect(url_for('store.cart', slug=slug))
+    
+    products, total = _cart_lines(store, _shopper_currency())
+    
+    if not products:
+        flash('Your cart is empty!', 'error')
+        return redirect(url_for('store.store_page', slug=slug))
+    
+    order = Order(
+        customer_id=current_user.id if current_user.is_authenticated else None,
+        store_id=store.id,
+        channel='whatsapp',
+        currency=total.currency,
+        subtotal_minor=total.minor,
+        total_minor=total.minor,
+        shipping_address=form.shipping_address.data or None,
+        notes=form.notes.data or None
+    )
+    
+    if not _reserve_order_quota(store):
+        flash('This store cannot take more orders right now. Please contact the store.', 'error')
+        return redirect(url_for('store.cart', slug=slug))
     
-    # WhatsApp API URL
-    whatsapp_url = f"https://wa.me/{store.phone}?text={message}"
+    # Quota, order, items and stock all commit together
+    place_order(order, products)
+    _clear_cart(store)
     
-    return redirect(whatsapp_url) 
\ No newline at end of file
+    return redirect(order_link(store, order, products, _store_url(store),
+                               current_app.config['WHATSAPP_COUNTRY_CODE']))
@@ -0,0 +1,67 @@
+from flask import g, template_rendered, before_render_template
+from jinja2 import FileSystemBytecodeCache
+from threading import Lock
+import os
+import time
+
+_stats = {}
+_stats_lock = Lock()
+
+
+def init_templating(app):
+    """Bytecode cache, precompiled templates and render timing for app"""
+    cache_dir = app.config['JINJA_CACHE_DIR']
+    os.makedirs(cache_dir, exist_ok=True)
+    # jinja_env is created on first use, so the options must be set before
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(cache_dir)}
+    app.jinja_env.auto_reload = app.config['TEMPLATES_AUTO_RELOAD']
+
+    if app.config['PRECOMPILE_TEMPLATES']:
+        precompile_templates(app)
+
+    before_render_template.connect(_start_render, app)
+    template_rendered.connect(_finish_render, app)
+
+
+def precompile_templates(app):
+    """Load every template up front.
+
+    With preload_app the master does this once and forked workers,
+    including ones recycled by max_requests, start with them compiled.
+    """
+    env = app.jinja_env
+    compiled = 0
+    for name in env.list_templates(extensions=('html', 'txt', 'xml')):
+        env.get_template(name)
+        compiled += 1
+    app.logger.info('Precompiled %d templates', compiled)
+    return compiled
+
+
+def _start_render(app, template, context, **extra):
+    g.setdefault('_render_starts', []).append(time.perf_counter())
+
+
+def _finish_render(app, template, context, **extra):
+    starts = g.get('_render_starts')
+    if not starts:
+        return
+    elapsed = (time.perf_counter() - starts.pop()) * 1000
+    with _stats_lock:
+        stats = _stats.get(template.name)
+        if stats is None:
+            stats = _stats[template.name] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+        stats['count'] += 1
+        stats['total_ms'] += elapsed
+        stats['max_ms'] = max(stats['max_ms'], elapsed)
+    if elapsed > app.config['SLOW_RENDER_MS']:
+        app.logger.warning('Slow render of %s: %.1f ms', template.name, elapsed)
+
+
+def render_stats():
+    """Per-template render counts and timings for this worker"""
+    with _stats_lock:
+        return {
+            name: {**stats, 'avg_ms': stats['total_ms'] / stats['count']}
+            for name, stats in _stats.items()
+        }
@@ -0,0 +1,162 @@
+from flask import abort, current_app
+from threading import Lock
+import time
+
+# Resolved stores are cached per worker. Commits that touch a store drop its
+# entries in the worker that made them at once. Other workers serve their
+# copy for up to STORE_CACHE_FRESH seconds, then compare its version with
+# Store.version (a primary key probe instead of reloading the row), so an
+# edit anywhere reaches every worker within that window.
+STORE_CACHE_FRESH = 5
+STORE_CACHE_SIZE = 5000
+
+# Paths that belong to a store when it is served from its own domain,
+# e.g. https://shop.example.com/cart -> /store/<slug>/cart
+STORE_RELATIVE_PREFIXES = ('/product/', '/cart', '/add-to-cart/', '/remove-from-cart/',
+                           '/checkout', '/order/', '/whatsapp-order', '/currency')
+
+_cache = {}
+_keys_by_store = {}
+_lock = Lock()
+
+# Cached for misses too, so hosts that are not stores (the main site) and
+# unknown slugs do not hit the database on every request
+_MISSING = object()
+
+STORE_FIELDS = ('id', 'slug', 'name', 'description', 'logo', 'banner', 'address', 'phone',
+                'email', 'website', 'theme', 'owner_id', 'custom_domain', 'version')
+
+
+class StoreInfo:
+    """Read-only copy of an active store's columns, safe to share between requests"""
+    __slots__ = STORE_FIELDS
+
+    def __init__(self, **values):
+        for field in STORE_FIELDS:
+            setattr(self, field, values.get(field))
+
+    is_active = True
+
+    def __repr__(self):
+        return f'<StoreInfo {self.slug} v{self.version}>'
+
+
+def _load(**criteria):
+    from app import db
+    from models import Store
+    row = db.session.query(*[getattr(Store, f) for f in STORE_FIELDS]) \
+        .filter_by(is_active=True, **criteria).first()
+    return StoreInfo(**dict(zip(STORE_FIELDS, row))) if row else None
+
+
+def _current_version(store_id):
+    """Store.version of an active store, or None"""
+    from app import db
+    from models import Store
+    return db.session.query(Store.version).filter_by(id=store_id, is_active=True).scalar()
+
+
+def _cached(key, loader):
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+    if entry and entry[0] > now:
+        return None if entry[1] is _MISSING else entry[1]
+
+    if entry and entry[1] is not _MISSING and _current_version(entry[1].id) == entry[1].version:
+        # Unchanged since it was loaded; keep serving the cached copy
+        info = entry[1]
+    else:
+        # Misses are looked up again, as the store may have been created or activated
+        info = loader()
+    with _lock:
+        if key not in _cache and len(_cache) >= STORE_CACHE_SIZE:
+            _cache.pop(next(iter(_cache)), None)
+        _cache[key] = (now + STORE_CACHE_FRESH, _MISSING if info is None else info)
+        if info is not None:
+            _keys_by_store.setdefault(info.id, set()).add(key)
+    return info
+
+
+def get_store(slug):
+    """Active store for slug, or None"""
+    return _cached(('slug', slug), lambda: _load(slug=slug))
+
+
+def get_store_or_404(slug):
+    store = get_store(slug)
+    if store is None:
+        abort(404)
+    return store
+
+
+def resolve_host(host):
+    """Active store served on host (custom domain or <slug>.STORE_BASE_DOMAIN)"""
+    host = host.split(':', 1)[0].lower()
+    base = current_app.config.get('STORE_BASE_DOMAIN')
+    if base and host.endswith('.' + base):
+        subdomain = host[:-len(base) - 1]
+        if subdomain and '.' not in subdomain and subdomain != 'www':
+            return get_store(subdomain)
+        return None
+    if base and host == base:
+        return None
+    return _cached(('domain', host), lambda: _load(custom_domain=host))
+
+
+def invalidate_store(store_id, slug=None, custom_domain=None):
+    """Forget every cached lookup of store_id, and misses for its current slug/domain"""
+    with _lock:
+        for key in _keys_by_store.pop(store_id, ()):
+            _cache.pop(key, None)
+        if slug:
+            _cache.pop(('slug', slug), None)
+        if custom_domain:
+            _cache.pop(('domain', custom_domain.lower()), None)
+
+
+class StoreHostMiddleware:
+    """Serve stores on their own domain or subdomain.
+
+    Requests for a store host have store-relative paths rewritten onto the
+    /store/<slug>/ routes; anything else (static files, /store/ links,
+    payments) passes through unchanged.
+    """
+
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '/')
+        if path == '/' or path.startswith(STORE_RELATIVE_PREFIXES):
+            host = environ.get('HTTP_HOST') or environ.get('SERVER_NAME', '')
+            with self.app.app_context():
+                store = resolve_host(host)
+            if store is not None:
+                environ['PATH_INFO'] = f'/store/{store.slug}' + ('' if path == '/' else path)
+        return self.wsgi_app(environ, start_response)
+
+
+def init_tenants(app, db):
+    """Invalidate cached stores whenever a commit changes a Store row"""
+    from sqlalchemy import event
+    from models import Store
+
+    @event.listens_for(db.session, 'after_flush')
+    def collect_changed_stores(session, flush_context):
+        changed = session.info.setdefault('changed_stores', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, Store) and obj.id is not None:
+                changed.add((obj.id, obj.slug, obj.custom_domain))
+
+    @event.listens_for(db.session, 'after_commit')
+    def drop_changed_stores(session):
+        for store_id, slug, custom_domain in session.info.pop('changed_stores', ()):
+            invalidate_store(store_id, slug, custom_domain)
+
+    @event.listens_for(db.session, 'after_rollback')
+    def forget_changed_stores(session):
+        session.info.pop('changed_stores', None)
+
+    app.wsgi_app = StoreHostMiddleware(app.wsgi_app, app)
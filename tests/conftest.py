@@ -0,0 +1,106 @@
+import os
+import tempfile
+
+import pytest
+from jinja2 import ChoiceLoader, FileSystemLoader
+
+# Configure the app before app.py builds it at import time
+_tmp = tempfile.mkdtemp(prefix='take-app-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ['CATALOG_DIR'] = os.path.join(_tmp, 'catalog')
+os.environ['GATEWAY_ARCHIVE_DIR'] = os.path.join(_tmp, 'gateway_archive')
+os.environ['JINJA_CACHE_DIR'] = os.path.join(_tmp, 'jinja')
+# Full-strength hashing makes every login take a third of a second
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+
+from app import app as flask_app, db  # noqa: E402
+
+
+def reset_caches():
+    """Forget the per-process caches, so each test starts from its own rows"""
+    import auth
+    import pagination
+    import principal
+    import tenants
+    import rates
+    import store
+
+    for cache in (principal._cache, tenants._cache, tenants._keys_by_store, pagination._count_cache):
+        cache.clear()
+    for limiter in (auth.login_ip_limiter, auth.login_account_limiter, auth.register_ip_limiter,
+                    store.whatsapp_order_limiter):
+        limiter._buckets.clear()
+    rates._rates = None
+    rates._price_lists.clear()
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    # Mail was set up before TESTING; never reach the SMTP server from tests
+    flask_app.extensions['mail'].suppress = True
+    with flask_app.app_context():
+        db.create_all()
+        reset_caches()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def page_templates(app):
+    """Render pages missing from this tree with the stand-ins in tests/templates"""
+    loader = app.jinja_env.loader
+    app.jinja_env.loader = ChoiceLoader([loader, FileSystemLoader(
+        os.path.join(os.path.dirname(__file__), 'templates'))])
+    yield
+    app.jinja_env.loader = loader
+
+
+def make_user(username='merchant', is_admin=False, **fields):
+    from models import User
+    user = User(username=username, email=f'{username}@example.com', first_name='Test',
+                last_name='User', is_admin=is_admin, **fields)
+    user.set_password('secret123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def make_store(owner, slug='shop', **fields):
+    from models import Store
+    store = Store(name=fields.pop('name', slug.title()), slug=slug, owner_id=owner.id, **fields)
+    db.session.add(store)
+    db.session.commit()
+    return store
+
+
+def make_product(store, name='Tea', price_minor=250, stock_quantity=10, **fields):
+    from models import Product
+    product = Product(store_id=store.id, name=name, price_minor=price_minor,
+                      stock_quantity=stock_quantity, **fields)
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def login(client, user):
+    return client.post('/login', data={'email': user.email, 'password': 'secret123'})
+
+
+def make_order(store, lines, customer=None, currency='USD', **fields):
+    """Place an order for lines of (product, quantity) through place_order"""
+    from models import Order
+    from orders import place_order
+
+    items = [{'product': product, 'quantity': quantity, 'total_minor': product.price_minor * quantity}
+             for product, quantity in lines]
+    total = sum(item['total_minor'] for item in items)
+    order = Order(store_id=store.id, customer_id=customer.id if customer else None, currency=currency,
+                  subtotal_minor=total, total_minor=total, **fields)
+    return place_order(order, items)
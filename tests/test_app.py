@@ -0,0 +1,26 @@
+from app import db
+from conftest import make_user, make_store, login
+
+
+def test_models_share_the_app_database(app):
+    import models
+    assert models.db is db
+    user = make_user()
+    assert db.session.get(models.User, user.id).username == 'merchant'
+
+
+def test_home_and_store_listing(client):
+    owner = make_user()
+    make_store(owner, slug='corner-shop', name='Corner Shop', description='Groceries')
+    assert client.get('/').status_code == 200
+    response = client.get('/stores')
+    assert response.status_code == 200
+    assert b'Corner Shop' in response.data
+
+
+def test_login_loads_the_principal(client):
+    user = make_user()
+    response = login(client, user)
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/dashboard')
+    assert client.get('/dashboard').status_code == 200
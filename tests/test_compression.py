@@ -0,0 +1,47 @@
+import gzip
+import json
+
+from conftest import make_user, make_store, make_product
+
+
+def make_catalog(app):
+    store = make_store(make_user(), slug='shop')
+    for n in range(20):
+        make_product(store, name=f'Product number {n}', description='x' * 40)
+    assert app.config['COMPRESS_MIN_SIZE'] < 2000
+
+
+def test_compressed_catalog_revalidates_with_its_own_etag(app, client):
+    make_catalog(app)
+    first = client.get('/store/shop/catalog.json', headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == 200
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(first.data))['products']) == 20
+    etag = first.headers['ETag']
+    assert etag.endswith('-gzip"')
+
+    again = client.get('/store/shop/catalog.json',
+                       headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+
+def test_uncompressed_catalog_revalidates(app, client):
+    make_catalog(app)
+    first = client.get('/store/shop/catalog.json', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in first.headers
+    again = client.get('/store/shop/catalog.json',
+                       headers={'Accept-Encoding': 'identity', 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+
+
+def test_changed_catalog_is_sent_again(app, client):
+    make_catalog(app)
+    etag = client.get('/store/shop/catalog.json', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    from models import Store
+    make_product(Store.query.filter_by(slug='shop').one(), name='Brand new')
+    changed = client.get('/store/shop/catalog.json', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
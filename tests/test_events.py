@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order
+import events
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def utcnow(cls):
+        return datetime(2026, 10, 19, 12, 0, 0)
+
+
+def status_rows(order, new_status):
+    return [{'order_id': order.id, 'store_id': order.store_id, 'event_type': events.ORDER_STATUS_CHANGED,
+             'old_status': order.status, 'new_status': new_status, 'data': {'source': 'test'}}]
+
+
+def test_bulk_events_publish_only_their_own_rows(app, monkeypatch):
+    store = make_store(make_user())
+    order = make_order(store, [(make_product(store), 1)])
+    published = []
+    events.bus.subscribe(published.append)
+    try:
+        monkeypatch.setattr(events, 'datetime', FrozenDatetime)
+        # Another batch in the same timestamp tick, already in the log
+        events.record_events_bulk(status_rows(order, 'paid'))
+        db.session.commit()
+
+        events.record_events_bulk(status_rows(order, 'shipped'), publish=True)
+        db.session.commit()
+    finally:
+        events.bus.unsubscribe(published.append)
+
+    assert [(e.type, e.new_status, e.data) for e in published] == \
+        [(events.ORDER_STATUS_CHANGED, 'shipped', {'source': 'test'})]
+    assert published[0].id is not None
+
+
+def test_events_are_published_after_commit_only(app):
+    store = make_store(make_user())
+    order = make_order(store, [(make_product(store), 1)])
+    published = []
+    events.bus.subscribe(published.append)
+    try:
+        events.record_events_bulk(status_rows(order, 'paid'), publish=True)
+        assert published == []
+        db.session.rollback()
+        assert published == []
+    finally:
+        events.bus.unsubscribe(published.append)
+
+
+def test_order_emails_follow_the_log_from_their_offset(app, monkeypatch):
+    from app import mail
+    from models import EventConsumer
+    monkeypatch.setitem(app.config, 'MAIL_USERNAME', 'orders@example.com')
+    consumer = events.get_consumer('merchant_order_emails')
+    store = make_store(make_user())
+    product = make_product(store, price_minor=8600)
+    make_order(store, [(product, 1)])
+
+    with mail.record_messages() as outbox:
+        # First run starts at the end of the log: history is not mailed
+        assert consumer.catch_up(db) == 0
+        start = db.session.get(EventConsumer, 'merchant_order_emails').last_event_id
+        first = make_order(store, [(product, 1)], currency='SLS')
+        second = make_order(store, [(product, 2)])
+        assert consumer.catch_up(db) == 2
+        assert consumer.catch_up(db) == 0
+
+    assert db.session.get(EventConsumer, 'merchant_order_emails').last_event_id > start
+    assert len(outbox) == 1
+    assert outbox[0].subject == '2 new order(s) at Shop'
+    assert outbox[0].recipients == ['merchant@example.com']
+    assert f'- {first.order_number}: 8,600 SLS' in outbox[0].body
+    assert f'- {second.order_number}: 172.00 USD' in outbox[0].body
+
+
+def test_events_script_runs_the_registered_consumers(app, monkeypatch):
+    ran = []
+    monkeypatch.setattr(events.get_consumer('merchant_order_emails'), 'catch_up',
+                        lambda db: ran.append(True) or 0)
+
+    events.run_consumers(app, db, once=True)
+
+    assert ran == [True]
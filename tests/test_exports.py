@@ -0,0 +1,33 @@
+import csv
+import io
+
+from conftest import make_user, make_store, make_product, make_order
+from exports import parse_export_filters, stream_order_export
+
+
+def export_rows(filters=None):
+    text = ''.join(stream_order_export(parse_export_filters(filters or {})))
+    return list(csv.reader(io.StringIO(text.lstrip('\ufeff'))))
+
+
+def test_formula_cells_are_quoted(app):
+    owner = make_user()
+    store = make_store(owner, slug='evil', name='=HYPERLINK("http://x.example","click")')
+    make_order(store, [(make_product(store), 2)])
+
+    header, row = export_rows()
+    assert row[header.index('store')] == '\'=HYPERLINK("http://x.example","click")'
+    # Amounts are numbers, not text, and stay as they are
+    assert row[header.index('total')] == '5.00'
+
+
+def test_filters_by_status(app):
+    owner = make_user()
+    store = make_store(owner)
+    product = make_product(store)
+    make_order(store, [(product, 1)], status='paid')
+    make_order(store, [(product, 1)], status='pending')
+
+    rows = export_rows({'status': 'paid'})
+    assert len(rows) == 2
+    assert rows[1][rows[0].index('status')] == 'paid'
@@ -0,0 +1,67 @@
+import pytest
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order, login
+from fulfillment import transition_orders, TransitionError, sources_for
+from models import Order, OrderEvent, Product, StockMovement
+import events
+
+
+def statuses(*orders):
+    db.session.expire_all()
+    return [db.session.get(Order, order.id).status for order in orders]
+
+
+def test_orders_only_move_forward():
+    assert sources_for('paid') == ['pending']
+    assert sources_for('cancelled') == ['pending', 'paid']
+    assert sources_for('delivered') == ['shipped']
+    assert sources_for('pending') == []
+
+
+def test_transition_skips_orders_that_cannot_move(app):
+    store = make_store(make_user())
+    product = make_product(store)
+    pending = make_order(store, [(product, 1)])
+    shipped = make_order(store, [(product, 1)], status='shipped')
+
+    result = transition_orders(db, [Order.id.in_([pending.id, shipped.id])], 'paid', 'test')
+
+    assert (result.updated, result.skipped) == (1, 1)
+    assert statuses(pending, shipped) == ['paid', 'shipped']
+    event = OrderEvent.query.filter_by(order_id=pending.id, event_type=events.ORDER_STATUS_CHANGED).one()
+    assert (event.old_status, event.new_status) == ('pending', 'paid')
+
+
+def test_cancelling_puts_the_items_back(app):
+    store = make_store(make_user())
+    tea = make_product(store, name='Tea', stock_quantity=10)
+    cake = make_product(store, name='Cake', stock_quantity=5)
+    order = make_order(store, [(tea, 3), (cake, 2)], status='paid')
+    delivered = make_order(store, [(tea, 1)], status='delivered')
+
+    transition_orders(db, [Order.id.in_([order.id, delivered.id])], 'cancelled', 'test')
+
+    assert statuses(order, delivered) == ['cancelled', 'delivered']
+    assert (db.session.get(Product, tea.id).stock_quantity, db.session.get(Product, cake.id).stock_quantity) == (9, 5)
+    assert sorted((m.product_id, m.change) for m in StockMovement.query.filter_by(reason='cancel')) == \
+        sorted([(tea.id, 3), (cake.id, 2)])
+
+
+@pytest.mark.parametrize('status', ['pending', 'refunded'])
+def test_impossible_targets_are_refused(app, status):
+    with pytest.raises(TransitionError):
+        transition_orders(db, [], status, 'test')
+
+
+def test_merchants_only_move_their_own_orders(app, client):
+    merchant = make_user()
+    own_store = make_store(merchant)
+    own = make_order(own_store, [(make_product(own_store), 1)])
+    other_store = make_store(make_user('other'), slug='other')
+    other = make_order(other_store, [(make_product(other_store), 1)])
+    login(client, merchant)
+
+    client.post('/dashboard/orders/bulk-status', data={'status': 'paid', 'order_ids': [own.id, other.id]})
+
+    assert statuses(own, other) == ['paid', 'pending']
@@ -0,0 +1,80 @@
+import os
+import zlib
+
+import pytest
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order
+from gateway_archive import archive_payload, extract_fields, load_payload
+from models import GatewayPayload, Payment
+
+PAYLOAD = {'id': 'pi_123', 'status': 'succeeded', 'amount': 1250, 'metadata': {'note': 'Café ☕'}}
+
+
+@pytest.fixture
+def payment(app):
+    store = make_store(make_user())
+    order = make_order(store, [(make_product(store), 5)])
+    return Payment(order_id=order.id, payment_method='stripe', amount_minor=1250)
+
+
+def archive(payment, payload=PAYLOAD):
+    db.session.add(payment)
+    archive_payload(payment, payload)
+    db.session.commit()
+    payment_id = payment.id
+    db.session.remove()
+    return db.session.get(Payment, payment_id)
+
+
+@pytest.mark.parametrize('method, payload, status', [
+    ('stripe', {'status': 'succeeded'}, 'succeeded'),
+    ('paypal', {'state': 'approved', 'status': 'ignored'}, 'approved'),
+    ('edahab', {'status': 0}, '0'),
+    ('evc_plus', {}, None),
+    ('unknown', {'status': 'x' * 40}, 'x' * 30),
+])
+def test_extract_fields(method, payload, status):
+    assert extract_fields(method, payload) == {'gateway_status': status}
+
+
+def test_table_mode_round_trips_compressed(app, payment, monkeypatch):
+    monkeypatch.setitem(app.config, 'GATEWAY_ARCHIVE', 'table')
+
+    payment = archive(payment)
+
+    stored = db.session.get(GatewayPayload, payment.id)
+    assert stored.path is None
+    assert zlib.decompress(stored.body).startswith(b'{"id":"pi_123"')
+    assert payment.gateway_status == 'succeeded'
+    assert load_payload(payment) == PAYLOAD
+
+
+def test_file_mode_writes_under_the_archive_dir(app, payment, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'GATEWAY_ARCHIVE', 'files')
+    monkeypatch.setitem(app.config, 'GATEWAY_ARCHIVE_DIR', str(tmp_path))
+
+    payment = archive(payment)
+
+    stored = db.session.get(GatewayPayload, payment.id)
+    assert stored.body is None
+    assert stored.path == os.path.join(payment.created_at.strftime('%Y/%m'), f'{payment.id}.json.z')
+    assert os.path.exists(tmp_path / stored.path)
+    assert load_payload(payment) == PAYLOAD
+
+
+def test_missing_file_loads_as_none(app, payment, tmp_path, monkeypatch, caplog):
+    monkeypatch.setitem(app.config, 'GATEWAY_ARCHIVE', 'files')
+    monkeypatch.setitem(app.config, 'GATEWAY_ARCHIVE_DIR', str(tmp_path))
+    payment = archive(payment)
+    os.remove(tmp_path / payment.archived_payload.path)
+
+    assert load_payload(payment) is None
+    assert 'is missing' in caplog.text
+
+
+def test_payments_without_an_archive_load_as_none(app, payment):
+    db.session.add(payment)
+    db.session.commit()
+
+    assert load_payload(payment) is None
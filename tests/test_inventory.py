@@ -0,0 +1,51 @@
+from app import db, mail
+from conftest import make_user, make_store, make_product, make_order
+from inventory import apply_stock_changes, send_digests
+from models import LowStockAlert, Product, StockMovement
+
+
+def stock(product):
+    db.session.expire_all()
+    return db.session.get(Product, product.id).stock_quantity
+
+
+def test_orders_take_stock_through_the_ledger(app):
+    store = make_store(make_user())
+    tea = make_product(store, stock_quantity=10)
+
+    order = make_order(store, [(tea, 3)])
+
+    assert stock(tea) == 7
+    movement = StockMovement.query.filter_by(reason='order').one()
+    assert (movement.product_id, movement.order_id, movement.change) == (tea.id, order.id, -3)
+
+
+def test_low_stock_alerts_once_until_restocked(app):
+    store = make_store(make_user())
+    tea = make_product(store, stock_quantity=8, low_stock_threshold=5)
+
+    make_order(store, [(tea, 2)])
+    assert LowStockAlert.query.count() == 0
+    make_order(store, [(tea, 1)])
+    make_order(store, [(tea, 1)])
+    assert [(a.product_id, a.stock_quantity) for a in LowStockAlert.query] == [(tea.id, 5)]
+
+    # Back above the threshold re-arms it, the next fall alerts again
+    apply_stock_changes(db, [{'product_id': tea.id, 'change': 10}], 'adjust')
+    db.session.commit()
+    make_order(store, [(tea, 10)])
+    assert [a.stock_quantity for a in LowStockAlert.query.order_by(LowStockAlert.id)] == [5, 4]
+
+
+def test_digest_is_sent_once_per_store(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAIL_USERNAME', 'alerts@example.com')
+    store = make_store(make_user())
+    for name in ('Tea', 'Cake'):
+        make_order(store, [(make_product(store, name=name, stock_quantity=3), 1)])
+
+    with mail.record_messages() as outbox:
+        assert send_digests(app, db, mail) == 1
+        assert send_digests(app, db, mail) == 0
+
+    assert len(outbox) == 1
+    assert '- Cake: 2 left' in outbox[0].body and '- Tea: 2 left' in outbox[0].body
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import make_user, make_store, login
+import dashboard
+from notifications import broker
+
+
+def open_streams():
+    return broker._count
+
+
+def test_stream_unsubscribes_when_the_response_closes(app, client):
+    app.config['SSE_STREAM_SECONDS'] = 0
+    user = make_user()
+    make_store(user)
+    login(client, user)
+
+    response = client.get('/dashboard/orders/events')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == 'retry: 3000\n\n'
+    response.close()
+    assert open_streams() == 0
+
+
+def test_unread_stream_is_unsubscribed(app, client):
+    user = make_user()
+    make_store(user)
+    login(client, user)
+
+    response = client.get('/dashboard/orders/events')
+    assert open_streams() == 1
+    # The client went away before the first frame
+    response.close()
+    assert open_streams() == 0
+
+
+def test_backlog_failure_releases_the_subscription(app, client, monkeypatch):
+    user = make_user()
+    make_store(user)
+    login(client, user)
+
+    def broken(store_ids, last_event_id):
+        raise RuntimeError('database went away')
+    monkeypatch.setattr(dashboard, 'events_since', broken)
+
+    with pytest.raises(RuntimeError):
+        client.get('/dashboard/orders/events', headers={'Last-Event-ID': '5'})
+    assert open_streams() == 0
+
+
+def test_stream_cap_must_leave_threads_for_pages(tmp_path):
+    env = dict(os.environ, GUNICORN_THREADS='8', SSE_MAX_CONNECTIONS='8',
+               DATABASE_URL='sqlite:///' + str(tmp_path / 'cap.db'))
+    result = subprocess.run([sys.executable, '-c', 'import app'], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.returncode != 0
+    assert 'SSE_MAX_CONNECTIONS (8) must be lower than GUNICORN_THREADS (8)' in result.stderr
@@ -0,0 +1,24 @@
+from flask import render_template_string
+
+from conftest import make_user, make_store
+
+
+def test_service_worker_may_control_the_store_page(app, client):
+    make_store(make_user(), slug='shop')
+
+    response = client.get('/store/shop/sw.js')
+
+    assert response.status_code == 200
+    assert response.headers['Service-Worker-Allowed'] == '/store/shop'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+
+def test_store_pages_register_the_worker_for_the_store_page(app):
+    store = make_store(make_user(), slug='shop')
+
+    with app.test_request_context('/store/shop'):
+        html = render_template_string('{% extends "base.html" %}', store=store)
+
+    assert 'data-store-sw="/store/shop/sw.js"' in html
+    assert 'data-store-scope="/store/shop"' in html
+    assert 'data-catalog-url="/store/shop/catalog.json"' in html
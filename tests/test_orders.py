@@ -0,0 +1,55 @@
+import json
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order
+from models import Order, OrderItem, OrderEvent
+from orders import generate_order_number, place_order
+import events
+import orders
+
+
+def test_order_numbers_sort_in_creation_order():
+    numbers = [generate_order_number() for _ in range(1000)]
+
+    assert len(set(numbers)) == len(numbers)
+    assert numbers == sorted(numbers)
+    assert all(len(number) == 20 and number.startswith('ORD-') for number in numbers)
+
+
+def test_place_order_inserts_items_and_logs_the_order(app):
+    store = make_store(make_user())
+    tea = make_product(store, name='Tea', price_minor=250)
+    cake = make_product(store, name='Cake', price_minor=400)
+
+    order = make_order(store, [(tea, 2), (cake, 1)])
+
+    assert order.order_number.startswith('ORD-')
+    assert sorted((i.product_id, i.quantity, i.price_minor, i.total_minor)
+                  for i in OrderItem.query.filter_by(order_id=order.id)) == \
+        sorted([(tea.id, 2, 250, 500), (cake.id, 1, 400, 400)])
+    event = OrderEvent.query.filter_by(order_id=order.id).one()
+    assert event.event_type == events.ORDER_CREATED
+    assert json.loads(event.data)['total_minor'] == 900
+
+
+def test_converted_prices_are_kept_on_the_items(app):
+    store = make_store(make_user())
+    tea = make_product(store, price_minor=250)
+
+    order = place_order(Order(store_id=store.id, currency='SLS', subtotal_minor=2150, total_minor=2150),
+                        [{'product': tea, 'quantity': 1, 'price_minor': 2150, 'total_minor': 2150}])
+
+    assert db.session.query(OrderItem.price_minor).filter_by(order_id=order.id).scalar() == 2150
+
+
+def test_order_number_collisions_are_retried(app, monkeypatch):
+    store = make_store(make_user())
+    first = make_order(store, [(make_product(store), 1)])
+    monkeypatch.setattr(orders, 'generate_order_number', lambda: 'ORD-0000000000000002')
+
+    # A new order that happens to draw a number already taken
+    clash = Order(store_id=store.id, subtotal_minor=0, total_minor=0, order_number=first.order_number)
+    placed = place_order(clash, [])
+
+    assert placed.order_number == 'ORD-0000000000000002'
+    assert Order.query.count() == 2
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+from app import db
+from conftest import make_user, make_store
+from models import Order
+from pagination import keyset_paginate
+
+
+def make_orders(store, count, start=datetime(2026, 1, 1)):
+    # Pairs share a timestamp, so the id tie-breaker is exercised too
+    db.session.add_all([Order(store_id=store.id, subtotal_minor=100, total_minor=100,
+                              created_at=start + timedelta(minutes=n // 2)) for n in range(count)])
+    db.session.commit()
+
+
+def newest_first():
+    return [o.id for o in Order.query.order_by(Order.created_at.desc(), Order.id.desc())]
+
+
+def test_pages_forward_and_back_without_gaps(app):
+    make_orders(make_store(make_user()), 45)
+    expected = newest_first()
+
+    first = keyset_paginate(Order.query, Order, per_page=20)
+    second = keyset_paginate(Order.query, Order, after=first.next_cursor, per_page=20)
+    third = keyset_paginate(Order.query, Order, after=second.next_cursor, per_page=20)
+    assert [o.id for page in (first, second, third) for o in page] == expected
+    assert not first.has_prev and first.has_next
+    assert third.has_prev and not third.has_next
+
+    back = keyset_paginate(Order.query, Order, before=second.prev_cursor, per_page=20)
+    assert [o.id for o in back] == [o.id for o in first]
+    assert not back.has_prev
+
+
+def test_malformed_cursor_starts_from_the_top(app):
+    make_orders(make_store(make_user()), 3)
+    assert [o.id for o in keyset_paginate(Order.query, Order, after='garbage')] == newest_first()
+
+
+def query_plan(query):
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return ' '.join(row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql)))
+
+
+def test_listings_read_the_keyset_indexes_without_sorting(app):
+    store = make_store(make_user())
+    make_orders(store, 10)
+    newest = (Order.created_at.desc(), Order.id.desc())
+
+    plans = {
+        'ix_order_created_at_id': Order.query.order_by(*newest).limit(21),
+        'ix_order_status_created_at_id': Order.query.filter(Order.status == 'paid').order_by(*newest).limit(21),
+        'ix_order_store_id_created_at_id': Order.query.filter(Order.store_id == store.id)
+                                                      .order_by(*newest).limit(21),
+    }
+    for index, query in plans.items():
+        plan = query_plan(query)
+        assert index in plan
+        assert 'TEMP B-TREE' not in plan
@@ -0,0 +1,28 @@
+from werkzeug.security import generate_password_hash
+
+import passwords
+from ratelimit import client_ip
+
+
+def use_method(monkeypatch, method):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_METHOD', method)
+    monkeypatch.setattr(passwords, '_method_prefix', None)
+
+
+def test_short_method_names_do_not_force_a_rehash(monkeypatch):
+    for method in ('scrypt', 'pbkdf2'):
+        use_method(monkeypatch, method)
+        assert not passwords.needs_rehash(generate_password_hash('pw', method))
+
+
+def test_changed_parameters_force_a_rehash(monkeypatch):
+    use_method(monkeypatch, 'pbkdf2:sha256:1000')
+    assert passwords.needs_rehash(generate_password_hash('pw', 'pbkdf2:sha256:2000'))
+    assert passwords.needs_rehash(generate_password_hash('pw', 'scrypt'))
+
+
+def test_forwarded_for_is_ignored_without_a_trusted_proxy(app):
+    with app.test_request_context(headers={'X-Forwarded-For': '203.0.113.9'},
+                                  environ_base={'REMOTE_ADDR': '198.51.100.4'}):
+        from flask import request
+        assert client_ip(request) == '198.51.100.4'
@@ -0,0 +1,72 @@
+import pytest
+import stripe
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order
+from fulfillment import transition_orders
+from models import Order, OrderEvent, Payment, Product
+
+
+@pytest.fixture
+def stripe_event(monkeypatch):
+    """Post a payment_intent.succeeded webhook for an order, skipping the signature check"""
+    def send(client, order, intent_id='pi_1'):
+        intent = {'id': intent_id, 'amount': order.total_minor, 'currency': 'usd',
+                  'metadata': {'order_id': str(order.id)}}
+        monkeypatch.setattr(stripe.Webhook, 'construct_event', lambda payload, sig, secret: {
+            'type': 'payment_intent.succeeded', 'data': {'object': intent}})
+        return client.post('/payment/stripe/webhook', data=b'{}')
+    return send
+
+
+def order_status(order):
+    db.session.expire_all()
+    return db.session.get(Order, order.id).status
+
+
+def test_webhook_marks_a_pending_order_paid(app, client, stripe_event):
+    store = make_store(make_user())
+    order = make_order(store, [(make_product(store), 1)])
+
+    assert stripe_event(client, order).status_code == 200
+
+    assert order_status(order) == 'paid'
+    assert [(p.status, p.transaction_id) for p in Payment.query] == [('completed', 'pi_1')]
+    assert [(e.old_status, e.new_status) for e in OrderEvent.query.filter_by(event_type='order.status_changed')] \
+        == [('pending', 'paid')]
+
+
+def test_retried_webhook_records_the_payment_once(app, client, stripe_event):
+    store = make_store(make_user())
+    order = make_order(store, [(make_product(store), 1)])
+
+    stripe_event(client, order)
+    stripe_event(client, order)
+
+    assert Payment.query.count() == 1
+    assert order_status(order) == 'paid'
+
+
+@pytest.mark.parametrize('status', ['shipped', 'delivered'])
+def test_late_webhook_does_not_move_a_shipped_order_back(app, client, stripe_event, status):
+    store = make_store(make_user())
+    order = make_order(store, [(make_product(store), 1)], status=status)
+
+    stripe_event(client, order)
+
+    assert order_status(order) == status
+    assert [p.status for p in Payment.query] == ['refund_due']
+
+
+def test_late_webhook_does_not_revive_a_cancelled_order(app, client, stripe_event):
+    store = make_store(make_user())
+    product = make_product(store, stock_quantity=10)
+    order = make_order(store, [(product, 3)])
+    transition_orders(db, [Order.id == order.id], 'cancelled', 'whatsapp_expired')
+    stock = db.session.get(Product, product.id).stock_quantity
+
+    stripe_event(client, order)
+
+    assert order_status(order) == 'cancelled'
+    assert db.session.get(Product, product.id).stock_quantity == stock
+    assert [p.status for p in Payment.query] == ['refund_due']
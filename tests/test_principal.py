@@ -0,0 +1,23 @@
+from app import db
+from conftest import make_user
+from principal import get_principal, invalidate_principal
+
+
+def test_principal_is_cached_until_invalidated(app):
+    user = make_user()
+    assert get_principal(user.id).username == 'merchant'
+
+    user.username = 'renamed'
+    db.session.commit()
+    assert get_principal(user.id).username == 'merchant'
+
+    invalidate_principal(user.id)
+    assert get_principal(user.id).username == 'renamed'
+
+
+def test_principal_falls_through_to_the_user_row(app):
+    user = make_user()
+    principal = get_principal(user.id)
+    assert principal.email == 'merchant@example.com'
+    assert principal == user
+    assert get_principal(user.id + 1) is None
@@ -0,0 +1,72 @@
+import pytest
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order, login
+from models import Payment
+from querycount import QueryCounter, assert_max_queries
+
+# Statements per page, however many rows it lists
+PAGE_BUDGETS = {
+    '/admin': 9,
+    '/admin/orders': 7,
+    '/admin/orders?status=pending': 2,
+    '/admin/users': 2,
+    '/admin/stores': 2,
+    '/admin/payments': 5,
+    '/dashboard': 5,
+    '/dashboard/orders': 1,
+    '/store/shop0': 4,
+}
+
+
+def seed(rows):
+    """rows stores for the logged-in merchant and rows more with their own owners.
+
+    Every store has a product and an order from its own customer with a
+    payment, so anything loaded per row shows up as extra queries.
+    """
+    merchant = make_user('merchant', is_admin=True)
+    for n in range(rows * 2):
+        owner = merchant if n < rows else make_user(f'owner{n}')
+        store = make_store(owner, slug=f'shop{n}')
+        product = make_product(store, name=f'Product {n}')
+        order = make_order(store, [(product, 1)], customer=make_user(f'customer{n}'))
+        db.session.add(Payment(order_id=order.id, payment_method='cod', amount_minor=order.total_minor))
+    db.session.commit()
+    return merchant
+
+
+def page_queries(client, url):
+    # Warm the per-process caches (exchange rates, price lists), which only
+    # cost a query the first time
+    client.get(url)
+    # Requests share the test's app context; start from an empty session so
+    # nothing is served from the identity map
+    db.session.remove()
+    with QueryCounter() as counter:
+        response = client.get(url)
+    assert response.status_code == 200, url
+    return counter.count
+
+
+@pytest.mark.parametrize('url', PAGE_BUDGETS)
+def test_page_queries_do_not_grow_with_rows(app, client, page_templates, url):
+    login(client, seed(rows=3))
+    few = page_queries(client, url)
+
+    for n in range(3, 15):
+        store = make_store(make_user(f'late-owner{n}'), slug=f'late{n}')
+        order = make_order(store, [(make_product(store), 1)], customer=make_user(f'late-customer{n}'))
+        db.session.add(Payment(order_id=order.id, payment_method='cod', amount_minor=order.total_minor))
+    db.session.commit()
+
+    assert page_queries(client, url) == few
+
+
+@pytest.mark.parametrize('url,budget', PAGE_BUDGETS.items())
+def test_pages_stay_within_budget(app, client, page_templates, url, budget):
+    login(client, seed(rows=10))
+    client.get(url)
+    db.session.remove()
+    with assert_max_queries(budget):
+        assert client.get(url).status_code == 200
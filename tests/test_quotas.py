@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from threading import Barrier, Thread
+
+import pytest
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order, login
+from models import Product, Store, UsageCounter, User
+from quotas import consume, current_period, expire_subscriptions, rebuild_counters, QuotaExceeded
+
+
+def usage(user, metric):
+    db.session.expire_all()
+    return db.session.query(UsageCounter.value).filter_by(
+        user_id=user.id, metric=metric, period=current_period(metric)).scalar()
+
+
+def test_free_tier_allows_one_store(app, client):
+    user = make_user()
+    login(client, user)
+
+    for name in ('First', 'Second'):
+        client.post('/dashboard/stores/new', data={'name': name, 'theme': 'classic'})
+
+    assert [name for (name,) in db.session.query(Store.name)] == ['First']
+    assert usage(user, 'stores') == 1
+
+
+def test_limits_follow_the_tier(app):
+    user = make_user()
+    consume(user.id, 'free', 'products', amount=25)
+    with pytest.raises(QuotaExceeded, match='free plan allows 25 products'):
+        consume(user.id, 'free', 'products')
+
+    consume(user.id, 'basic', 'products')
+    for _ in range(100):
+        consume(user.id, 'premium', 'products')
+    assert usage(user, 'products') == 126
+
+
+def test_a_batch_over_the_limit_takes_nothing(app):
+    user = make_user()
+    consume(user.id, 'free', 'products', amount=24)
+
+    with pytest.raises(QuotaExceeded):
+        consume(user.id, 'free', 'products', amount=2)
+    assert usage(user, 'products') == 24
+
+
+def test_concurrent_consumers_cannot_overshoot(app):
+    user_id = make_user().id
+    consume(user_id, 'free', 'orders', amount=95)
+    db.session.commit()
+    barrier = Barrier(10)
+    outcomes = []
+
+    def place():
+        with app.app_context():
+            barrier.wait()
+            try:
+                consume(user_id, 'free', 'orders')
+                db.session.commit()
+                outcomes.append(True)
+            except QuotaExceeded:
+                db.session.rollback()
+                outcomes.append(False)
+            finally:
+                db.session.remove()
+
+    threads = [Thread(target=place) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes.count(True) == 5
+    assert usage(db.session.get(User, user_id), 'orders') == 100
+
+
+def test_deleting_gives_the_count_back(app):
+    user = make_user()
+    consume(user.id, 'free', 'stores')
+    store = make_store(user)
+    consume(user.id, 'free', 'products', amount=2)
+    tea, cake = make_product(store, name='Tea'), make_product(store, name='Cake')
+
+    db.session.delete(tea)
+    db.session.commit()
+    assert usage(user, 'products') == 1
+
+    db.session.delete(db.session.get(Product, cake.id))
+    db.session.delete(db.session.get(Store, store.id))
+    db.session.commit()
+    assert (usage(user, 'stores'), usage(user, 'products')) == (0, 0)
+    # The free plan's one store is available again
+    consume(user.id, 'free', 'stores')
+
+
+def test_lapsed_subscriptions_are_downgraded(app):
+    now = datetime.utcnow()
+    lapsed = make_user('lapsed', subscription_tier='basic', subscription_expires=now - timedelta(days=1))
+    current = make_user('current', subscription_tier='premium', subscription_expires=now + timedelta(days=1))
+    forever = make_user('forever', subscription_tier='basic')
+
+    assert expire_subscriptions(db) == 1
+
+    db.session.expire_all()
+    assert [db.session.get(User, u.id).subscription_tier for u in (lapsed, current, forever)] == \
+        ['free', 'premium', 'basic']
+
+
+def test_rebuild_recounts_from_the_tables(app):
+    user = make_user()
+    store = make_store(user)
+    product = make_product(store)
+    make_product(store, name='Cake')
+    make_order(store, [(product, 1)])
+    make_order(store, [(product, 1)], created_at=datetime.utcnow() - timedelta(days=40))
+    db.session.add(UsageCounter(user_id=user.id, metric='products', period='', value=99))
+    db.session.commit()
+
+    rebuild_counters(db)
+
+    assert (usage(user, 'stores'), usage(user, 'products'), usage(user, 'orders')) == (1, 2, 1)
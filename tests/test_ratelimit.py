@@ -0,0 +1,44 @@
+from conftest import make_user
+from ratelimit import RateLimiter
+
+
+def attempt(client, email, password, ip='198.51.100.4'):
+    response = client.post('/login', data={'email': email, 'password': password},
+                           environ_base={'REMOTE_ADDR': ip})
+    client.get('/logout')
+    return response.status_code
+
+
+def test_full_table_evicts_the_idlest_buckets():
+    limiter = RateLimiter(rate=1 / 60, capacity=1, max_keys=10)
+    assert limiter.allow('victim') and not limiter.allow('victim')
+
+    for n in range(9):
+        limiter.allow(f'spray{n}')
+    limiter.allow('victim')
+    limiter.allow('spray-last')
+
+    assert not limiter.allow('victim')
+    assert len(limiter._buckets) <= 10
+
+
+def test_check_takes_no_tokens():
+    limiter = RateLimiter(rate=1 / 60, capacity=1)
+    assert limiter.check('key') and limiter.check('key')
+    assert limiter.allow('key')
+    assert not limiter.check('key')
+
+
+def test_failed_passwords_limit_the_account_from_that_ip(app, client):
+    user = make_user()
+
+    assert [attempt(client, user.email, 'wrong') for _ in range(5)] == [200] * 5
+    assert attempt(client, user.email, 'secret123') == 429
+    # The owner, elsewhere, still gets in
+    assert attempt(client, user.email, 'secret123', ip='203.0.113.7') == 302
+
+
+def test_successful_logins_are_not_charged(app, client):
+    user = make_user()
+
+    assert [attempt(client, user.email, 'secret123') for _ in range(7)] == [302] * 7
@@ -0,0 +1,54 @@
+from decimal import Decimal
+import json
+
+import pytest
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order
+from models import OrderEvent
+import events
+import rates
+
+
+def with_rates(**table):
+    for currency, rate in table.items():
+        rates.set_rate(db, currency, Decimal(rate), 'test')
+    db.session.commit()
+    rates.load_rates(force=True)
+
+
+def test_conversion_scales_between_minor_units(app):
+    with_rates(SLS='8600')
+
+    to_sls = rates.converter('USD', 'SLS')
+    # 2.50 USD (250 cents) is 21,500 whole shillings
+    assert to_sls.convert(250) == 21500
+    assert to_sls.convert_all([1, 100, None]) == [86, 8600, None]
+    # 43 shillings is exactly half a cent, which rounds away from zero
+    to_usd = rates.converter('SLS', 'USD')
+    assert to_usd.convert(43) == 1
+    assert to_usd.convert(42) == 0
+    assert to_usd.convert(-8600) == -100
+
+
+def test_totals_in_unknown_currencies_are_left_out(app):
+    with_rates(SLS='8600')
+
+    assert rates.to_default_currency({'USD': 150, 'SLS': 17200, 'EUR': 999}) == 350
+    with pytest.raises(rates.RateUnavailable):
+        rates.converter('USD', 'EUR')
+
+
+def test_money_format_follows_the_currency(app):
+    assert rates.format_money(123450, 'USD') == '1,234.50 USD'
+    assert rates.format_money(8600, 'SLS') == '8,600 SLS'
+
+
+@pytest.mark.parametrize('currency, exponent', [('USD', 2), ('SLS', 0)])
+def test_order_events_carry_the_currency_exponent(app, currency, exponent):
+    store = make_store(make_user())
+    order = make_order(store, [(make_product(store, price_minor=8600), 1)], currency=currency)
+
+    event = OrderEvent.query.filter_by(order_id=order.id, event_type=events.ORDER_CREATED).one()
+    data = json.loads(event.data)
+    assert (data['total_minor'], data['currency'], data['exponent']) == (8600, currency, exponent)
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order
+from models import Payment
+import reconcile
+
+
+def pending_payment(order, method, transaction_id):
+    payment = Payment(order_id=order.id, payment_method=method, amount_minor=order.total_minor,
+                      transaction_id=transaction_id)
+    db.session.add(payment)
+    db.session.commit()
+    return payment.id
+
+
+def payment_status(payment_id):
+    db.session.remove()
+    return db.session.get(Payment, payment_id).status
+
+
+def reconcile_orders(*payment_ids):
+    return [db.session.get(Payment, payment_id).order for payment_id in payment_ids]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_a_stuck_provider_does_not_hold_up_the_others(app, monkeypatch):
+    store = make_store(make_user())
+    product = make_product(store)
+    stuck = pending_payment(make_order(store, [(product, 1)]), 'evc_plus', 'evc-1')
+    quick = pending_payment(make_order(store, [(product, 1)]), 'edahab', 'edahab-1')
+
+    release = threading.Event()
+
+    def fetch_status(api_url, api_key, transaction_id):
+        if transaction_id.startswith('evc'):
+            release.wait(10)
+        return 'completed'
+
+    monkeypatch.setattr(reconcile, 'fetch_status', fetch_status)
+    runner = threading.Thread(target=reconcile.run, args=(app, db), kwargs={'once': True})
+    runner.start()
+    try:
+        assert wait_for(lambda: payment_status(quick) == 'completed')
+        assert payment_status(stuck) == 'pending'
+    finally:
+        release.set()
+        runner.join(10)
+
+    assert not runner.is_alive()
+    assert payment_status(stuck) == 'completed'
+    db.session.remove()
+    assert {o.status for o in reconcile_orders(stuck, quick)} == {'paid'}
@@ -0,0 +1,156 @@
+from datetime import date, datetime, timedelta
+import csv
+import io
+
+import pytest
+
+from app import db
+from conftest import make_user, make_store, make_product, make_order, login
+from exports import parse_export_filters, stream_order_export, stream_payment_export
+from models import Order, OrderArchive, Payment, PaymentArchive, OrderRollup, ProductSalesRollup, PaymentRollup
+from pagination import keyset_paginate
+from retention import archive_orders, archived_order_stats, get_order_or_404, month_label, newest_archived
+
+OLD = datetime(2025, 3, 10, 12, 0)
+
+
+@pytest.fixture
+def shop(app):
+    """Two finished orders past the horizon, one finished and one open order inside it"""
+    store = make_store(make_user())
+    product = make_product(store, price_minor=1000, stock_quantity=100)
+    delivered = make_order(store, [(product, 2)], status='delivered', created_at=OLD)
+    cancelled = make_order(store, [(product, 1)], status='cancelled', created_at=OLD + timedelta(days=2))
+    recent = make_order(store, [(product, 1)], status='delivered')
+    pending = make_order(store, [(product, 1)], status='pending', created_at=OLD)
+    db.session.add(Payment(order_id=delivered.id, payment_method='cod', amount_minor=2000,
+                           status='completed', created_at=OLD))
+    db.session.commit()
+    return store, product, delivered, cancelled, recent, pending
+
+
+def test_finished_orders_move_to_the_archive(shop):
+    delivered, cancelled, recent, pending = (order.id for order in shop[2:])
+
+    assert archive_orders(db, days=365) == 2
+
+    assert {order_id for (order_id,) in db.session.query(Order.id)} == {recent, pending}
+    assert {order_id for (order_id,) in db.session.query(OrderArchive.id)} == {delivered, cancelled}
+    assert Payment.query.count() == 0
+    assert isinstance(get_order_or_404(delivered), OrderArchive)
+
+
+def test_archived_orders_are_rolled_up(shop):
+    product = shop[1]
+
+    archive_orders(db, days=365)
+
+    assert sorted((r.day, r.status, r.currency, r.orders, r.total_minor) for r in OrderRollup.query) == [
+        (date(2025, 3, 10), 'delivered', 'USD', 1, 2000),
+        (date(2025, 3, 12), 'cancelled', 'USD', 1, 1000),
+    ]
+    assert sorted((r.product_id, r.day, r.quantity) for r in ProductSalesRollup.query) == [
+        (product.id, date(2025, 3, 10), 2),
+        (product.id, date(2025, 3, 12), 1),
+    ]
+    assert [(r.payment_method, r.status, r.payments, r.amount_minor) for r in PaymentRollup.query] == \
+        [('cod', 'completed', 1, 2000)]
+
+
+def test_rollups_accumulate_across_runs(shop):
+    store, product, *_ = shop
+    archive_orders(db, days=365)
+    make_order(store, [(product, 3)], status='delivered', created_at=OLD)
+
+    archive_orders(db, days=365)
+
+    row = db.session.get(OrderRollup, (store.id, date(2025, 3, 10), 'delivered', 'USD'))
+    assert (row.orders, row.total_minor) == (2, 5000)
+
+
+def test_archived_revenue_counts_delivered_orders(shop):
+    store = shop[0]
+    archive_orders(db, days=365)
+
+    # Cancelled orders are counted, but are not revenue
+    assert archived_order_stats(db) == (2, {'USD': 2000})
+    assert archived_order_stats(db, [store.id + 1]) == (0, {})
+
+
+def test_reports_combine_hot_and_archived_revenue(shop, client, page_templates):
+    archive_orders(db, days=365)
+    login(client, make_user('admin', is_admin=True))
+
+    index = client.get('/admin').get_data(as_text=True)
+    report = client.get('/admin/reports').get_data(as_text=True)
+
+    # 2 orders in the archive and 2 hot ones; revenue is both delivered orders
+    assert index.split()[3:5] == ['4', '30.00']
+    this_month = datetime.utcnow().strftime('%Y-%m')
+    assert report.split()[:2] == ['2025-03=20.00', f'{this_month}=10.00']
+    assert 'Tea:5' in report
+
+
+def exported(stream, **filters):
+    text = ''.join(stream(parse_export_filters(filters)))
+    header, *rows = csv.reader(io.StringIO(text.lstrip('\ufeff')))
+    return [dict(zip(header, row)) for row in rows]
+
+
+def test_exports_include_archived_orders(shop):
+    delivered, cancelled, recent, pending = (order.order_number for order in shop[2:])
+    archive_orders(db, days=365)
+
+    rows = exported(stream_order_export)
+    assert [row['order_number'] for row in rows] == [delivered, pending, cancelled, recent]
+    assert (rows[0]['status'], rows[0]['total']) == ('delivered', '20.00')
+
+    assert [row['status'] for row in exported(stream_order_export, status='delivered')] == ['delivered', 'delivered']
+    assert [row['status'] for row in exported(stream_order_export, date_to='2025-03-11')] == ['delivered', 'pending']
+    # Past the newest archived order the archive is not read at all
+    assert [row['order_number'] for row in exported(stream_order_export, date_from='2025-03-13')] == [recent]
+
+
+def test_exports_include_archived_payments(shop):
+    delivered = shop[2].order_number
+    archive_orders(db, days=365)
+
+    rows = exported(stream_payment_export, payment_method='cod')
+    assert [(row['order_number'], row['amount']) for row in rows] == [(delivered, '20.00')]
+
+
+def test_listings_page_through_hot_and_archived_orders(shop):
+    delivered, cancelled, recent, pending = (order.id for order in shop[2:])
+    archive_orders(db, days=365)
+    archive = (OrderArchive.query, OrderArchive, newest_archived(db, OrderArchive))
+
+    pages, after = [], None
+    while True:
+        page = keyset_paginate(Order.query, Order, after=after, per_page=1, archive=archive)
+        pages.append([order.id for order in page])
+        if not page.has_next:
+            break
+        after = page.next_cursor
+    assert pages == [[recent], [cancelled], [pending], [delivered]]
+
+    back = keyset_paginate(Order.query, Order, before=page.prev_cursor, per_page=2, archive=archive)
+    assert [order.id for order in back] == [cancelled, pending]
+    assert back.has_prev
+
+
+def test_admin_listings_show_archived_rows(shop, client, page_templates):
+    delivered, cancelled = (order.order_number for order in shop[2:4])
+    archive_orders(db, days=365)
+    login(client, make_user('admin', is_admin=True))
+
+    orders = client.get('/admin/orders?status=cancelled').get_data(as_text=True)
+    payments = client.get('/admin/payments').get_data(as_text=True)
+
+    assert orders.split()[:2] == [cancelled, 'Shop']
+    assert delivered in payments.split()
+    assert PaymentArchive.query.count() == 1
+
+
+def test_month_label():
+    assert month_label(202603) == '2026-03'
+    assert month_label(202612.0) == '2026-12'
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+from flask import g
+from sqlalchemy import create_engine, event
+
+from app import db
+from conftest import make_user, make_store, make_product
+from routing import REPLICA_BIND
+import routing
+
+
+@pytest.fixture
+def replica(app, tmp_path):
+    """A second SQLite file standing in for the read replica; yields a log of the engines used"""
+    engine = create_engine('sqlite:///' + os.path.join(tmp_path, 'replica.db'))
+    db.metadata.create_all(engine)
+    used = []
+
+    def on_replica(*args):
+        used.append('replica')
+
+    def on_primary(*args):
+        used.append('primary')
+    event.listen(engine, 'before_cursor_execute', on_replica)
+    event.listen(db.engine, 'before_cursor_execute', on_primary)
+    db.engines[REPLICA_BIND] = engine
+    yield used
+    del db.engines[REPLICA_BIND]
+    event.remove(db.engine, 'before_cursor_execute', on_primary)
+    engine.dispose()
+
+
+def request(app, client, method, url, **kwargs):
+    # Each request gets its own app context (and so its own g), as in production
+    with app.app_context():
+        return client.open(url, method=method, **kwargs)
+
+
+def test_replica_views_read_from_the_replica(app, client, replica):
+    make_store(make_user(), slug='shop')
+    replica.clear()
+
+    request(app, client, 'GET', '/store/shop/catalog.json')
+    assert set(replica) == {'primary'}  # not a replica view
+
+    replica.clear()
+    request(app, client, 'GET', '/store/shop/whatsapp-order/1')
+    assert replica and set(replica) == {'replica'}
+
+
+def test_a_write_pins_the_rest_of_the_request(app, replica):
+    with app.test_request_context():
+        g.read_replica = True
+        make_user()
+        replica.clear()
+        db.session.execute(db.text('SELECT 1'))
+    assert replica == ['primary']
+
+
+def test_writers_stay_on_the_primary_for_the_pin(app, client, replica, monkeypatch):
+    store = make_store(make_user(), slug='shop', phone='0615000000')
+    product = make_product(store)
+    now = [1000.0]
+    monkeypatch.setattr(routing.time, 'time', lambda: now[0])
+
+    with client.session_transaction() as session:
+        session['cart'] = {str(store.id): {str(product.id): 1}}
+    request(app, client, 'POST', '/store/shop/whatsapp-order')
+
+    replica.clear()
+    now[0] += app.config['REPLICA_PIN_SECONDS'] - 1
+    request(app, client, 'GET', f'/store/shop/whatsapp-order/{product.id}')
+    assert set(replica) == {'primary'}
+
+    replica.clear()
+    now[0] += 2
+    request(app, client, 'GET', f'/store/shop/whatsapp-order/{product.id}')
+    assert set(replica) == {'replica'}
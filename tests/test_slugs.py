@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from conftest import make_user, make_store
+from models import Store
+from slugs import slugify, next_free_slug, add_with_unique_slug, SLUG_MAX_LENGTH
+import slugs
+
+
+@pytest.mark.parametrize('name, slug', [
+    ('مطعم السلام', 'mtcm-alslam'),
+    ('Café Hargeisa', 'cafe-hargeisa'),
+    ('  Shop & Go!! ', 'shop-go'),
+    ('!!!', 'store'),
+    ('', 'store'),
+    ('متجر ٢٤', 'mtjr-24'),
+])
+def test_slugify(name, slug):
+    assert slugify(name) == slug
+
+
+def test_long_names_leave_room_for_a_suffix():
+    assert len(slugify('a' * 300)) == SLUG_MAX_LENGTH - 8
+
+
+def test_taken_slugs_get_the_next_suffix(app):
+    owner = make_user()
+    assert next_free_slug('shop') == 'shop'
+    for slug in ('shop', 'shop-2', 'shop-7', 'shop-floor', 'shopping'):
+        make_store(owner, slug=slug)
+
+    # One query over the prefix; non-numeric suffixes and other prefixes are ignored
+    assert next_free_slug('shop') == 'shop-8'
+    assert next_free_slug('shopping') == 'shopping-1'
+    assert next_free_slug('market') == 'market'
+
+
+def test_a_lost_race_retries_with_the_next_slug(app, monkeypatch):
+    owner = make_user()
+    make_store(owner, slug='shop')
+    # Another merchant took 'shop' between our lookup and our insert
+    suggestions = iter(['shop', 'shop-1'])
+    monkeypatch.setattr(slugs, 'next_free_slug', lambda base: next(suggestions))
+
+    store = add_with_unique_slug(Store(name='Shop', owner_id=owner.id), 'Shop')
+    db.session.commit()
+
+    assert store.slug == 'shop-1'
+    assert sorted(slug for (slug,) in db.session.query(Store.slug)) == ['shop', 'shop-1']
+
+
+def test_other_integrity_errors_are_not_retried(app, monkeypatch):
+    monkeypatch.setattr(slugs, 'next_free_slug', lambda base: base)
+
+    with pytest.raises(IntegrityError):
+        # No owner: a NOT NULL violation, not a slug clash
+        add_with_unique_slug(Store(name='Shop'), 'Shop')
@@ -0,0 +1,73 @@
+from app import db
+from conftest import make_user, make_store
+from models import Store
+from querycount import QueryCounter
+import tenants
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def edit_elsewhere(store_id, **values):
+    """Change a store the way another worker would: no invalidation reaches this process"""
+    store = Store.__table__
+    db.session.execute(store.update().where(store.c.id == store_id)
+                       .values(version=store.c.version + 1, **values))
+    db.session.commit()
+
+
+def test_other_workers_edits_are_seen_after_the_fresh_window(app, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tenants.time, 'monotonic', clock.monotonic)
+    store = make_store(make_user(), slug='shop', name='Old name')
+    assert tenants.get_store('shop').name == 'Old name'
+
+    edit_elsewhere(store.id, name='New name')
+    assert tenants.get_store('shop').name == 'Old name'
+
+    clock.now += tenants.STORE_CACHE_FRESH + 1
+    assert tenants.get_store('shop').name == 'New name'
+
+
+def test_unchanged_store_is_confirmed_with_a_version_probe(app, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tenants.time, 'monotonic', clock.monotonic)
+    make_store(make_user(), slug='shop')
+    cached = tenants.get_store('shop')
+
+    with QueryCounter() as counter:
+        assert tenants.get_store('shop') is cached
+    assert counter.count == 0
+
+    clock.now += tenants.STORE_CACHE_FRESH + 1
+    with QueryCounter() as counter:
+        assert tenants.get_store('shop') is cached
+    assert counter.count == 1
+    assert 'store.version' in counter.statements[0]
+
+
+def test_deactivated_and_created_stores_are_picked_up(app, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tenants.time, 'monotonic', clock.monotonic)
+    store = make_store(make_user(), slug='shop')
+    assert tenants.get_store('shop') is not None
+    assert tenants.get_store('later') is None
+
+    edit_elsewhere(store.id, is_active=False)
+    make_store(store.owner, slug='later')
+    clock.now += tenants.STORE_CACHE_FRESH + 1
+    assert tenants.get_store('shop') is None
+    assert tenants.get_store('later') is not None
+
+
+def test_local_commits_invalidate_at_once(app):
+    store = make_store(make_user(), slug='shop', name='Old name')
+    assert tenants.get_store('shop').name == 'Old name'
+    store.name = 'New name'
+    db.session.commit()
+    assert tenants.get_store('shop').name == 'New name'
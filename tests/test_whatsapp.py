@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+from app import db
+from conftest import make_user, make_store, make_product
+from fulfillment import expire_whatsapp_orders
+from models import Order, Product
+
+
+def fill_cart(client, store, product, quantity=2):
+    with client.session_transaction() as session:
+        session['cart'] = {str(store.id): {str(product.id): quantity}}
+
+
+def checkout(client, store, **form):
+    return client.post(f'/store/{store.slug}/whatsapp-order', data=form)
+
+
+def test_checkout_places_a_pending_whatsapp_order(app, client):
+    store = make_store(make_user(), phone='0615000000')
+    product = make_product(store, stock_quantity=10)
+    fill_cart(client, store, product)
+
+    response = checkout(client, store, notes='Ring twice')
+
+    assert response.status_code == 302
+    assert response.location.startswith('https://wa.me/252615000000?text=')
+    order = Order.query.one()
+    assert (order.channel, order.status, order.notes) == ('whatsapp', 'pending', 'Ring twice')
+    assert db.session.get(Product, product.id).stock_quantity == 8
+
+
+def test_checkout_rejects_invalid_forms(app, client):
+    store = make_store(make_user(), phone='0615000000')
+    fill_cart(client, store, make_product(store))
+
+    response = checkout(client, store, notes='x' * 1001)
+
+    assert response.location.endswith(f'/store/{store.slug}/cart')
+    assert Order.query.count() == 0
+
+
+def test_checkout_requires_a_csrf_token(app, client):
+    app.config['WTF_CSRF_ENABLED'] = True
+    store = make_store(make_user(), phone='0615000000')
+    fill_cart(client, store, make_product(store))
+
+    response = checkout(client, store)
+
+    assert response.location.endswith(f'/store/{store.slug}/cart')
+    assert Order.query.count() == 0
+
+
+def test_checkout_is_rate_limited_per_ip(app, client):
+    store = make_store(make_user(), phone='0615000000')
+    product = make_product(store, stock_quantity=100)
+
+    locations = []
+    for _ in range(6):
+        fill_cart(client, store, product, quantity=1)
+        locations.append(checkout(client, store).location)
+
+    assert all(location.startswith('https://wa.me/') for location in locations[:5])
+    assert locations[5].endswith(f'/store/{store.slug}/cart')
+    assert Order.query.count() == 5
+
+
+def test_unconfirmed_whatsapp_orders_expire_and_restock(app, client):
+    store = make_store(make_user(), phone='0615000000')
+    product = make_product(store, stock_quantity=10)
+    for _ in range(2):
+        fill_cart(client, store, product)
+        checkout(client, store)
+    stale, fresh = Order.query.order_by(Order.id).all()
+    stale.created_at = datetime.utcnow() - timedelta(hours=49)
+    db.session.commit()
+
+    assert expire_whatsapp_orders(db, hours=48) == 1
+
+    db.session.expire_all()
+    assert db.session.get(Order, stale.id).status == 'cancelled'
+    assert db.session.get(Order, fresh.id).status == 'pending'
+    assert db.session.get(Product, product.id).stock_quantity == 8
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import quote
+import re
+
+from rates import format_money
+
+# WhatsApp deep links (https://wa.me/<number>?text=<message>). The fixed
+# parts of each store's message (greeting, store link, sign-off) are
+# URL-encoded once per store version and cached; a click only encodes the
+# order lines. Single-product links are cached whole.
+
+WA_BASE_URL = 'https://wa.me/'
+NEWLINE = quote('\n')
+
+TEMPLATE_CACHE_SIZE = 2000
+LINK_CACHE_SIZE = 10000
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return value
+
+
+_templates = LRUCache(TEMPLATE_CACHE_SIZE)
+_product_links = LRUCache(LINK_CACHE_SIZE)
+
+
+def normalize_phone(phone, country_code):
+    """Digits-only international number as wa.me expects, or None"""
+    digits = re.sub(r'\D', '', phone or '')
+    if not digits:
+        return None
+    if digits.startswith('00'):
+        return digits[2:]
+    if digits.startswith('0') and country_code:
+        # Local format such as 063 xxx xxxx
+        return country_code + digits[1:]
+    return digits
+
+
+def encode(text):
+    return quote(text, safe='')
+
+
+class MessageTemplate:
+    """Pre-encoded fixed parts of one store's order messages"""
+
+    __slots__ = ('base_url', 'greeting', 'footer')
+
+    def __init__(self, store, store_url, country_code):
+        phone = normalize_phone(store.phone, country_code)
+        # Without a usable number wa.me lets the customer pick the chat
+        self.base_url = f'{WA_BASE_URL}{phone}?text=' if phone else f'{WA_BASE_URL}?text='
+        self.greeting = encode(f"Hi {store.name}! I'd like to order:")
+        self.footer = encode(f'Store: {store.name}') + NEWLINE + encode(f'Store URL: {store_url}')
+
+    def link(self, lines):
+        body = NEWLINE.join(encode(line) for line in lines)
+        return (self.base_url + self.greeting + NEWLINE + NEWLINE + body
+                + NEWLINE + NEWLINE + self.footer)
+
+
+def message_template(store, store_url, country_code):
+    key = (store.id, store.version, store_url)
+    template = _templates.get(key)
+    if template is None:
+        template = _templates.set(key, MessageTemplate(store, store_url, country_code))
+    return template
+
+
+def product_link(store, product, price_minor, currency, store_url, country_code):
+    """Link for asking about one product, without creating an order"""
+    key = (store.id, store.version, store_url, product.id, product.name, price_minor, currency)
+    link = _product_links.get(key)
+    if link is None:
+        template = message_template(store, store_url, country_code)
+        link = _product_links.set(key, template.link([
+            product.name,
+            f'Price: {format_money(price_minor, currency)}',
+        ]))
+    return link
+
+
+def order_link(store, order, items, store_url, country_code):
+    """Link carrying a placed order; items are the dicts passed to place_order"""
+    template = message_template(store, store_url, country_code)
+    lines = [f"{item['quantity']} x {item['product'].name} - "
+             f"{format_money(item['total_minor'], order.currency)}" for item in items]
+    lines += ['', f'Total: {format_money(order.total_minor, order.currency)}',
+              f'Order number: {order.order_number}']
+    if order.shipping_address:
+        lines.append(f'Deliver to: {order.shipping_address}')
+    if order.notes:
+        lines.append(f'Notes: {order.notes}')
+    return template.link(lines)
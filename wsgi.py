@@ -4,10 +4,9 @@ WSGI entry point for Take App
 This file is used by Gunicorn to start the Flask application
 """
 
-from app import create_app
-
-# Create the Flask application instance
-app = create_app()
+# app.py builds the application once; a second create_app() would register
+# the session event hooks twice
+from app import app
 
 if __name__ == '__main__':
     app.run() 
\ No newline at end of file